@@ -0,0 +1,142 @@
+import re
+
+#Spelled out words and their abbreviation, both spellings normalize to the abbreviation
+ABBREVIATIONS = {
+    "NORTH": "N", "SOUTH": "S", "EAST": "E", "WEST": "W",
+    "STREET": "ST", "AVENUE": "AVE", "AV": "AVE", "BOULEVARD": "BLVD", "ROAD": "RD",
+    "DRIVE": "DR", "LANE": "LN", "COURT": "CT", "PLACE": "PL", "CIRCLE": "CIR",
+    "PARKWAY": "PKWY", "HIGHWAY": "HWY", "TERRACE": "TER", "SQUARE": "SQ",
+}
+#Words that start a unit number, "Suite 104" and "Apt 104" normalize to "#104"
+UNIT_WORDS = {"SUITE", "STE", "APT", "APARTMENT", "UNIT"}
+
+_PUNCTUATION = re.compile(r"[.,;]")
+_ZIP = re.compile(r"^(\d{5})(?:-\d{4})?$")
+
+
+def normalize_street(street):
+    """
+    Normalizes the street part of an address for matching: upper case, single spaces,
+    no periods or commas, abbreviated directions and street types, "#N" unit numbers.
+    """
+    words = _PUNCTUATION.sub(" ", street).upper().split()
+    normalized = []
+    position = 0
+    while position < len(words):
+        word = words[position]
+        if word in UNIT_WORDS and position + 1 < len(words):
+            normalized.append("#" + words[position + 1].lstrip("#"))
+            position += 2
+            continue
+        if word == "#" and position + 1 < len(words):
+            word = "#" + words[position + 1]
+            position += 1
+        normalized.append(ABBREVIATIONS.get(word, word))
+        position += 1
+    return " ".join(normalized)
+
+
+def normalize_zip(zip_code):
+    """
+    Returns the five digit zip code, or None when zip_code is not a zip code.
+    """
+    match = _ZIP.match(str(zip_code or "").strip())
+    return match.group(1) if match else None
+
+
+class AddressMap(dict):
+    """
+    Address string -> distance matrix index, with normalized matching for everything else.
+
+    As a dictionary it holds the exact full and short address of every location, like the
+    plain address matrix it replaces. get() and resolve() fall back to normalized matching,
+    so "3575 W Valley Central Station bus Loop" and "5100 S 2700 W" find their locations.
+    When the same street appears under several zip codes the zip code picks the location,
+    and a street that is still ambiguous does not match. Every resolution is cached, and
+    addresses that match no location are collected in unmatched instead of silently
+    becoming the hub.
+
+    index_of(package) resolves a package once and keeps the index on the package, so
+    routing code only reads an integer.
+    """
+    def __init__(self, addresses):
+        """
+        :param addresses: List of full addresses "street, city, state, zip" in index order.
+        """
+        super().__init__()
+        #Normalized street -> indexes, and (normalized street, zip) -> index
+        self._streets = {}
+        self._street_zips = {}
+        for index, full_address in enumerate(addresses):
+            parts = [part.strip() for part in full_address.split(",")]
+            self[parts[0]] = index
+            self[full_address] = index
+            street = normalize_street(parts[0])
+            self._streets.setdefault(street, []).append(index)
+            zip_code = normalize_zip(parts[-1]) if len(parts) > 1 else None
+            if zip_code is not None:
+                self._street_zips.setdefault((street, zip_code), index)
+        #(address, zip code) -> index or None, for every address resolved so far
+        self._resolved = {}
+        #Unmatched address -> ids of the packages going there
+        self.unmatched = {}
+
+    def resolve(self, address, zip_code=None):
+        """
+        Returns the index of the address, or None when it matches no single location.
+        """
+        key = (address, zip_code)
+        if key in self._resolved:
+            return self._resolved[key]
+        index = dict.get(self, address)
+        if index is None:
+            street = normalize_street(address.split(",")[0])
+            zip_code = normalize_zip(zip_code)
+            index = self._street_zips.get((street, zip_code)) if zip_code is not None else None
+            if index is None:
+                indexes = self._streets.get(street, ())
+                index = indexes[0] if len(indexes) == 1 else None
+        self._resolved[key] = index
+        return index
+
+    def get(self, address, default=None):
+        """
+        Returns the index of the address, or default when it matches no location.
+        """
+        index = self.resolve(address)
+        if index is None:
+            self.unmatched.setdefault(address, [])
+            return default
+        return index
+
+    def index_of(self, package, default=None):
+        """
+        Returns the index of the package's address, resolved once and kept on the package.
+        Unmatched packages get default and are recorded in unmatched.
+        """
+        if package.location_index is not None:
+            return package.location_index
+        index = self.resolve(package.address, package.zip_code)
+        if index is None:
+            package_ids = self.unmatched.setdefault(package.address, [])
+            if package.package_id not in package_ids:
+                package_ids.append(package.package_id)
+            return default
+        package.location_index = index
+        return index
+
+    def resolve_packages(self, packages):
+        """
+        Resolves every package up front, such as right after loading the manifest.
+        :return: Ids of the packages whose address matched no location.
+        """
+        return [package.package_id for package in packages if self.index_of(package) is None]
+
+    def unmatched_report(self):
+        """
+        Returns one line per unmatched address with the packages going there.
+        """
+        return [
+            f"Unmatched address {address!r}" + (f" for packages {package_ids}" if package_ids else "")
+            for address, package_ids in self.unmatched.items()
+        ]
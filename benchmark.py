@@ -0,0 +1,275 @@
+"""
+Benchmark harness for the routing and simulation hot paths.
+
+For each size a seeded synthetic city is written in the same CSV formats as the WGUPS files,
+then every stage is timed on it in a fresh worker process so peak memory is measured per size.
+Cities above CSV_STOP_LIMIT get only a package CSV and are routed on distances computed
+from their coordinates, the stages that need a distance CSV are reported as skipped.
+Results are written to JSON and compared against a stored baseline, any stage slower than
+the baseline by more than the tolerance is reported as a regression.
+
+    python benchmark.py --sizes 100 1000 5000 --output bench.json
+    python benchmark.py --sizes 100 1000 --save-baseline
+    python benchmark.py --sizes 100 1000 --baseline benchmark_baseline.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+#Default sizes, in stops, and the baseline file next to this script
+DEFAULT_SIZES = (100, 1000, 5000)
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+#Above this many stops the nested list matrix stages are skipped, at 5000 stops the
+#nested lists already take about 400 MB
+LIST_MATRIX_LIMIT = 5000
+#Above this many stops no distance CSV is written, writing and parsing one grows with the
+#square of the stops, so the routing stages run on distances computed from the coordinates
+CSV_STOP_LIMIT = 5000
+#Packages generated per stop and packages loaded on each simulated truck
+PACKAGES_PER_STOP = 2
+PACKAGES_PER_TRUCK = 100
+
+
+def _peak_memory_mb():
+    """
+    Returns the peak resident memory of this process in megabytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _run_size(stop_count, seed, work_dir):
+    """
+    Times every stage for one city size. Runs in its own worker process.
+    :return: Dictionary with per stage timings, total wall time and peak memory.
+    """
+    from csvDistanceFileReader import load_distance_data, load_distance_matrix, make_square_matrix
+    from csvPackageFileReader import load_packages
+    from deliveryLogic import deliver_packages, nearest_neighbor_algorithm
+    from distanceProvider import load_distance_provider, load_triangle_distances
+    from neighborIndex import build_neighbor_index, load_neighbor_index
+    from syntheticCity import generate_city, write_distance_csv, write_package_csv
+    from truckClass import Truck
+
+    stages = {}
+    skipped = []
+
+    def timed(name, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        stages[name] = time.perf_counter() - start
+        return result
+
+    def write_files():
+        addresses, points = generate_city(stop_count, seed)
+        if stop_count <= CSV_STOP_LIMIT:
+            write_distance_csv(distance_file, addresses, points)
+        write_package_csv(package_file, addresses, package_count, seed)
+        return addresses, points
+
+    distance_file = os.path.join(work_dir, f"distances-{stop_count}.csv")
+    package_file = os.path.join(work_dir, f"packages-{stop_count}.csv")
+    package_count = stop_count * PACKAGES_PER_STOP
+    city_addresses, city_points = timed("generate_city", write_files)
+
+    run_start = time.perf_counter()
+    cache_dir = os.path.join(work_dir, "cache")
+    if stop_count <= CSV_STOP_LIMIT:
+        if stop_count <= LIST_MATRIX_LIMIT:
+            triangular_matrix, _, _ = timed("load_distance_data", load_distance_data, distance_file)
+            timed("make_square_matrix", make_square_matrix, triangular_matrix)
+            del triangular_matrix
+        else:
+            skipped.extend(["load_distance_data", "make_square_matrix"])
+        timed("load_distance_matrix_cold", load_distance_matrix, distance_file, cache_dir)
+        distance_matrix, addresses, address_map = timed(
+            "load_distance_matrix_warm", load_distance_matrix, distance_file, cache_dir
+        )
+    else:
+        #No distance CSV is written for large cities, distances come from the coordinates
+        skipped.extend([
+            "load_distance_data", "make_square_matrix", "load_distance_matrix_cold", "load_distance_matrix_warm",
+        ])
+        distance_matrix, addresses, address_map = timed(
+            "load_coordinate_distances", load_distance_provider,
+            points=city_points, addresses=city_addresses, kind="coordinates",
+        )
+    del city_addresses, city_points
+
+    package_table = timed("load_packages", load_packages, package_file)
+    package_ids = list(range(1, package_count + 1))
+    timed("hash_table_lookup", lambda: [package_table.lookup(package_id) for package_id in package_ids])
+
+    if stop_count <= CSV_STOP_LIMIT:
+        timed("nearest_neighbor_algorithm", nearest_neighbor_algorithm, distance_matrix, list(range(stop_count)))
+        timed("load_neighbor_index_cold", load_neighbor_index, distance_file, distance_matrix, cache_dir=cache_dir)
+        neighbor_index = timed(
+            "load_neighbor_index_warm", load_neighbor_index, distance_file, distance_matrix, cache_dir=cache_dir
+        )
+    else:
+        #A full tour scans every stop per step in Python on a computed provider, and the
+        #index caches are keyed by the distance CSV
+        skipped.extend(["nearest_neighbor_algorithm", "load_neighbor_index_cold", "load_neighbor_index_warm"])
+        neighbor_index = timed("build_neighbor_index", build_neighbor_index, distance_matrix)
+
+    start_time = datetime(1900, 1, 1, 8)
+
+    def make_trucks():
+        return [
+            Truck(number + 1, package_ids[offset:offset + PACKAGES_PER_TRUCK], start_time)
+            for number, offset in enumerate(range(0, package_count, PACKAGES_PER_TRUCK))
+        ]
+
+    trucks = make_trucks()
+    timed(
+        "deliver_packages",
+        lambda: [deliver_packages(truck, distance_matrix, package_table, address_map, addresses) for truck in trucks],
+    )
+    indexed_trucks = make_trucks()
+    timed(
+        "deliver_packages_indexed",
+        lambda: [
+            deliver_packages(truck, distance_matrix, package_table, address_map, addresses, neighbor_index=neighbor_index)
+            for truck in indexed_trucks
+        ],
+    )
+    if stop_count <= CSV_STOP_LIMIT:
+        triangle, _, _ = timed("load_triangle_distances", load_triangle_distances, distance_file, cache_dir)
+        triangle_trucks = make_trucks()
+        timed(
+            "deliver_packages_triangle",
+            lambda: [
+                deliver_packages(truck, triangle, package_table, address_map, addresses) for truck in triangle_trucks
+            ],
+        )
+    else:
+        skipped.extend(["load_triangle_distances", "deliver_packages_triangle"])
+
+    return {
+        "stops": stop_count,
+        "packages": package_count,
+        "stages": stages,
+        "skipped": skipped,
+        "wall_time": time.perf_counter() - run_start,
+        "peak_memory_mb": _peak_memory_mb(),
+    }
+
+
+def run_benchmarks(sizes, seed=0, work_dir=None):
+    """
+    Runs the benchmark for each size in a fresh process and returns the results dictionary.
+    :param work_dir: Folder for the generated CSV files, a temporary folder by default.
+    """
+    own_work_dir = work_dir is None
+    if own_work_dir:
+        work_dir = tempfile.mkdtemp(prefix="routing-benchmark-")
+    results = {}
+    try:
+        for stop_count in sizes:
+            with multiprocessing.get_context("spawn").Pool(1) as pool:
+                results[str(stop_count)] = pool.apply(_run_size, (stop_count, seed, work_dir))
+    finally:
+        if own_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "seed": seed,
+        "results": results,
+    }
+
+
+def compare_to_baseline(report, baseline, tolerance=0.25, noise_floor=0.005):
+    """
+    Compares every stage, wall time and peak memory against the baseline report.
+    :param tolerance: Allowed slowdown as a fraction, 0.25 flags anything 25% slower.
+    :param noise_floor: Timings have to grow by at least this many seconds to count, so
+        stages that take a few milliseconds do not flag on timer noise.
+    :return: List of (size, metric, baseline value, current value) regressions.
+    """
+    regressions = []
+    for size, result in report["results"].items():
+        baseline_result = baseline.get("results", {}).get(size)
+        if baseline_result is None:
+            continue
+        metrics = dict(result["stages"])
+        metrics["wall_time"] = result["wall_time"]
+        metrics["peak_memory_mb"] = result["peak_memory_mb"]
+        baseline_metrics = dict(baseline_result["stages"])
+        baseline_metrics["wall_time"] = baseline_result["wall_time"]
+        baseline_metrics["peak_memory_mb"] = baseline_result["peak_memory_mb"]
+        for metric, value in metrics.items():
+            if metric == "generate_city":
+                continue
+            baseline_value = baseline_metrics.get(metric)
+            if not baseline_value or value <= baseline_value * (1 + tolerance):
+                continue
+            if metric != "peak_memory_mb" and value - baseline_value < noise_floor:
+                continue
+            regressions.append((size, metric, baseline_value, value))
+    return regressions
+
+
+def _print_report(report):
+    """
+    Prints one table per size with each stage's time.
+    """
+    for size, result in report["results"].items():
+        print(f"{size} stops, {result['packages']} packages")
+        for stage, seconds in result["stages"].items():
+            print(f"  {stage:<28}{seconds:>10.4f} s")
+        for stage in result["skipped"]:
+            print(f"  {stage:<28}{'skipped':>10}")
+        print(f"  {'wall_time':<28}{result['wall_time']:>10.4f} s")
+        print(f"  {'peak_memory_mb':<28}{result['peak_memory_mb']:>10.1f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the routing and simulation hot paths.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="City sizes in stops.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic city generator.")
+    parser.add_argument("--output", help="Write the results JSON to this file.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON to compare against.")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before a regression.")
+    parser.add_argument("--work-dir", help="Keep the generated CSV files in this folder.")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.sizes, args.seed, args.work_dir)
+    _print_report(report)
+
+    if args.output:
+        with open(args.output, mode='w', encoding='utf-8') as output_file:
+            json.dump(report, output_file, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, mode='w', encoding='utf-8') as baseline_file:
+            json.dump(report, baseline_file, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to store one")
+        return 0
+    with open(args.baseline, mode='r', encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = compare_to_baseline(report, baseline, args.tolerance)
+    for size, metric, baseline_value, value in regressions:
+        print(f"REGRESSION {size} stops {metric}: {baseline_value:.4f} -> {value:.4f}")
+    if not regressions:
+        print("No regressions against the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
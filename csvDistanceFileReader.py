@@ -1,5 +1,22 @@
 import csv
+import hashlib
+import json
+import os
+import tempfile
 
+import instrumentation
+from addressResolver import AddressMap
+
+#NumPy is optional, without it the nested list matrix is used
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#Folder, next to the distance CSV, that holds the binary matrix caches
+CACHE_DIR_NAME = ".distance_cache"
+
+@instrumentation.timed("load_distance_data")
 def load_distance_data(csv_file_path):
     """
     Loads the distance data from the csv file and builds  1. Distance matrix which represents
@@ -15,28 +32,28 @@ def load_distance_data(csv_file_path):
         distance_matrix = []
         #List of full address strings ordered by index
         addresses = []
-        #Map for address strings to index
-        address_matrix = {}
 
         #Each row of the CSV corresponds to one address and its distances
         for csv_row in csv_distance_reader:
             #Removes and reads the first column as the full address
             full_address = csv_row.pop(0).strip()
 
-            #Gets just the address part that we need before the first comma
-            clean_address = full_address.split(",")[0].strip()
-
             #Adds the full address to list
             addresses.append(full_address)
             #remaning cells converted to floats and ignores empty strings
             row_floats = [float(value) for value in csv_row if value != '']
             distance_matrix.append(row_floats)
 
-            #store both the cleaned address and full address versions in the lookup map
-            address_matrix[clean_address] = len(addresses) - 1
-            address_matrix[full_address] = len(addresses) - 1
+    #Maps both the cleaned address and full address versions, and normalized addresses, to the index
+    return distance_matrix, addresses, build_address_map(addresses)
 
-    return distance_matrix, addresses, address_matrix
+def build_address_map(addresses):
+    """
+    Builds the address matrix dictionary from the list of full addresses, mapping both
+    the full address and the short address before the first comma to its index. It is an
+    addressResolver.AddressMap, so other spellings of an address resolve by normalized match.
+    """
+    return AddressMap(addresses)
 
 def make_square_matrix(triangular_matrix):
     """
@@ -55,6 +72,130 @@ def make_square_matrix(triangular_matrix):
     #Retruns a square matrix
     return triangular_matrix
 
+def _count_lines(csv_file_path):
+    """
+    Returns the number of lines in the file, a last line without a newline included.
+    """
+    count = 0
+    last = b"\n"
+    with open(csv_file_path, mode='rb') as csv_file:
+        for chunk in iter(lambda: csv_file.read(1 << 20), b''):
+            count += chunk.count(b"\n")
+            last = chunk[-1:]
+    return count + (last != b"\n")
+
+def _read_square_array(csv_file_path, dtype="float32"):
+    """
+    Reads the distance CSV straight into a dense square NumPy matrix. The matrix is sized
+    from the line count up front and row i and its mirror column are filled as each row is
+    parsed, so no list of every value is built on the way.
+    :return: List of addresses and the size x size matrix where matrix[i][j] equals matrix[j][i].
+    """
+    capacity = _count_lines(csv_file_path)
+    square = np.zeros((capacity, capacity), dtype=dtype)
+    addresses = []
+    with open(csv_file_path, mode='r', newline='', encoding='utf-8-sig') as csv_file:
+        for csv_row in csv.reader(csv_file, delimiter=','):
+            location = len(addresses)
+            addresses.append(csv_row[0].strip())
+            values = [value for value in csv_row[1:] if value != '']
+            if len(values) != location + 1:
+                raise ValueError(
+                    f"Distance file row {location} has {len(values)} values, expected {location + 1}"
+                )
+            if location == capacity:
+                #Lines ending in a lone carriage return were not counted, grows the matrix
+                capacity = max(capacity * 2, location + 1)
+                grown = np.zeros((capacity, capacity), dtype=dtype)
+                grown[:location, :location] = square[:location, :location]
+                square = grown
+            row = np.array(values, dtype=dtype)
+            square[location, :location + 1] = row
+            square[:location + 1, location] = row
+    size = len(addresses)
+    #Blank lines and addresses quoted across lines leave rows unused
+    if size != capacity:
+        square = np.ascontiguousarray(square[:size, :size])
+    return addresses, square
+
+def _temp_path(path):
+    """
+    Returns a new empty temp file next to path, unique to this call, so runs writing the
+    same cache at once never write into each other's file.
+    """
+    directory, name = os.path.split(path)
+    handle, temp_path = tempfile.mkstemp(prefix=name + ".", suffix=".tmp", dir=directory)
+    os.close(handle)
+    return temp_path
+
+def _file_hash(csv_file_path):
+    """
+    Returns the sha256 hex digest of the file contents, used to key the matrix cache.
+    """
+    digest = hashlib.sha256()
+    with open(csv_file_path, mode='rb') as csv_file:
+        for chunk in iter(lambda: csv_file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def distance_cache_paths(csv_file_path, cache_dir=None, dtype="float32"):
+    """
+    Returns the (matrix .npy path, address .json path) of the cache for the given CSV.
+    The file names hold the CSV hash so an edited CSV never reuses an old cache.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(csv_file_path)), CACHE_DIR_NAME)
+    stem = os.path.splitext(os.path.basename(csv_file_path))[0]
+    dtype_name = np.dtype(dtype).name if np is not None else str(dtype)
+    key = f"{stem}-{_file_hash(csv_file_path)[:16]}-{dtype_name}"
+    return os.path.join(cache_dir, key + ".npy"), os.path.join(cache_dir, key + ".addresses.json")
+
+@instrumentation.timed("load_distance_matrix")
+def load_distance_matrix(csv_file_path, cache_dir=None, dtype="float32", use_cache=True):
+    """
+    Loads the square distance matrix, addresses and address matrix for a distance CSV.
+
+    On a cold start the CSV is parsed once, the dense NumPy matrix is built and saved
+    as a .npy cache with the address list beside it. On a warm start the cache is memory
+    mapped read only, so the matrix is a zero copy view of the file and the CSV is never parsed.
+    Without NumPy this falls back to load_distance_data and make_square_matrix.
+
+    :param csv_file_path: Filepath to the triangular distance CSV.
+    :param cache_dir: Folder for the cache files, defaults to .distance_cache next to the CSV.
+    :param dtype: NumPy dtype of the matrix, float32 by default to halve memory.
+    :param use_cache: Set to False to always parse the CSV and skip writing a cache.
+    :return: distance matrix, list of addresses and the address matrix dictionary.
+    """
+    if np is None:
+        distance_matrix, addresses, address_matrix = load_distance_data(csv_file_path)
+        return make_square_matrix(distance_matrix), addresses, address_matrix
+
+    if use_cache:
+        matrix_path, addresses_path = distance_cache_paths(csv_file_path, cache_dir, dtype)
+        #Warm start, memory maps the cached matrix
+        if os.path.exists(matrix_path) and os.path.exists(addresses_path):
+            with open(addresses_path, mode='r', encoding='utf-8') as addresses_file:
+                addresses = json.load(addresses_file)
+            distance_matrix = np.load(matrix_path, mmap_mode='r')
+            return distance_matrix, addresses, build_address_map(addresses)
 
+    #Cold start, parses the CSV straight into the matrix
+    addresses, distance_matrix = _read_square_array(csv_file_path, dtype)
 
+    if use_cache:
+        os.makedirs(os.path.dirname(matrix_path), exist_ok=True)
+        #Writes to temp files first so a crashed run never leaves half a cache behind
+        matrix_temp, addresses_temp = _temp_path(matrix_path), _temp_path(addresses_path)
+        try:
+            with open(matrix_temp, mode='wb') as matrix_file:
+                np.save(matrix_file, distance_matrix)
+            with open(addresses_temp, mode='w', encoding='utf-8') as addresses_file:
+                json.dump(addresses, addresses_file)
+            os.replace(addresses_temp, addresses_path)
+            os.replace(matrix_temp, matrix_path)
+        finally:
+            for temp_path in (matrix_temp, addresses_temp):
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
 
+    return distance_matrix, addresses, build_address_map(addresses)
@@ -1,38 +1,38 @@
 import csv
+import instrumentation
 from packageClass import Package
 from hashTable import HashTable
 
 #path to the CSV file holding package information
 csv_package_file = "wgupsPackageFile.csv"
 
+#Number of packages per batch yielded by iter_package_batches
+DEFAULT_BATCH_SIZE = 10000
 
-def load_packages(csv_package_file):
+
+def iter_package_batches(csv_package_file, batch_size=DEFAULT_BATCH_SIZE):
     """
-    Loads the package info from a csv file into our custom hash table.
+    Streams the package csv file in batches of Package objects.
 
     :param csv_package_file: Filepath to the csv package file.
+    :param batch_size: Maximum number of packages per batch.
 
-    First we create an empty hash table and store packages by the package id.
-    We then open the CSV file and create a CSV reader making sure to skip the
-    first row. After that we build a package object from the row fields. Insert the
-    package data into the hash table using the package id ad the key. Once all package
-    data is inserted in the hash table we return it.
-    :return: We return a hashtable where each key is a package id and each value is a
-    package object.
+    The file is read one row at a time and only the current batch is held in memory,
+    so a manifest of any size can be processed with a bounded footprint. Each Package
+    parses its deadline into minutes and its note into PackageConstraints when it is
+    built, so nothing downstream has to match note strings.
+    :return: Yields lists of at most batch_size Package objects in file order.
     """
-    #Initilaizes an empty hash table to store all package objects
-    package_table = HashTable()
-
     #Opens the CSV file for reading, the encoding handles leading char causing issues.
-    with open (csv_package_file, mode='r', newline='', encoding='utf-8-sig') as csvfile:
+    with open(csv_package_file, mode='r', newline='', encoding='utf-8-sig') as csvfile:
         csv_package_reader = csv.reader(csvfile, delimiter=',')
 
         #This will skip the header row
         next(csv_package_reader)
+        batch = []
         #Each row in the CSV reps a single package
         for row in csv_package_reader:
-            #Creates a Package object using the CSV columns
-            package_data = Package(
+            batch.append(Package(
                 package_id=int(row[0]),
                 address=row[1],
                 city=row[2],
@@ -42,14 +42,57 @@ def load_packages(csv_package_file):
                 weight=row[6],
                 #Handles for cases when the package has no note data to it
                 note=row[7] if len(row) > 7 else "",
-            )
+            ))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
 
-            #Inserts the package info into the hash table using its ID as the key
-            package_table.insert(package_data.package_id, package_data)
 
-    return package_table
+@instrumentation.timed("load_packages")
+def load_packages(csv_package_file, package_store=None):
+    """
+    Loads the package info from a csv file into our custom hash table.
 
+    :param csv_package_file: Filepath to the csv package file.
+    :param package_store: Optional PackageStore, when given each row is appended to the
+        columnar store instead of building Package objects, and the store is returned.
 
+    First we create an empty hash table and store packages by the package id.
+    We then stream the CSV file in batches with iter_package_batches, which skips the
+    header row and builds a package object from the row fields. Each batch is inserted
+    into the hash table using the package id as the key with one bulk insert.
+    Once all package data is inserted in the hash table we return it.
+    :return: We return a hashtable where each key is a package id and each value is a
+    package object.
+    """
+    if package_store is not None:
+        return _load_package_store(csv_package_file, package_store)
+
+    #Initilaizes an empty hash table to store all package objects
+    package_table = HashTable()
 
+    for batch in iter_package_batches(csv_package_file):
+        #Inserts the package info into the hash table using its ID as the key
+        package_table.bulk_insert((package.package_id, package) for package in batch)
 
+    return package_table
+
+
+def _load_package_store(csv_package_file, package_store):
+    """
+    Appends every package row of the csv file straight into the columnar package store.
+    """
+    with open(csv_package_file, mode='r', newline='', encoding='utf-8-sig') as csvfile:
+        csv_package_reader = csv.reader(csvfile, delimiter=',')
+
+        #This will skip the header row
+        next(csv_package_reader)
+        for row in csv_package_reader:
+            package_store.append(
+                int(row[0]), row[1], row[2], row[3], row[4], row[5], row[6],
+                row[7] if len(row) > 7 else "",
+            )
 
+    return package_store
@@ -0,0 +1,173 @@
+import math
+from datetime import datetime, timedelta
+
+from packageClass import EOD_MINUTES
+from truckClass import CLOCK_TICKS_PER_SECOND
+
+
+def truck_seconds(truck):
+    """
+    Returns the truck's current time as seconds since midnight, read straight from the
+    clock on the integer clock.
+    """
+    if truck.clock is not None:
+        return truck.clock / CLOCK_TICKS_PER_SECOND
+    time = truck.current_time
+    return time.hour * 3600 + time.minute * 60 + time.second + time.microsecond / 1e6
+
+
+class DeadlineSelector:
+    """
+    Deadline aware next stop selection for one truck's route.
+
+    Routing stays nearest stop first, but a stop is only taken when a cheap lower bound
+    check says every deadline that can still be met stays possible: after arriving at the
+    candidate, each deadline stop has to be reachable by driving straight to it. The check
+    only rules out orders that are certain to miss a deadline, it does not prove that the
+    order taken meets them all. If no stop passes, the reachable deadline stop with the
+    least slack goes first.
+
+    Deadlines are parsed once into seconds since midnight, a stop's deadline being the
+    earliest of its packages, and EOD stops never constrain the route. Every pending stop
+    keeps its slack as the latest time the truck may arrive there and still reach each
+    deadline stop directly, with the deadline stop that sets it:
+        latest[c] = min over deadline stops s != c of deadline[s] - drive(c, s)
+    The value does not depend on where the truck is, so a candidate is checked with one
+    comparison, arrival <= latest[c]. It only changes when a deadline stop leaves the
+    check, delivered or out of reach, and then only the stops it was binding are scored
+    again. Deadlines already out of reach are left out of the check, so they do not push
+    the truck into missing others too.
+    """
+    def __init__(self, distance_matrix, speed, stop_packages, stop_order, packages):
+        """
+        :param distance_matrix: Matrix of the distances between the address indices.
+        :param speed: Truck speed in miles per hour.
+        :param stop_packages: The route's dictionary of address index -> package ids still
+            to deliver, read as stops are added and removed.
+        :param stop_order: Address index -> tie break position, lowest wins.
+        :param packages: Dictionary of package id -> Package for the packages on the truck.
+        """
+        self.distance_matrix = distance_matrix
+        self.seconds_per_mile = 3600 / speed
+        self.stop_packages = stop_packages
+        self.stop_order = stop_order
+        self.packages = packages
+        #Number of selections where the nearest stop was pruned
+        self.pruned = 0
+        #Number of times a stop's slack was scored
+        self.scored = 0
+        self.refresh()
+
+    def refresh(self):
+        """
+        Rebuilds the deadlines and every stop's slack from the stops, call it after stops
+        are added or packages moved between stops.
+        """
+        deadlines = {}
+        for index, package_ids in self.stop_packages.items():
+            deadline = min(self.packages[package_id].deadline_minutes for package_id in package_ids)
+            if deadline < EOD_MINUTES:
+                deadlines[index] = deadline * 60
+        #Deadline stops still in the check
+        self.deadlines = deadlines
+        #Stop -> (latest arrival, deadline stop setting it or None)
+        self.latest = {}
+        #Deadline stop -> stops whose latest arrival it sets
+        self.binding = {index: set() for index in deadlines}
+        for index in self.stop_packages:
+            self._score(index)
+
+    def _score(self, index):
+        """
+        Scores the latest arrival of one stop against the deadline stops in the check.
+        """
+        self.scored += 1
+        row = self.distance_matrix[index]
+        seconds_per_mile = self.seconds_per_mile
+        latest, bound_by = math.inf, None
+        for other, deadline in self.deadlines.items():
+            if other != index:
+                arrival_limit = deadline - float(row[other]) * seconds_per_mile
+                if arrival_limit < latest:
+                    latest, bound_by = arrival_limit, other
+        self.latest[index] = (latest, bound_by)
+        if bound_by is not None:
+            self.binding[bound_by].add(index)
+
+    def _drop_deadline(self, index):
+        """
+        Takes a deadline stop out of the check and scores the stops it was binding again.
+        """
+        del self.deadlines[index]
+        for stop in self.binding.pop(index):
+            if stop in self.latest and self.latest[stop][1] == index:
+                self._score(stop)
+
+    def remove_stop(self, index):
+        """
+        Forgets a stop once it has been delivered.
+        """
+        latest = self.latest.pop(index, None)
+        if latest is not None and latest[1] is not None:
+            self.binding[latest[1]].discard(index)
+        if index in self.deadlines:
+            self._drop_deadline(index)
+
+    def next_stop(self, location, now):
+        """
+        Returns the address index of the next stop from location at now, seconds since midnight.
+        """
+        current_row = self.distance_matrix[location]
+        stop_order = self.stop_order
+        seconds_per_mile = self.seconds_per_mile
+
+        #Deadlines that can no longer be met leave the check for good
+        for index, deadline in list(self.deadlines.items()):
+            if now + float(current_row[index]) * seconds_per_mile > deadline:
+                self._drop_deadline(index)
+
+        nearest = min(self.stop_packages, key=lambda index: (current_row[index], stop_order[index]))
+        if not self.deadlines:
+            return nearest
+        latest = self.latest
+        feasible = [
+            index for index in self.stop_packages
+            if now + float(current_row[index]) * seconds_per_mile <= latest[index][0]
+        ]
+        if feasible:
+            choice = min(feasible, key=lambda index: (current_row[index], stop_order[index]))
+            if choice != nearest:
+                self.pruned += 1
+            return choice
+
+        #No stop keeps every deadline, the deadline stop with the least slack goes first
+        self.pruned += 1
+        return min(
+            self.deadlines,
+            key=lambda index: (self.deadlines[index] - now - float(current_row[index]) * seconds_per_mile,
+                               stop_order[index]),
+        )
+
+
+def late_reachable_packages(simulation):
+    """
+    Returns the ids of packages delivered after their deadline although the truck carrying
+    them could have made it by driving straight to them when it left the hub. Packages no
+    route could deliver on time are not counted, so on a day routed well this is empty.
+    """
+    late = []
+    for state in simulation.truck_states:
+        if state.depart_time is None:
+            continue
+        depart = simulation._to_datetime(state.depart_time)
+        hub_row = simulation.distance_matrix[simulation.hub_index]
+        midnight = datetime.combine(depart.date(), datetime.min.time())
+        for package_id, package in state.packages.items():
+            if package.deadline_minutes >= EOD_MINUTES or package.delivery_time is None:
+                continue
+            deadline = midnight + timedelta(minutes=package.deadline_minutes)
+            location = simulation.address_map.index_of(package)
+            direct = depart + timedelta(hours=float(hub_row[location]) / state.truck.speed)
+            if package.delivery_time > deadline and direct <= deadline:
+                late.append(package_id)
+    return sorted(late)
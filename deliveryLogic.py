@@ -1,5 +1,17 @@
-
-def nearest_neighbor_algorithm(distances, package_ids):
+import instrumentation
+from deadlineRouting import DeadlineSelector, truck_seconds
+from distanceProvider import dense_array
+from packageClass import STATUS_NAMES, STATUS_UNMATCHED
+from truckClass import to_clock
+
+#NumPy is optional, without it routes are built with the pure Python loop
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+@instrumentation.timed("nearest_neighbor_algorithm")
+def nearest_neighbor_algorithm(distances, package_ids, neighbor_index=None):
     """
     Calculates a route using a nearest neighbor heuristic based on the distance matrix.
     The algorithm begins at the hub, index 0, and moves to the next nearest
@@ -8,11 +20,22 @@ def nearest_neighbor_algorithm(distances, package_ids):
     the truck returns to the hub.
 
     :param distances: The 2D distance matrix where distances[i][j]
-        is the distance from location i to j.
+        is the distance from location i to j, nested lists, a NumPy array or a
+        distanceProvider.DistanceProvider.
     :param package_ids: List of package ids assigned to the trucks.
+    :param neighbor_index: Optional neighborIndex.NeighborIndex built from distances.
     :return: Returns a list of location indices from route_list and the
         total traveled distance from distance_travelled.
+
+    With a neighbor index the next location comes from walking the sorted neighbor list of
+    the last location. Otherwise when NumPy is available the route is built by
+    nearest_neighbor_routes. Both give the same route as the loop over every location.
     """
+    if neighbor_index is not None:
+        return _indexed_route(distances, package_ids, neighbor_index)
+    matrix = dense_array(distances)
+    if matrix is not None:
+        return nearest_neighbor_routes(matrix, [package_ids])[0]
 
     #Starts the algo at the hub
     routes_list = [0]
@@ -31,10 +54,13 @@ def nearest_neighbor_algorithm(distances, package_ids):
         nearest = None
         min_distance = float("inf")
 
+        #Row of distances from the last location, a view when distances is a NumPy array
+        last_row = distances[last]
+
         #Go through all locations to find the closest unvisited one
         for i in range(len(distances)):
-            if not visited[i] and distances[last][i] < min_distance:
-                min_distance = distances[last][i]
+            if not visited[i] and last_row[i] < min_distance:
+                min_distance = float(last_row[i])
                 nearest = i
 
         #If there are no more reachable unvisited locations then we stop looking
@@ -47,129 +73,258 @@ def nearest_neighbor_algorithm(distances, package_ids):
         distance_travelled += min_distance
 
     #Returns to the hub at the end of the route
-    back_to_hub = distances[routes_list[-1]][0]
+    back_to_hub = float(distances[routes_list[-1]][0])
     distance_travelled += back_to_hub
     routes_list.append(0)
 
     return routes_list, distance_travelled
 
 
-def deliver_packages(truck, distance_matrix, package_table, address_map, addresses):
+def _indexed_route(distances, package_ids, neighbor_index):
+    """
+    nearest_neighbor_algorithm using a neighbor index, ties go to the lowest index.
+    """
+    routes_list = [0]
+    unvisited = set(range(1, len(distances)))
+    search = neighbor_index.search(unvisited)
+    distance_travelled = 0
+    last = 0
+
+    for _ in range(1, len(package_ids)):
+        nearest = search.nearest(last)
+        #If there are no more reachable unvisited locations then we stop looking
+        if nearest is None or float(distances[last][nearest]) == float("inf"):
+            break
+        routes_list.append(nearest)
+        unvisited.discard(nearest)
+        distance_travelled += float(distances[last][nearest])
+        last = nearest
+
+    #Returns to the hub at the end of the route
+    distance_travelled += float(distances[last][0])
+    routes_list.append(0)
+    return routes_list, distance_travelled
+
+
+def nearest_neighbor_routes(distances, package_id_lists):
+    """
+    Builds nearest neighbor routes for many trucks in one call.
+
+    Each truck keeps a mask row that is 0 for unvisited locations and infinity for
+    visited ones. On every step the mask is added to the distance row of the last stop
+    and an argmin picks the next stop, so no Python loop runs over the locations.
+    Ties go to the lowest index, the same as the strict less than check in
+    nearest_neighbor_algorithm, so the routes are identical to the pure Python loop.
+    The distance matrix and working buffers are shared by all trucks in the batch.
+
+    :param distances: The 2D distance matrix, a NumPy array is used without copying.
+    :param package_id_lists: One list of package ids per truck.
+    :return: A list of (route list, distance travelled) tuples in truck order.
+    """
+    matrix = np.asarray(distances)
+    mask = np.empty(len(matrix), dtype=matrix.dtype)
+    masked_row = np.empty(len(matrix), dtype=matrix.dtype)
+
+    results = []
+    for package_ids in package_id_lists:
+        #Starts the truck at the hub with only the hub masked out
+        mask.fill(0)
+        mask[0] = np.inf
+        routes_list = [0]
+        distance_travelled = 0.0
+        last = 0
+
+        #For each package stop we pick the next nearest unvisited location
+        for _ in range(1, len(package_ids)):
+            np.add(matrix[last], mask, out=masked_row)
+            nearest = int(masked_row.argmin())
+            min_distance = float(masked_row[nearest])
+
+            #If there are no more reachable unvisited locations then we stop looking
+            if min_distance == float("inf"):
+                break
+
+            routes_list.append(nearest)
+            mask[nearest] = np.inf
+            distance_travelled += min_distance
+            last = nearest
+
+        #Returns to the hub at the end of the route
+        distance_travelled += float(matrix[last, 0])
+        routes_list.append(0)
+        results.append((routes_list, distance_travelled))
+    return results
+
+
+@instrumentation.timed("deliver_packages")
+def deliver_packages(truck, distance_matrix, package_table, address_map, addresses, planned_route=None,
+                     neighbor_index=None, deadline_aware=False, hub_index=0):
     """
     Simulates  delivering all packages in a truck.
     :param truck: Truck object to track current time, location and mileage
-    :param distance_matrix: Matrix of the distances between the address indices.
+    :param distance_matrix: Matrix of the distances between the address indices, nested
+        lists, a NumPy array such as the memory mapped matrix cache, or a distance provider.
     :param package_table: Hashtable of packages keyed by package id number
     :param address_map: Dictionary that maps address strings to indices in the distance matrix.
     :param addresses: List of addresses in index order.
-
-    The trucks start out as being at the hub. As long as there are packages assigned to the truck
-    we will split up packages into the ones that can be delivered now and those that need to wait due
-    to a "Wrong address" note before 10:20 am. If there's nothing that can be delivered then we can
-    go ahead and skip time to 10:20am. From the current location we will choose
-    the next package whose address is the nearest. All packages will be assigned as
-    "EN Route" once the truck leaves to the hub. The truck will then drive to the chosen
-    address and mark any package for that location as "Delivered". After the last package has been
-    delivered the truck will return back to the hub.
-
+    :param planned_route: Optional list of address indices, such as one from
+        routeImprovement.plan_truck_route, giving the order to visit stops in.
+    :param neighbor_index: Optional neighborIndex.NeighborIndex built from distance_matrix,
+        the nearest stop then comes from the neighbor lists instead of a scan of every stop.
+    :param deadline_aware: Choose stops with deadlineRouting.DeadlineSelector, which skips a
+        nearest stop that would make a reachable delivery deadline impossible.
+    :param hub_index: Address index of the depot the truck leaves from and returns to.
+
+    The trucks start out as being at the hub. Each package is looked up once and grouped
+    into a stop index that maps an address index to the package ids going there. Packages
+    with a "Wrong address" note are kept in a separate held index until 10:20 am, when a
+    release event moves them into the stop index. If only held packages remain then we
+    skip time to 10:20am. From the current location we will choose the nearest stop,
+    ties going to the stop holding the package listed first on the truck. All packages
+    will be assigned as "EN Route" once the truck leaves to the hub, except packages whose
+    address matches no location, they get no stop and end as "Unmatched address". The truck will then
+    drive to the chosen address and mark every package for that stop as "Delivered".
+    With a planned route the next stop is the next one on the plan that still has packages
+    to deliver, the nearest stop is only used for stops the plan does not cover.
+    After the last package has been delivered the truck will return back to the hub.
     """
-    hub_index = 0
     truck.current_location = hub_index
 
-    #Filters out for packages that exist in the package table
-    pending_ids = [package_id for package_id in truck.package_ids if package_table.lookup(package_id)]
+    #Sets the time for package 9
+    hold_time = truck.current_time.replace(hour=10, minute=20, second=0, microsecond=0)
+    hold_clock = to_clock(hold_time, truck.day) if truck.clock is not None else None
+
+    def hold_passed():
+        """
+        True once the truck's time has reached the hold time, compared as clock ticks on
+        the integer clock so no datetime is built per leg.
+        """
+        if hold_clock is not None:
+            return truck.clock >= hold_clock
+        return truck.current_time >= hold_time
+
+    #Looks up each package once, filtering out ids that are not in the package table
+    packages = {}
+    for package_id in truck.package_ids:
+        package = package_table.lookup(package_id)
+        if package:
+            packages[package_id] = package
+    #Position of each package on the truck, used to break distance ties between stops
+    positions = {package_id: position for position, package_id in enumerate(packages)}
+
+    #Address index -> package ids for stops that can be delivered now, and the
+    # position of the first package listed for each of those stops
+    stop_packages = {}
+    stop_order = {}
+    #Address index -> package ids held back by a "Wrong address" note
+    held_stops = {}
+    #Ids of packages whose address matches no location, they stay at the hub
+    unmatched_ids = set()
+
+    for package_id, package in packages.items():
+        index = address_map.index_of(package)
+        if index is None:
+            unmatched_ids.add(package_id)
+        elif package.constraints.address_correction:
+            held_stops.setdefault(index, []).append(package_id)
+        else:
+            if index not in stop_packages:
+                stop_packages[index] = []
+                stop_order[index] = positions[package_id]
+            stop_packages[index].append(package_id)
+
+    def release_held():
+        """
+        Release event, moves the held packages into the stop index once the hold time passes.
+        """
+        for index, package_ids in held_stops.items():
+            first_position = positions[package_ids[0]]
+            if index in stop_packages:
+                stop_packages[index].extend(package_ids)
+                stop_order[index] = min(stop_order[index], first_position)
+            else:
+                stop_packages[index] = package_ids
+                stop_order[index] = first_position
+        held_stops.clear()
+        if search is not None:
+            search.reset()
+        if selector is not None:
+            selector.refresh()
+
+    #Nearest stop search over the stop index, ties going to the package listed first
+    search = neighbor_index.search(stop_packages, stop_order.__getitem__) if neighbor_index is not None else None
+    #Deadline aware search over the stop index, used instead of the nearest stop search
+    selector = DeadlineSelector(
+        distance_matrix, truck.speed, stop_packages, stop_order, packages
+    ) if deadline_aware else None
+
+    if held_stops and hold_passed():
+        release_held()
 
     #Flag to make sure "En Route" is set only once
     en_route_set = False
+    #Position of the next stop to check on the planned route
+    plan_position = 0
 
-    #Continue till all assigned packages have been delivered or removed
-    while pending_ids:
-        #Sets the time for package 9
-        hold_time = truck.current_time.replace(hour=10, minute=20)
-
-        available_ids = []
-        hold_ids = []
-
-        #Separates pending packages into either the available list or hold list
-        for package_id in pending_ids:
-            package = package_table.lookup(package_id)
-            if not package:
-                continue
-            #If packages note is "Wrong address" don't deliver before the hold time
-            if "Wrong address" in package.note and truck.current_time < hold_time:
-                hold_ids.append(package_id)
-            else:
-                available_ids.append(package_id)
-
-        #Exits if nothing is on hold or gets delivered
-        if not available_ids:
-            if not hold_ids:
-                break
-
+    #Continue till all assigned packages have been delivered
+    while stop_packages or held_stops:
+        if not stop_packages:
             #If only the packages held back remain then move the
             # trucks time forward to 10:20am and deliver those packages
-            truck.current_time = hold_time
+            if hold_clock is not None:
+                truck.clock = hold_clock
+            else:
+                truck.current_time = hold_time
             truck.current_location = hub_index
-            available_ids = hold_ids
-
-        #Current location in the distance matrix
-        current_index = truck.current_location
-
-
-        #This helper function gets us the distance from the current location
-        # to a packages address
-        def distance_to_package(package_id):
-            package = package_table.lookup(package_id)
-            index = address_map.get(package.address, hub_index)
-            return distance_matrix[current_index][index]
-
-        #Will select the next package whose destination is closest to
-        # the current location
-        next_id = min(available_ids, key=distance_to_package)
-        next_package = package_table.lookup(next_id)
-        next_index = address_map.get(next_package.address, hub_index)
-
+            release_held()
 
         #Marks all packages as "En Route" when trucks leaves hub
         if not en_route_set:
-            for pending_id in pending_ids:
-                package = package_table.lookup(pending_id)
-                if package:
-                    package.update_status("En Route", truck.current_time)
+            depart_time = truck.current_time
+            for package_id, package in packages.items():
+                if package_id not in unmatched_ids:
+                    package.update_status("En Route", depart_time)
             en_route_set = True
 
-
-        #Moves truck from current location to the next packages address
-        leg_distance = distance_matrix[current_index][next_index]
+        #Will select the next stop on the planned route
+        next_index = None
+        if planned_route is not None:
+            while plan_position < len(planned_route) and planned_route[plan_position] not in stop_packages:
+                plan_position += 1
+            if plan_position < len(planned_route):
+                next_index = planned_route[plan_position]
+
+        #Otherwise will select the next stop closest to the current location
+        current_row = distance_matrix[truck.current_location]
+        if next_index is None and selector is not None:
+            next_index = selector.next_stop(truck.current_location, truck_seconds(truck))
+        elif next_index is None and search is not None:
+            next_index = search.nearest(truck.current_location)
+        elif next_index is None:
+            if instrumentation.enabled:
+                instrumentation.count("stop_selections")
+                instrumentation.count("candidate_evaluations", len(stop_packages))
+            next_index = min(stop_packages, key=lambda index: (current_row[index], stop_order[index]))
+
+        #Moves truck from current location to the next stop
+        leg_distance = float(current_row[next_index])
         truck.drive_simulation(next_index, leg_distance)
 
-        #Builds list of package ids that should be removed from pending ids at current stop
-        delivered_now = []
-        for package_id in pending_ids:
-            package = package_table.lookup(package_id)
-            if not package:
-
-                #Removes package from list if not found in table
-                delivered_now.append(package_id)
-                continue
-
-            #Delivers the packages that their index matches the stop
-            package_index = address_map.get(package.address, hub_index)
-            if package_index != next_index:
-                continue
-            if "Wrong address" in package.note and truck.current_time < hold_time:
-                continue
+        #Held packages at this stop can go out if the hold time passed during the drive
+        if held_stops and hold_passed():
+            release_held()
 
-            #Marks package as "Delivered" at trucks current time
-            package.update_status("Delivered", truck.current_time)
-            delivered_now.append(package_id)
+        #Marks every package for this stop as "Delivered" at trucks current time
+        arrival_time = truck.current_time
+        for package_id in stop_packages.pop(next_index):
+            packages[package_id].update_status("Delivered", arrival_time)
+        if selector is not None:
+            selector.remove_stop(next_index)
 
-        #Removes delivered package ids from the pending list
-        for package_id in delivered_now:
-            if package_id in pending_ids:
-                pending_ids.remove(package_id)
+    for package_id in unmatched_ids:
+        packages[package_id].update_status(STATUS_NAMES[STATUS_UNMATCHED])
 
     #REturns the truck back to the hub if needed once all packages delivered
     if truck.current_location != hub_index:
-        leg_distance = distance_matrix[truck.current_location][hub_index]
+        leg_distance = float(distance_matrix[truck.current_location][hub_index])
         truck.drive_simulation(hub_index, leg_distance)
@@ -0,0 +1,313 @@
+"""
+Pluggable distance providers for cities too large for a dense matrix.
+
+Routing code reads distances as distance_matrix[i][j], or takes row i once and indexes
+it per candidate. Every provider supports that, so a provider can be passed wherever a
+distance matrix is accepted:
+- DenseDistances wraps the square matrix from load_distance_matrix, n * n values.
+- TriangleDistances memory maps a file of the n(n-1)/2 values of one triangle, built once
+  from the distance CSV. Rows are gathered on demand and kept in an LRU cache.
+- CoordinateDistances computes distances from (x, y) coordinates in miles, nothing is
+  stored but an LRU cache of computed rows.
+load_distance_provider picks one by the number of locations.
+"""
+import csv
+import json
+import math
+import mmap
+import os
+from array import array
+from collections import OrderedDict
+
+from csvDistanceFileReader import build_address_map, distance_cache_paths, load_distance_matrix
+
+#NumPy is optional, without it rows are built with Python loops over typed arrays
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#Up to this many locations the dense matrix is used, 100 MB as float32
+DENSE_LOCATION_LIMIT = 5000
+#Up to this many locations the triangle file is used, above it coordinates when given
+TRIANGLE_LOCATION_LIMIT = 50000
+#Rows kept by the on demand providers
+DEFAULT_CACHE_ROWS = 256
+#array typecode of each supported dtype
+_TYPECODES = {"float32": "f", "float64": "d"}
+
+
+def triangle_size(location_count):
+    """
+    Returns the number of values in one triangle of the matrix, n(n-1)/2.
+    """
+    return location_count * (location_count - 1) // 2
+
+
+def dense_array(distances):
+    """
+    Returns distances as a NumPy array without copying, or None without NumPy or when
+    distances is an on demand provider, whose callers then go row by row.
+    """
+    if np is None or getattr(distances, "lazy", False):
+        return None
+    return np.asarray(distances)
+
+
+class DistanceProvider:
+    """
+    Base class of the distance providers. provider[i] returns row i, indexable by
+    location, and len(provider) is the number of locations.
+    """
+    #True when rows are computed on demand, the whole matrix is never materialized
+    lazy = True
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, location):
+        return self.row(location)
+
+    def row(self, location):
+        """
+        Returns the distances from location to every location.
+        """
+        raise NotImplementedError
+
+    def distance(self, from_location, to_location):
+        """
+        Returns the distance between two locations in miles.
+        """
+        return float(self.row(from_location)[to_location])
+
+
+class _CachedRows(DistanceProvider):
+    """
+    DistanceProvider keeping the last cache_rows computed rows, least recently used first out.
+    """
+    def __init__(self, size, cache_rows):
+        self.size = size
+        self.cache_rows = cache_rows
+        self._rows = OrderedDict()
+        #Number of rows computed, a measure of how well the cache is doing
+        self.rows_built = 0
+
+    def row(self, location):
+        rows = self._rows
+        row = rows.get(location)
+        if row is not None:
+            rows.move_to_end(location)
+            return row
+        row = self._build_row(location)
+        self.rows_built += 1
+        rows[location] = row
+        if len(rows) > self.cache_rows:
+            rows.popitem(last=False)
+        return row
+
+    def _build_row(self, location):
+        raise NotImplementedError
+
+
+class DenseDistances(DistanceProvider):
+    """
+    The square distance matrix, nested lists or a NumPy array.
+    """
+    lazy = False
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+        self.size = len(matrix)
+
+    def row(self, location):
+        return self.matrix[location]
+
+    def distance(self, from_location, to_location):
+        return float(self.matrix[from_location][to_location])
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.matrix, dtype=dtype)
+
+
+class TriangleDistances(_CachedRows):
+    """
+    Distances memory mapped from a file of the strict lower triangle in row order:
+    row i holds the distances from i to locations 0 up to i - 1, so the value for
+    i > j sits at i(i-1)/2 + j. That is n(n-1)/2 values, about half the dense matrix.
+    """
+    def __init__(self, path, size, dtype="float32", cache_rows=DEFAULT_CACHE_ROWS):
+        """
+        :param path: Triangle file written by build_triangle_file.
+        :param size: Number of locations.
+        :param dtype: Value type of the file, "float32" or "float64".
+        :param cache_rows: Number of gathered rows kept.
+        """
+        super().__init__(size, cache_rows)
+        self.path = path
+        self.dtype = dtype
+        self.typecode = _TYPECODES[dtype]
+        count = triangle_size(size)
+        if count == 0:
+            self.values = array(self.typecode)
+        elif np is not None:
+            self.values = np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+        else:
+            with open(path, mode='rb') as triangle_file:
+                self._map = mmap.mmap(triangle_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.values = memoryview(self._map).cast(self.typecode)
+
+    def distance(self, from_location, to_location):
+        if from_location == to_location:
+            return 0.0
+        if from_location < to_location:
+            from_location, to_location = to_location, from_location
+        return float(self.values[from_location * (from_location - 1) // 2 + to_location])
+
+    def _build_row(self, location):
+        start = location * (location - 1) // 2
+        if np is not None:
+            row = np.empty(self.size, dtype=np.float64)
+            row[:location] = self.values[start:start + location]
+            row[location] = 0.0
+            later = np.arange(location + 1, self.size, dtype=np.int64)
+            row[location + 1:] = self.values[later * (later - 1) // 2 + location]
+            return row
+        row = array('d', self.values[start:start + location])
+        row.append(0.0)
+        row.extend(self.values[later * (later - 1) // 2 + location] for later in range(location + 1, self.size))
+        return row
+
+
+class CoordinateDistances(_CachedRows):
+    """
+    Straight line distances between (x, y) coordinates in miles, computed on demand.
+    """
+    def __init__(self, points, decimals=None, cache_rows=DEFAULT_CACHE_ROWS):
+        """
+        :param points: List of (x, y) coordinates in miles, in location order.
+        :param decimals: Round distances to this many decimals, 1 matches the distance CSVs.
+        :param cache_rows: Number of computed rows kept.
+        """
+        super().__init__(len(points), cache_rows)
+        self.decimals = decimals
+        if np is not None:
+            coordinates = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+            self.xs = coordinates[:, 0]
+            self.ys = coordinates[:, 1]
+        else:
+            self.xs = array('d', (x for x, _ in points))
+            self.ys = array('d', (y for _, y in points))
+
+    def distance(self, from_location, to_location):
+        distance = math.hypot(self.xs[from_location] - self.xs[to_location],
+                              self.ys[from_location] - self.ys[to_location])
+        return round(distance, self.decimals) if self.decimals is not None else float(distance)
+
+    def _build_row(self, location):
+        x, y = self.xs[location], self.ys[location]
+        if np is not None:
+            row = np.hypot(self.xs - x, self.ys - y)
+            return np.round(row, self.decimals, out=row) if self.decimals is not None else row
+        if self.decimals is not None:
+            return array('d', (round(math.hypot(x - other_x, y - other_y), self.decimals)
+                               for other_x, other_y in zip(self.xs, self.ys)))
+        return array('d', (math.hypot(x - other_x, y - other_y) for other_x, other_y in zip(self.xs, self.ys)))
+
+
+def build_triangle_file(csv_file_path, triangle_path, dtype="float32"):
+    """
+    Streams a triangular distance CSV into a triangle file, one row at a time, so the
+    matrix is never held in memory.
+    :return: The list of addresses in index order.
+    """
+    addresses = []
+    typecode = _TYPECODES[dtype]
+    with open(csv_file_path, mode='r', newline='', encoding='utf-8-sig') as csv_file, \
+            open(triangle_path + ".tmp", mode='wb') as triangle_file:
+        for csv_row in csv.reader(csv_file, delimiter=','):
+            location = len(addresses)
+            addresses.append(csv_row[0].strip())
+            values = [value for value in csv_row[1:] if value != '']
+            if len(values) != location + 1:
+                raise ValueError(
+                    f"Distance file row {location} has {len(values)} values, expected {location + 1}"
+                )
+            #Drops the 0.0 on the diagonal
+            array(typecode, map(float, values[:location])).tofile(triangle_file)
+    os.replace(triangle_path + ".tmp", triangle_path)
+    return addresses
+
+
+def load_triangle_distances(csv_file_path, cache_dir=None, dtype="float32", cache_rows=DEFAULT_CACHE_ROWS):
+    """
+    Loads a TriangleDistances for a distance CSV, building the triangle file next to the
+    matrix cache the first time and memory mapping it after that.
+    :return: provider, list of addresses and the address map.
+    """
+    matrix_path, addresses_path = distance_cache_paths(csv_file_path, cache_dir, dtype)
+    triangle_path = matrix_path[:-len(".npy")] + ".tri"
+    if os.path.exists(triangle_path) and os.path.exists(addresses_path):
+        with open(addresses_path, mode='r', encoding='utf-8') as addresses_file:
+            addresses = json.load(addresses_file)
+    else:
+        os.makedirs(os.path.dirname(triangle_path), exist_ok=True)
+        addresses = build_triangle_file(csv_file_path, triangle_path, dtype)
+        with open(addresses_path + ".tmp", mode='w', encoding='utf-8') as addresses_file:
+            json.dump(addresses, addresses_file)
+        os.replace(addresses_path + ".tmp", addresses_path)
+    provider = TriangleDistances(triangle_path, len(addresses), dtype, cache_rows)
+    return provider, addresses, build_address_map(addresses)
+
+
+def choose_distance_provider(location_count, has_coordinates=False):
+    """
+    Returns the provider kind for a city of location_count locations: "dense" for small
+    cities, "triangle" up to TRIANGLE_LOCATION_LIMIT, "coordinates" above that when
+    coordinates are known.
+    """
+    if location_count <= DENSE_LOCATION_LIMIT:
+        return "dense"
+    if location_count <= TRIANGLE_LOCATION_LIMIT or not has_coordinates:
+        return "triangle"
+    return "coordinates"
+
+
+def _count_locations(csv_file_path):
+    """
+    Returns the number of rows, one per location, of a distance CSV.
+    """
+    with open(csv_file_path, mode='r', newline='', encoding='utf-8-sig') as csv_file:
+        return sum(1 for _ in csv.reader(csv_file, delimiter=','))
+
+
+def load_distance_provider(csv_file_path=None, points=None, addresses=None, kind=None, cache_dir=None,
+                           dtype="float32", cache_rows=DEFAULT_CACHE_ROWS):
+    """
+    Loads the distances of a city through the provider that suits its size.
+
+    :param csv_file_path: Triangular distance CSV, needed for "dense" and "triangle".
+    :param points: (x, y) coordinates in miles per location, needed for "coordinates".
+    :param addresses: Full addresses in location order, needed with points and no CSV.
+    :param kind: "dense", "triangle" or "coordinates", chosen with choose_distance_provider by default.
+    :param cache_dir: Folder for the cache files, defaults to .distance_cache next to the CSV.
+    :param dtype: Value type of the dense matrix and the triangle file.
+    :param cache_rows: Rows kept by the on demand providers.
+    :return: provider, list of addresses and the address map.
+    """
+    if kind is None:
+        if csv_file_path is None:
+            kind = "coordinates"
+        else:
+            location_count = len(points) if points is not None else _count_locations(csv_file_path)
+            kind = choose_distance_provider(location_count, points is not None)
+
+    if kind == "dense":
+        distance_matrix, addresses, address_map = load_distance_matrix(csv_file_path, cache_dir, dtype)
+        return DenseDistances(distance_matrix), addresses, address_map
+    if kind == "triangle":
+        return load_triangle_distances(csv_file_path, cache_dir, dtype, cache_rows)
+    if kind == "coordinates":
+        if points is None or addresses is None:
+            raise ValueError("Coordinate distances need both points and addresses")
+        return CoordinateDistances(points, decimals=1, cache_rows=cache_rows), addresses, build_address_map(addresses)
+    raise ValueError(f"Unknown distance provider {kind!r}")
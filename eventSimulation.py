@@ -0,0 +1,409 @@
+import heapq
+from collections import deque, namedtuple
+from datetime import datetime, timedelta
+
+import instrumentation
+from deadlineRouting import DeadlineSelector, truck_seconds
+from packageClass import STATUS_NAMES, STATUS_UNMATCHED
+from truckClass import from_clock, shift_day, to_clock
+
+#Event kinds, the value also orders events that happen at the same time so
+# constraints are applied and drivers freed before trucks act on them
+ADDRESS_CORRECTION = 0
+PACKAGE_ARRIVAL = 1
+DRIVER_FREE = 2
+TRUCK_READY = 3
+DEPART = 4
+ARRIVE = 5
+DELIVER = 6
+
+EVENT_NAMES = {
+    ADDRESS_CORRECTION: "address-correction",
+    PACKAGE_ARRIVAL: "package-arrival",
+    DRIVER_FREE: "driver-free",
+    TRUCK_READY: "truck-ready",
+    DEPART: "depart",
+    ARRIVE: "arrive",
+    DELIVER: "deliver",
+}
+
+#One driven leg of a truck's route, times are event queue times. package_ids lists the
+# packages delivered on arrival, it is filled in when they are delivered
+Leg = namedtuple("Leg", ("from_index", "to_index", "depart", "arrive", "mileage", "package_ids"))
+
+
+class DriverPool:
+    """
+    Drivers as a shared resource. A truck can only leave the hub with a free driver,
+    trucks that are ready without one wait in line in the order they became ready.
+    """
+    def __init__(self, driver_count):
+        self.free_drivers = driver_count
+        self.waiting_trucks = deque()
+
+    def acquire(self, truck_state):
+        """
+        Gives truck_state a driver and returns True, or queues it and returns False.
+        """
+        if self.free_drivers > 0:
+            self.free_drivers -= 1
+            return True
+        self.waiting_trucks.append(truck_state)
+        return False
+
+    def release(self):
+        """
+        Frees a driver. Returns the waiting truck that takes the driver, or None.
+        """
+        if self.waiting_trucks:
+            return self.waiting_trucks.popleft()
+        self.free_drivers += 1
+        return None
+
+
+class TruckState:
+    """
+    Simulation state for one truck: its stop index and the constraints it waits on.
+    Stops map an address index to the package ids going there, with the position of the
+    first package listed for each stop so distance ties resolve like deliver_packages.
+    Packages whose address matches no location get no stop, they stay at the hub.
+    """
+    def __init__(self, truck, packages, address_map, hub_index):
+        self.truck = truck
+        self.packages = packages
+        self.stop_packages = {}
+        self.stop_order = {}
+        self.unmatched_ids = []
+        for position, (package_id, package) in enumerate(packages.items()):
+            index = address_map.index_of(package)
+            if index is None:
+                self.unmatched_ids.append(package_id)
+            elif index not in self.stop_packages:
+                self.stop_packages[index] = []
+                self.stop_order[index] = position
+            if index is not None:
+                self.stop_packages[index].append(package_id)
+        #Number of constraints (package arrivals, address corrections) still holding the truck
+        self.blockers = 0
+        #True once the truck's own start time has passed
+        self.start_reached = False
+        #Recorded run: when the truck was ready and left the hub, and every leg it drove
+        self.ready_time = None
+        self.ready_sequence = None
+        self.depart_time = None
+        self.legs = []
+        #DeadlineSelector for the route, made when the truck departs in deadline aware runs
+        self.selector = None
+
+    def move_package(self, package_id, new_index):
+        """
+        Moves a package to the stop at new_index, used when its address is corrected.
+        A new_index of None leaves the package without a stop, its address matches nothing.
+        """
+        position = list(self.packages).index(package_id)
+        if package_id in self.unmatched_ids:
+            self.unmatched_ids.remove(package_id)
+        for index, package_ids in list(self.stop_packages.items()):
+            if package_id in package_ids:
+                package_ids.remove(package_id)
+                if not package_ids:
+                    del self.stop_packages[index]
+                    del self.stop_order[index]
+                break
+        if new_index is None:
+            self.unmatched_ids.append(package_id)
+            return
+        self.stop_packages.setdefault(new_index, []).append(package_id)
+        self.stop_order[new_index] = min(self.stop_order.get(new_index, position), position)
+
+
+class FleetSimulation:
+    """
+    Discrete event simulation of a whole fleet with one global event queue.
+
+    Events are (time, kind, sequence, payload) tuples in a heap, so the run costs time
+    proportional to the number of events no matter how many trucks there are. Trucks,
+    drivers and time triggered constraints are resources of the simulation:
+    - A truck is ready at its start time (truck.current_time), once every package on it
+      has arrived at the depot (PackageConstraints.delayed_until) and every address
+      correction for its packages has come in.
+    - A ready truck takes a free driver from the DriverPool or waits for DRIVER_FREE.
+    - A departed truck drives to its nearest stop, ties going to the stop with the package
+      listed first, delivers every package there and repeats, then returns to the hub and
+      frees its driver. This is the same routing as deliver_packages.
+    Each truck's run is recorded on its TruckState: when it was ready, when it left and
+    every Leg it drove, so incrementalSimulation can replay from any point.
+
+    With deadline_aware each truck's stops are chosen by deadlineRouting.DeadlineSelector,
+    the nearest stop is skipped when taking it would make a reachable deadline impossible.
+
+    With integer_clock the trucks are switched to the integer clock and event times are
+    clock ticks since midnight of the first truck's day. Times passed in and out (truck
+    start times, corrections, package timestamps, the listener) stay datetimes.
+    """
+    def __init__(self, distance_matrix, package_table, address_map, driver_count, hub_index=0,
+                 integer_clock=False, deadline_aware=False):
+        """
+        :param distance_matrix: Matrix of the distances between the address indices.
+        :param package_table: Hashtable of packages keyed by package id number.
+        :param address_map: Dictionary that maps address strings to indices in the distance matrix.
+        :param driver_count: Number of drivers shared by the fleet.
+        :param hub_index: Address index of the hub.
+        :param integer_clock: Run the event queue and trucks on integer clock ticks.
+        :param deadline_aware: Route each truck with a DeadlineSelector.
+        """
+        self.distance_matrix = distance_matrix
+        self.package_table = package_table
+        self.address_map = address_map
+        self.hub_index = hub_index
+        self.driver_count = driver_count
+        self.drivers = DriverPool(driver_count)
+        self.ready_count = 0
+        self.integer_clock = integer_clock
+        self.deadline_aware = deadline_aware
+        #Midnight the integer clock counts from, set by the first truck added
+        self.day = None
+
+        self.trucks = []
+        self.truck_states = []
+        self.events = []
+        self.sequence = 0
+        self.event_count = 0
+        #package id -> TruckState carrying it
+        self.package_trucks = {}
+        #Optional callable(time, kind, payload) called for every processed event
+        self.listener = None
+
+    def schedule(self, time, kind, payload):
+        """
+        Adds an event to the global queue.
+        """
+        heapq.heappush(self.events, (time, kind, self.sequence, payload))
+        self.sequence += 1
+
+    def _event_time(self, time):
+        """
+        Converts a datetime into the time used on the event queue.
+        """
+        if not self.integer_clock:
+            return time
+        if self.day is None:
+            self.day = shift_day(time)
+        return to_clock(time, self.day)
+
+    def _to_datetime(self, time):
+        """
+        Converts a time from the event queue back into a datetime.
+        """
+        return from_clock(time, self.day) if self.integer_clock else time
+
+    def _truck_time(self, truck):
+        """
+        Returns the truck's current time as an event queue time.
+        """
+        return truck.clock if self.integer_clock else truck.current_time
+
+    def _set_truck_time(self, truck, time):
+        """
+        Sets the truck's current time from an event queue time.
+        """
+        if self.integer_clock:
+            truck.clock = time
+        else:
+            truck.current_time = time
+
+    def add_truck(self, truck):
+        """
+        Adds a truck to the fleet. truck.current_time is the earliest time it may leave the hub.
+        """
+        packages = {}
+        for package_id in truck.package_ids:
+            package = self.package_table.lookup(package_id)
+            if package:
+                packages[package_id] = package
+        if self.integer_clock:
+            if self.day is None:
+                self.day = shift_day(truck.current_time)
+            truck.use_integer_clock(self.day)
+        state = TruckState(truck, packages, self.address_map, self.hub_index)
+        self.trucks.append(truck)
+        self.truck_states.append(state)
+        for package_id in packages:
+            self.package_trucks[package_id] = state
+
+        #Packages delayed on their way to the depot hold the truck until they arrive
+        midnight = datetime.combine(truck.current_time.date(), datetime.min.time())
+        for package_id, package in packages.items():
+            delayed_until = package.constraints.delayed_until
+            if delayed_until is not None:
+                arrival_time = midnight + timedelta(minutes=delayed_until)
+                if arrival_time > truck.current_time:
+                    state.blockers += 1
+                    self.schedule(self._event_time(arrival_time), PACKAGE_ARRIVAL, state)
+
+        self.schedule(self._truck_time(truck), TRUCK_READY, state)
+        return truck
+
+    def add_address_correction(self, time, package_ids, new_address=None):
+        """
+        Schedules an address correction. Until it happens the trucks carrying these packages
+        are held at the hub. If new_address is given the packages are rerouted to it.
+        Must be called after the trucks carrying the packages have been added.
+        """
+        package_ids = list(package_ids)
+        for package_id in package_ids:
+            state = self.package_trucks.get(package_id)
+            if state is not None:
+                state.blockers += 1
+        self.schedule(self._event_time(time), ADDRESS_CORRECTION, (package_ids, new_address))
+
+    @instrumentation.timed("simulation")
+    def run(self):
+        """
+        Processes events in time order until the queue is empty.
+        :return: The list of trucks, simulated in place.
+        """
+        handlers = {
+            ADDRESS_CORRECTION: self._on_address_correction,
+            PACKAGE_ARRIVAL: self._on_package_arrival,
+            DRIVER_FREE: self._on_driver_free,
+            TRUCK_READY: self._on_truck_ready,
+            DEPART: self._on_depart,
+            ARRIVE: self._on_arrive,
+            DELIVER: self._on_deliver,
+        }
+        while self.events:
+            time, kind, _, payload = heapq.heappop(self.events)
+            self.event_count += 1
+            if self.listener is not None:
+                self.listener(self._to_datetime(time), kind, payload)
+            handlers[kind](time, payload)
+        return self.trucks
+
+    def _unblock(self, state, time):
+        """
+        Clears one constraint holding a truck and asks for a driver if it is now ready.
+        """
+        state.blockers -= 1
+        self._request_driver(state, time)
+
+    def _request_driver(self, state, time):
+        """
+        Departs the truck now if it is ready and a driver is free, otherwise it waits.
+        """
+        if state.start_reached and state.blockers == 0:
+            if state.ready_time is None:
+                state.ready_time = time
+                state.ready_sequence = self.ready_count
+                self.ready_count += 1
+            if self.drivers.acquire(state):
+                self.schedule(time, DEPART, state)
+
+    def _on_address_correction(self, time, payload):
+        """
+        Applies an address correction and releases the trucks it was holding.
+        """
+        package_ids, new_address = payload
+        for package_id in package_ids:
+            state = self.package_trucks.get(package_id)
+            if new_address is not None:
+                package = self.package_table.lookup(package_id)
+                package.address = new_address
+                package.location_index = None
+                if state is not None:
+                    state.move_package(package_id, self.address_map.index_of(package))
+            if state is not None:
+                self._unblock(state, time)
+
+    def _on_package_arrival(self, time, state):
+        """
+        A delayed package reached the depot, one less constraint holds its truck.
+        """
+        self._unblock(state, time)
+
+    def _on_truck_ready(self, time, state):
+        """
+        The truck's start time has come, it leaves once a driver is free and nothing holds it.
+        """
+        state.start_reached = True
+        self._request_driver(state, time)
+
+    def _on_driver_free(self, time, state):
+        """
+        A truck is back at the hub, its driver takes the next waiting truck if there is one.
+        """
+        waiting_state = self.drivers.release()
+        if waiting_state is not None:
+            self.schedule(time, DEPART, waiting_state)
+
+    def _on_depart(self, time, state):
+        """
+        The truck leaves the hub with all of its packages.
+        """
+        truck = state.truck
+        self._set_truck_time(truck, time)
+        truck.current_location = self.hub_index
+        state.depart_time = time
+        #Marks all packages as "En Route" when trucks leaves hub, unmatched ones stay behind
+        depart_time = self._to_datetime(time)
+        for package_id, package in state.packages.items():
+            if package_id in state.unmatched_ids:
+                package.update_status(STATUS_NAMES[STATUS_UNMATCHED])
+            else:
+                package.update_status("En Route", depart_time)
+        if self.deadline_aware:
+            state.selector = DeadlineSelector(
+                self.distance_matrix, truck.speed, state.stop_packages, state.stop_order, state.packages
+            )
+        self._drive_to_next_stop(state)
+
+    def _drive_to_next_stop(self, state):
+        """
+        Starts the truck's next leg, to the nearest stop or back to the hub when it is done.
+        """
+        truck = state.truck
+        current_row = self.distance_matrix[truck.current_location]
+        if state.stop_packages:
+            stop_order = state.stop_order
+            if instrumentation.enabled:
+                instrumentation.count("stop_selections")
+                instrumentation.count("candidate_evaluations", len(state.stop_packages))
+            if state.selector is not None:
+                next_index = state.selector.next_stop(truck.current_location, truck_seconds(truck))
+            else:
+                next_index = min(state.stop_packages, key=lambda index: (current_row[index], stop_order[index]))
+        elif truck.current_location != self.hub_index:
+            next_index = self.hub_index
+        else:
+            #Back at the hub with nothing left, the driver is free
+            self.schedule(self._truck_time(truck), DRIVER_FREE, state)
+            return
+        from_index = truck.current_location
+        depart_time = self._truck_time(truck)
+        arrive_time = truck.drive_simulation(next_index, float(current_row[next_index]))
+        state.legs.append(Leg(from_index, next_index, depart_time, arrive_time, truck.mileage, []))
+        self.schedule(arrive_time, ARRIVE, state)
+
+    def _on_arrive(self, time, state):
+        """
+        The truck reached a stop, delivers there or drives on.
+        """
+        if state.truck.current_location in state.stop_packages:
+            self.schedule(time, DELIVER, state)
+        else:
+            self._drive_to_next_stop(state)
+
+    def _on_deliver(self, time, state):
+        """
+        Delivers every package for the stop the truck is at, then starts the next leg.
+        """
+        #Marks every package for this stop as "Delivered" at the arrival time
+        delivery_time = self._to_datetime(time)
+        package_ids = state.stop_packages.pop(state.truck.current_location)
+        for package_id in package_ids:
+            state.packages[package_id].update_status("Delivered", delivery_time)
+        state.legs[-1].package_ids.extend(package_ids)
+        del state.stop_order[state.truck.current_location]
+        if state.selector is not None:
+            state.selector.remove_stop(state.truck.current_location)
+        self._drive_to_next_stop(state)
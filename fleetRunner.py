@@ -0,0 +1,162 @@
+import heapq
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+
+from deliveryLogic import deliver_packages
+from hashTable import HashTable
+
+#NumPy is optional, without it the distance matrix is copied to each worker once
+try:
+    import numpy as np
+    from multiprocessing import shared_memory
+except ImportError:
+    np = None
+
+#Distance data each worker process attaches to once, in _init_worker
+_worker_state = {}
+
+
+def _init_worker(matrix_source, address_map, addresses):
+    """
+    Runs once in every worker process.
+    If matrix_source is a (shared memory name, shape, dtype) tuple the worker maps the
+    parent's shared memory block as a NumPy array without copying it. Otherwise it is the
+    distance matrix itself, sent to the worker once instead of with every truck.
+    """
+    if isinstance(matrix_source, tuple):
+        name, shape, dtype = matrix_source
+        #The parent owns the block and unlinks it, the worker keeps it open while it runs
+        block = shared_memory.SharedMemory(name=name)
+        _worker_state["block"] = block
+        _worker_state["distance_matrix"] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    else:
+        _worker_state["distance_matrix"] = matrix_source
+    _worker_state["address_map"] = address_map
+    _worker_state["addresses"] = addresses
+
+
+def _simulate_truck(truck, packages):
+    """
+    Runs deliver_packages for one truck inside a worker process.
+
+    :param truck: Truck object with its package ids and departure time.
+    :param packages: The Package objects assigned to the truck.
+    :return: The simulated truck and a dictionary of package id -> (status, depart time, delivery time).
+    """
+    package_table = HashTable()
+    package_table.bulk_insert((package.package_id, package) for package in packages)
+    deliver_packages(
+        truck,
+        _worker_state["distance_matrix"],
+        package_table,
+        _worker_state["address_map"],
+        _worker_state["addresses"],
+    )
+    results = {
+        package.package_id: (package.status, package.depart_time, package.delivery_time)
+        for package in packages
+    }
+    return truck, results
+
+
+def _merge_truck(truck, simulated_truck, results, package_table):
+    """
+    Copies a worker's simulated truck state and package timestamps back into the
+    parent's truck and package table.
+    """
+    truck.mileage = simulated_truck.mileage
+    truck.current_time = simulated_truck.current_time
+    truck.current_location = simulated_truck.current_location
+    truck.leg_log = simulated_truck.leg_log
+    for package_id, (status, depart_time, delivery_time) in results.items():
+        package = package_table.lookup(package_id)
+        package.status = status
+        package.depart_time = depart_time
+        package.delivery_time = delivery_time
+
+
+def _share_matrix(distance_matrix):
+    """
+    Copies a NumPy distance matrix into a new shared memory block.
+    Returns the block and the (name, shape, dtype) tuple workers use to attach to it,
+    or (None, distance_matrix) when the matrix is not a NumPy array.
+    """
+    if np is None or not isinstance(distance_matrix, np.ndarray):
+        return None, distance_matrix
+    block = shared_memory.SharedMemory(create=True, size=max(distance_matrix.nbytes, 1))
+    shared_matrix = np.ndarray(distance_matrix.shape, dtype=distance_matrix.dtype, buffer=block.buf)
+    shared_matrix[:] = distance_matrix
+    return block, (block.name, distance_matrix.shape, distance_matrix.dtype.str)
+
+
+def run_fleet(trucks, distance_matrix, package_table, address_map, addresses, driver_count=None, max_workers=None):
+    """
+    Simulates the whole fleet, running trucks that do not depend on each other in parallel.
+
+    :param trucks: Trucks in dispatch order. Each truck's current_time is the earliest
+        time it may leave the hub, for example a delayed address correction.
+    :param distance_matrix: Matrix of the distances between the address indices.
+    :param package_table: Hashtable of packages keyed by package id number.
+    :param address_map: Dictionary that maps address strings to indices in the distance matrix.
+    :param addresses: List of addresses in index order.
+    :param driver_count: Number of drivers, defaults to one driver per truck.
+    :param max_workers: Number of worker processes, 0 runs every truck in this process.
+
+    Every truck needs a driver. Trucks take the driver who is free the earliest, in dispatch
+    order, and leave at the later of that driver's free time and their own current_time. A
+    truck can be dispatched as soon as that earliest free time is known, which is once it is
+    no later than the departure of every truck still running, since a running truck cannot
+    finish before it leaves. Trucks are simulated by deliver_packages in worker processes
+    that read a NumPy distance matrix from shared memory instead of getting a pickled copy,
+    and their delivery and depart timestamps are merged back into package_table.
+    :return: The list of trucks, simulated in place.
+    """
+    if driver_count is None:
+        driver_count = len(trucks)
+    #Free times of the idle drivers, every driver is free from the start of the day
+    driver_free_times = [(datetime.min, index) for index in range(driver_count)]
+    heapq.heapify(driver_free_times)
+    pending = deque(trucks)
+
+    if max_workers == 0:
+        for truck in pending:
+            free_time, driver = heapq.heappop(driver_free_times)
+            truck.current_time = max(truck.current_time, free_time)
+            deliver_packages(truck, distance_matrix, package_table, address_map, addresses)
+            heapq.heappush(driver_free_times, (truck.current_time, driver))
+        return trucks
+
+    block, matrix_source = _share_matrix(distance_matrix)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(matrix_source, address_map, addresses),
+        ) as executor:
+            running = {}
+            while pending or running:
+                #Dispatches trucks while the earliest free driver time is settled
+                while pending and driver_free_times:
+                    free_time, driver = driver_free_times[0]
+                    if any(free_time > started.current_time for started, _ in running.values()):
+                        break
+                    heapq.heappop(driver_free_times)
+                    truck = pending.popleft()
+                    truck.current_time = max(truck.current_time, free_time)
+                    packages = [package_table.lookup(package_id) for package_id in truck.package_ids]
+                    packages = [package for package in packages if package]
+                    future = executor.submit(_simulate_truck, truck, packages)
+                    running[future] = (truck, driver)
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    truck, driver = running.pop(future)
+                    simulated_truck, results = future.result()
+                    _merge_truck(truck, simulated_truck, results, package_table)
+                    heapq.heappush(driver_free_times, (truck.current_time, driver))
+    finally:
+        if block is not None:
+            block.close()
+            block.unlink()
+    return trucks
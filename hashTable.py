@@ -1,53 +1,173 @@
+#Marks a slot that has never held a key, a lookup can stop probing here
+_EMPTY = object()
+#Marks a slot whose key was deleted, a lookup has to keep probing past it
+_DELETED = object()
+
+
 class HashTable:
     """
-    A hash table implementation using separate chaining to store packages by ID.
-    This hash table is an array(list) of buckets, each bucket is a list of (key, value) pairs.
-    Collisions are handled by appending multiple pairs into the same bucket(chaining).
+    A hash table implementation using open addressing to store packages by ID.
+    This hash table keeps two parallel arrays(lists), one of keys and one of values, so
+    slot i holds the pair (keys_list[i], values_list[i]). Collisions are handled by
+    linear probing, trying the next slot until a free one is found. The table grows
+    whenever the load factor passes max_load_factor, so probe runs stay short.
     """
-    def __init__(self, bucket_size=10 ):
+    def __init__(self, bucket_size=10, max_load_factor=0.7):
         """
         Initialize the hash table with the given bucket size (10).
-        First store the bucket size, then create a lost of empty lists,
-        one for each bucket.
+        First store the bucket size and load factor, then create the parallel
+        key and value arrays with every slot empty.
         """
         self.bucket_size = bucket_size
-        self.buckets_list = [[] for _ in range(bucket_size)]
+        self.max_load_factor = max_load_factor
+        self.keys_list = [_EMPTY] * bucket_size
+        self.values_list = [None] * bucket_size
+        #Number of live keys, and number of slots in use including deleted markers
+        self.count = 0
+        self.used_slots = 0
+
     def _hash_function(self, package_id):
         """
         Returns the hash value for the given package_id.
-        First computes package_id modulo bucket_size,then uses the
-        result as an index into self.buckets_list.
+        First computes the hash of package_id modulo bucket_size, then uses the
+        result as the first slot to probe in self.keys_list.
         """
-        bucket_index = package_id % self.bucket_size
+        bucket_index = hash(package_id) % self.bucket_size
         return bucket_index
 
-    def insert(self, package_id, package):
+    def _find_slot(self, package_id):
         """
-        Inserts a package id number  and package info into the hash table.
-        First the bucket index for the given package_id is computed, then we
-        get the bucket index for the given package_id. Lastly we append
-        a key, value tuple to that bucket, handling collisions by chaining the tuples.
+        Probes for the package_id and returns (slot index, found).
+        If the key is found its slot is returned with found set to True. Otherwise the
+        first deleted or empty slot seen is returned so an insert can reuse it.
         """
+        keys_list = self.keys_list
         index = self._hash_function(package_id)
-        bucket = self.buckets_list[index]
-        bucket.append((package_id, package))
+        free_slot = None
+        while True:
+            key = keys_list[index]
+            if key is _EMPTY:
+                return (index if free_slot is None else free_slot), False
+            if key is _DELETED:
+                if free_slot is None:
+                    free_slot = index
+            elif key == package_id:
+                return index, True
+            index += 1
+            if index == self.bucket_size:
+                index = 0
+
+    def _resize(self, new_size):
+        """
+        Rebuilds the arrays at new_size slots and reinserts every live pair,
+        which also clears out any deleted markers.
+        """
+        old_pairs = list(self.items())
+        self.bucket_size = new_size
+        self.keys_list = [_EMPTY] * new_size
+        self.values_list = [None] * new_size
+        self.count = 0
+        self.used_slots = 0
+        for package_id, package in old_pairs:
+            self.insert(package_id, package)
+
+    def _size_for(self, item_count):
+        """
+        Returns the smallest bucket size that holds item_count keys under the load factor.
+        """
+        return int(item_count / self.max_load_factor) + 1
+
+    def insert(self, package_id, package):
+        """
+        Inserts a package id number and package info into the hash table.
+        If the package id is already in the table its package info is replaced.
+        Before adding a new key the table is rebuilt at double the size it needs if
+        the new key would push the load factor past max_load_factor.
+        """
+        if (self.used_slots + 1) > self.bucket_size * self.max_load_factor:
+            self._resize(self._size_for((self.count + 1) * 2))
+
+        index, found = self._find_slot(package_id)
+        if not found:
+            if self.keys_list[index] is _EMPTY:
+                self.used_slots += 1
+            self.keys_list[index] = package_id
+            self.count += 1
+        self.values_list[index] = package
+
+    def bulk_insert(self, pairs):
+        """
+        Inserts many (package id, package) pairs at once.
+        The table is resized a single time up front to fit every pair, so no
+        resize happens while the pairs are being inserted.
+        """
+        pairs = list(pairs)
+        needed_size = self._size_for(self.count + len(pairs))
+        if needed_size > self.bucket_size:
+            self._resize(needed_size)
+        for package_id, package in pairs:
+            self.insert(package_id, package)
 
     def lookup(self, package_id):
         """
         Looks up a package by its ID number and returns its package info.
-        First the bucket index for the given package_id is computed, then we retrieve
-        the bucket, which is a list of pairs (key, package). We then loop through each pair
-        in the bucket and compare the stored key to the package id. If a matching key is found
-        we return the package info. If no match is found, None is returned.
-        """
-        bucket_index = self._hash_function(package_id)
-        bucket = self.buckets_list[bucket_index]
-        for key, package in bucket:
-            if key == package_id:
-                return package
+        First the starting slot for the given package_id is computed, then we probe
+        the following slots until the key or an empty slot is found. If a matching key
+        is found we return the package info. If no match is found, None is returned.
+        """
+        index, found = self._find_slot(package_id)
+        if found:
+            return self.values_list[index]
         return None
 
+    def update(self, package_id, package):
+        """
+        Replaces the package info for a package id already in the table.
+        Returns True if the package id was found and updated, otherwise False.
+        """
+        index, found = self._find_slot(package_id)
+        if found:
+            self.values_list[index] = package
+        return found
+
+    def delete(self, package_id):
+        """
+        Removes a package id from the table and returns its package info, or None if
+        it was not found. The slot is marked deleted rather than emptied so lookups
+        for keys further along the probe run still find them.
+        """
+        index, found = self._find_slot(package_id)
+        if not found:
+            return None
+        package = self.values_list[index]
+        self.keys_list[index] = _DELETED
+        self.values_list[index] = None
+        self.count -= 1
+        return package
 
+    def items(self):
+        """
+        Yields every (package id, package) pair in the table in slot order.
+        """
+        for key, package in zip(self.keys_list, self.values_list):
+            if key is not _EMPTY and key is not _DELETED:
+                yield key, package
 
+    def __len__(self):
+        """
+        Returns the number of packages in the table.
+        """
+        return self.count
 
+    def __iter__(self):
+        """
+        Iterates over every package id in the table in slot order.
+        """
+        for key, _ in self.items():
+            yield key
 
+    def __contains__(self, package_id):
+        """
+        Returns True if the package id is in the table.
+        """
+        return self._find_slot(package_id)[1]
@@ -0,0 +1,420 @@
+from datetime import timedelta
+
+from eventSimulation import FleetSimulation, Leg, TruckState
+from packageClass import STATUS_NAMES, STATUS_UNMATCHED
+from truckClass import Truck
+
+
+class IncrementalSimulation(FleetSimulation):
+    """
+    Fleet simulation that takes changes after it has run, for live dispatch updates.
+
+    run() simulates the fleet as usual while every truck records its legs. A change then
+    takes effect at a time T: an address update, a newly arrived package or a truck breakdown.
+    Only the trucks the change touches are routed again. A truck that left the hub before T
+    keeps every leg it started before T, finishes the leg it is on, and continues from that
+    stop with the same nearest stop rule. Trucks that leave later with a driver freed by a
+    touched truck move in time with it. Their routes do not depend on the clock, so their
+    recorded legs are shifted instead of replayed.
+
+    Changes have to come in time order, a change is never earlier than the one before it.
+    """
+    def __init__(self, distance_matrix, package_table, address_map, driver_count, hub_index=0,
+                 integer_clock=False):
+        super().__init__(distance_matrix, package_table, address_map, driver_count, hub_index, integer_clock)
+        #Event queue time of the latest change
+        self.last_change = None
+
+    def add_truck(self, truck):
+        """
+        Adds a truck to the fleet, see FleetSimulation.add_truck.
+        """
+        super().add_truck(truck)
+        self._track(self.truck_states[-1])
+        return truck
+
+    def _track(self, state):
+        """
+        Adds the change tracking fields to a TruckState.
+        """
+        state.broken = False
+        #Stop where packages not yet on the truck are collected, their ids, and the
+        # position of the leg that reached that stop once they are collected
+        state.collect_index = None
+        state.collect_ids = []
+        state.collected_on = None
+
+    def update_address(self, package_id, new_address, time):
+        """
+        Changes a package's delivery address at time and reroutes the truck carrying it.
+
+        :param package_id: Package to change.
+        :param new_address: Street address as it appears in the address map.
+        :param time: Datetime the new address becomes known.
+        :raises ValueError: If the package is not on a truck or was delivered before time.
+        :return: Ids of the trucks whose legs changed.
+        """
+        cut = self._start_change(time)
+        state = self.package_trucks.get(package_id)
+        if state is None:
+            raise ValueError(f"Package {package_id} is not on a truck")
+        if package_id not in self._remaining_ids(state, cut):
+            raise ValueError(f"Package {package_id} was delivered before the address update")
+        state.packages[package_id].address = new_address
+        state.packages[package_id].location_index = None
+        return self._resimulate(cut, {state})
+
+    def add_package(self, package, time, truck_id=None):
+        """
+        Adds a package that arrives at the depot at time.
+
+        A truck that has not left the hub yet waits for the package and takes it. A truck
+        that is on its route finishes its current leg, drives back to the hub to load it and
+        then goes on with its remaining stops.
+
+        :param package: New Package object, it is added to the package table.
+        :param time: Datetime the package arrives at the depot.
+        :param truck_id: Truck to load it on. By default the first truck to leave the hub
+            after time that still has room.
+        :raises ValueError: If the package id is taken, the truck already finished its route,
+            or no truck is left at the hub with room.
+        :return: Ids of the trucks whose legs changed.
+        """
+        cut = self._start_change(time)
+        if package.package_id in self.package_table:
+            raise ValueError(f"Package {package.package_id} is already in the package table")
+
+        if truck_id is None:
+            waiting = [
+                state for state in self.truck_states
+                if not state.broken and not self._departed_before(state, cut)
+                and len(state.packages) < state.truck.capacity
+            ]
+            if not waiting:
+                raise ValueError("No truck with room is left at the hub, pass a truck_id")
+            state = min(waiting, key=lambda waiting_state: (waiting_state.ready_time, waiting_state.ready_sequence))
+        else:
+            state = self._state_of(truck_id)
+            if self._finished_before(state, cut):
+                raise ValueError(f"Truck {truck_id} finished its route before the package arrived")
+
+        self.package_table.insert(package.package_id, package)
+        state.packages[package.package_id] = package
+        state.truck.package_ids.append(package.package_id)
+        self.package_trucks[package.package_id] = state
+        if self._departed_before(state, cut):
+            #Loaded when the truck is back at the hub
+            state.collect_index = self.hub_index
+            state.collect_ids.append(package.package_id)
+            state.collected_on = None
+        else:
+            state.ready_time = max(state.ready_time, cut)
+        return self._resimulate(cut, {state})
+
+    def break_down(self, truck_id, time, rescue_truck_id=None):
+        """
+        Breaks a truck down at time and sends a rescue truck for its packages.
+
+        The distance matrix only knows stops, so a truck on the road limps to the stop it is
+        driving to, delivers there and stays. Its driver stays with it. A rescue truck then
+        leaves the hub with the next free driver, collects the remaining packages at that
+        stop and delivers them. A truck that has not left the hub yet never leaves, the
+        rescue truck takes its packages straight from the hub.
+
+        :param truck_id: Truck that breaks down.
+        :param time: Datetime of the breakdown.
+        :param rescue_truck_id: Id for the rescue truck, one past the highest truck id by default.
+        :raises ValueError: If the truck already finished its route.
+        :return: The rescue Truck and the ids of the trucks whose legs changed.
+        """
+        cut = self._start_change(time)
+        state = self._state_of(truck_id)
+        if self._finished_before(state, cut):
+            raise ValueError(f"Truck {truck_id} finished its route before the breakdown")
+
+        departed = self._departed_before(state, cut)
+        remaining = self._truncate(state, cut) if departed else list(state.packages)
+        state.broken = True
+        if not departed:
+            self._clear_route(state)
+            self._set_truck_time(state.truck, cut)
+
+        if rescue_truck_id is None:
+            rescue_truck_id = max(truck.truck_id for truck in self.trucks) + 1
+        rescue = Truck(rescue_truck_id, remaining, self._to_datetime(cut))
+        if self.integer_clock:
+            rescue.use_integer_clock(self.day)
+        rescue_packages = {package_id: state.packages.pop(package_id) for package_id in remaining}
+        state.truck.package_ids = [package_id for package_id in state.truck.package_ids if package_id in state.packages]
+
+        rescue_state = TruckState(rescue, rescue_packages, self.address_map, self.hub_index)
+        self._track(rescue_state)
+        rescue_state.start_reached = True
+        rescue_state.ready_time = max(cut, state.ready_time)
+        rescue_state.ready_sequence = self.ready_count
+        self.ready_count += 1
+        if departed:
+            #Collects the packages at the stop the broken truck reached, they are already en route
+            rescue_state.collect_index = state.truck.current_location
+            rescue_state.collect_ids = list(remaining)
+        self.trucks.append(rescue)
+        self.truck_states.append(rescue_state)
+        for package_id in remaining:
+            self.package_trucks[package_id] = rescue_state
+        #Until the rescue truck is routed its packages wait where the broken truck left them
+        self._reset_packages(rescue_state)
+
+        touched = self._resimulate(cut, {rescue_state})
+        if departed and truck_id not in touched:
+            touched.insert(0, truck_id)
+        return rescue, touched
+
+    def _start_change(self, time):
+        """
+        Converts the time of a change to an event queue time and checks changes stay in order.
+        """
+        cut = self._event_time(time)
+        if self.last_change is not None and cut < self.last_change:
+            raise ValueError("Changes have to be applied in time order")
+        self.last_change = cut
+        return cut
+
+    def _state_of(self, truck_id):
+        """
+        Returns the TruckState of the truck with truck_id.
+        """
+        for state in self.truck_states:
+            if state.truck.truck_id == truck_id:
+                return state
+        raise ValueError(f"No truck {truck_id} in the simulation")
+
+    def _departed_before(self, state, cut):
+        """
+        True if the truck left the hub before cut.
+        """
+        return state.depart_time is not None and state.depart_time < cut
+
+    def _finished_before(self, state, cut):
+        """
+        True if the truck was back at the hub with its route done before cut.
+        """
+        if not self._departed_before(state, cut):
+            return False
+        return not state.legs or state.legs[-1].arrive < cut
+
+    def _stop_of(self, package):
+        """
+        Returns the address index a package is delivered to, None when it matches no location.
+        """
+        return self.address_map.index_of(package)
+
+    def _remaining_ids(self, state, cut):
+        """
+        Returns the ids of the truck's packages not delivered before cut, in truck order.
+        """
+        delivered = set()
+        for leg in state.legs:
+            if leg.arrive < cut:
+                delivered.update(leg.package_ids)
+        return [package_id for package_id in state.packages if package_id not in delivered]
+
+    def _truncate(self, state, cut):
+        """
+        Drops every leg the truck starts at or after cut and puts the truck at the end of
+        the leg it is on. Deliveries at that stop are worked out again from the current
+        addresses since they happen after the change.
+        :return: Ids of the packages still to be delivered.
+        """
+        legs = state.legs
+        keep = 0
+        while keep < len(legs) and legs[keep].depart < cut:
+            keep += 1
+        del legs[keep:]
+        state.truck.leg_log.truncate(keep)
+        if state.collected_on is not None and state.collected_on >= len(legs):
+            state.collected_on = None
+
+        remaining = self._remaining_ids(state, cut)
+        if legs and legs[-1].arrive >= cut:
+            last = legs[-1]
+            on_truck = [
+                package_id for package_id in remaining
+                if package_id not in state.collect_ids or state.collected_on is not None
+            ]
+            last.package_ids[:] = [
+                package_id for package_id in on_truck
+                if self._stop_of(state.packages[package_id]) == last.to_index
+            ]
+            delivery_time = self._to_datetime(last.arrive)
+            for package_id in last.package_ids:
+                state.packages[package_id].update_status("Delivered", delivery_time)
+            remaining = [package_id for package_id in remaining if package_id not in last.package_ids]
+
+        truck = state.truck
+        if legs:
+            truck.current_location = legs[-1].to_index
+            self._set_truck_time(truck, legs[-1].arrive)
+            truck.mileage = legs[-1].mileage
+        else:
+            truck.current_location = self.hub_index
+            self._set_truck_time(truck, state.depart_time)
+            truck.mileage = 0.0
+        return remaining
+
+    def _reset_packages(self, state):
+        """
+        Forgets the deliveries of a truck's packages. Packages waiting at a stop on the road
+        stay en route since they left the hub, every other package is back at the hub.
+        """
+        on_road = state.collect_index is not None and state.collect_index != self.hub_index
+        for package_id, package in state.packages.items():
+            if self._stop_of(package) is None:
+                package.status, package.depart_time, package.delivery_time = STATUS_NAMES[STATUS_UNMATCHED], None, None
+            elif on_road and package_id in state.collect_ids:
+                package.status, package.delivery_time = "En Route", None
+            else:
+                package.status, package.depart_time, package.delivery_time = "At Hub", None, None
+
+    def _clear_route(self, state):
+        """
+        Forgets a truck's run, it is back at the hub and has not left.
+        """
+        state.legs = []
+        state.truck.leg_log.truncate(0)
+        state.depart_time = None
+        state.truck.current_location = self.hub_index
+        state.truck.mileage = 0.0
+
+    def _replay(self, state, cut, depart):
+        """
+        Routes a truck again. A truck that left before cut continues from the end of the leg
+        it is on, any other truck starts over from the hub at depart.
+        """
+        truck = state.truck
+        if self._departed_before(state, cut):
+            remaining = self._truncate(state, cut)
+        else:
+            self._clear_route(state)
+            if state.collect_index == self.hub_index:
+                state.collect_index = None
+                state.collect_ids = []
+            state.collected_on = None
+            state.depart_time = depart
+            self._set_truck_time(truck, depart)
+            remaining = list(state.packages)
+            #Everything but packages collected on the road leaves the hub now
+            depart_time = self._to_datetime(depart)
+            for package_id in remaining:
+                if package_id not in state.collect_ids and self._stop_of(state.packages[package_id]) is not None:
+                    state.packages[package_id].update_status("En Route", depart_time)
+
+        if state.collect_index is not None and state.collected_on is None:
+            if truck.current_location != state.collect_index:
+                self._drive_leg(state, state.collect_index, [])
+            state.collected_on = len(state.legs) - 1
+            if state.collect_index == self.hub_index:
+                load_time = self._to_datetime(self._truck_time(truck))
+                for package_id in state.collect_ids:
+                    state.packages[package_id].update_status("En Route", load_time)
+
+        positions = {package_id: position for position, package_id in enumerate(state.packages)}
+        stop_packages = {}
+        stop_order = {}
+        for package_id in remaining:
+            index = self._stop_of(state.packages[package_id])
+            if index is None:
+                #Left at the hub, its address matches no location
+                package = state.packages[package_id]
+                package.status, package.depart_time, package.delivery_time = STATUS_NAMES[STATUS_UNMATCHED], None, None
+                continue
+            if index not in stop_packages:
+                stop_packages[index] = []
+                stop_order[index] = positions[package_id]
+            stop_packages[index].append(package_id)
+
+        while stop_packages:
+            current_row = self.distance_matrix[truck.current_location]
+            next_index = min(stop_packages, key=lambda index: (current_row[index], stop_order[index]))
+            self._drive_leg(state, next_index, stop_packages.pop(next_index))
+        if truck.current_location != self.hub_index:
+            self._drive_leg(state, self.hub_index, [])
+
+    def _drive_leg(self, state, next_index, package_ids):
+        """
+        Drives the truck to next_index, records the leg and delivers package_ids there.
+        """
+        truck = state.truck
+        from_index = truck.current_location
+        depart_time = self._truck_time(truck)
+        arrive_time = truck.drive_simulation(next_index, float(self.distance_matrix[from_index][next_index]))
+        state.legs.append(Leg(from_index, next_index, depart_time, arrive_time, truck.mileage, list(package_ids)))
+        delivery_time = self._to_datetime(arrive_time)
+        for package_id in package_ids:
+            state.packages[package_id].update_status("Delivered", delivery_time)
+
+    def _shift(self, state, depart):
+        """
+        Moves an unchanged route to a new departure time.
+        """
+        delta = depart - state.depart_time
+        state.legs = [leg._replace(depart=leg.depart + delta, arrive=leg.arrive + delta) for leg in state.legs]
+        state.truck.leg_log.shift(delta if self.integer_clock else delta // timedelta(microseconds=1))
+        state.depart_time = depart
+        depart_time = self._to_datetime(depart)
+        for package_id, package in state.packages.items():
+            if package_id not in state.collect_ids and self._stop_of(package) is not None:
+                package.update_status("En Route", depart_time)
+        for leg in state.legs:
+            delivery_time = self._to_datetime(leg.arrive)
+            for package_id in leg.package_ids:
+                state.packages[package_id].update_status("Delivered", delivery_time)
+        self._set_truck_time(state.truck, state.legs[-1].arrive if state.legs else depart)
+
+    def _resimulate(self, cut, changed):
+        """
+        Hands out drivers again in the order trucks became ready, like the DriverPool does
+        in run(), replays the changed trucks and shifts trucks whose departure moved.
+        :param changed: Set of TruckStates whose packages changed.
+        :return: Ids of the trucks whose legs changed.
+        """
+        ready_states = sorted(
+            (state for state in self.truck_states if state.ready_time is not None),
+            key=lambda state: (state.ready_time, state.ready_sequence),
+        )
+        #Time each driver is free again, None for a driver that has not driven yet
+        free_times = [None] * self.driver_count
+        touched = []
+        for state in ready_states:
+            departed = self._departed_before(state, cut)
+            if state.broken and not departed:
+                continue
+            if not free_times:
+                #Every driver is stuck with a broken truck, the truck never leaves
+                if state.depart_time is not None:
+                    self._clear_route(state)
+                    touched.append(state.truck.truck_id)
+                self._reset_packages(state)
+                continue
+
+            slot = free_times.index(None) if None in free_times else min(
+                range(len(free_times)), key=free_times.__getitem__
+            )
+            if departed:
+                depart = state.depart_time
+            else:
+                free_time = free_times[slot]
+                depart = state.ready_time if free_time is None else max(state.ready_time, free_time)
+
+            if state in changed or (not departed and state.depart_time is None):
+                self._replay(state, cut, depart)
+                touched.append(state.truck.truck_id)
+            elif not departed and depart != state.depart_time:
+                self._shift(state, depart)
+                touched.append(state.truck.truck_id)
+
+            if state.broken:
+                #The driver stays with the broken truck
+                del free_times[slot]
+            else:
+                free_times[slot] = state.legs[-1].arrive if state.legs else state.depart_time
+        return touched
@@ -0,0 +1,241 @@
+"""
+Opt in counters, timers and profiling for the simulator's hot paths.
+
+Instrumentation is off by default. Stage functions are wrapped with @timed, which costs one
+flag check per call while disabled. The per call hot paths, HashTable.lookup and
+Truck.drive_simulation, are only wrapped while instrumentation is enabled, so they cost
+nothing when it is off. Results export to JSON or to a Chrome trace file that can be opened
+in chrome://tracing or Perfetto.
+
+    python instrumentation.py --stats stats.json --trace trace.json
+    python instrumentation.py --profile main.prof --tracemalloc
+"""
+import argparse
+import cProfile
+import functools
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+#True while instrumentation is collecting
+enabled = False
+#Counter name -> count
+counters = {}
+#Timer name -> [total seconds, number of calls]
+timers = {}
+#Recorded stage spans as (name, start seconds, duration seconds) for the trace export
+spans = []
+
+_origin = time.perf_counter()
+#(owner, attribute name, original) for every method patched by enable()
+_patched = []
+
+
+def count(name, amount=1):
+    """
+    Adds amount to the named counter.
+    """
+    counters[name] = counters.get(name, 0) + amount
+
+
+@contextmanager
+def timer(name):
+    """
+    Times the block under the named timer and records it as a span.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        totals = timers.setdefault(name, [0.0, 0])
+        totals[0] += duration
+        totals[1] += 1
+        spans.append((name, start - _origin, duration))
+
+
+def timed(name):
+    """
+    Decorator that times every call of the function under the named timer while
+    instrumentation is enabled. While disabled the wrapper only checks the flag.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            with timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _patch(owner, attribute, make_wrapper):
+    """
+    Replaces owner.attribute with make_wrapper(original) and remembers the original.
+    """
+    original = getattr(owner, attribute)
+    _patched.append((owner, attribute, original))
+    setattr(owner, attribute, functools.wraps(original)(make_wrapper(original)))
+
+
+def enable():
+    """
+    Starts collecting. Wraps HashTable.lookup to count lookups and Truck.drive_simulation
+    to count legs and time the datetime arithmetic.
+    """
+    global enabled
+    if enabled:
+        return
+    from hashTable import HashTable
+    from truckClass import Truck
+
+    def counted_lookup(original):
+        def lookup(self, package_id):
+            counters["hash_lookups"] = counters.get("hash_lookups", 0) + 1
+            return original(self, package_id)
+        return lookup
+
+    def timed_drive(original):
+        def drive_simulation(self, next_location, distance):
+            start = time.perf_counter()
+            result = original(self, next_location, distance)
+            totals = timers.setdefault("drive_simulation", [0.0, 0])
+            totals[0] += time.perf_counter() - start
+            totals[1] += 1
+            counters["legs_driven"] = counters.get("legs_driven", 0) + 1
+            return result
+        return drive_simulation
+
+    _patch(HashTable, "lookup", counted_lookup)
+    _patch(Truck, "drive_simulation", timed_drive)
+    enabled = True
+
+
+def disable():
+    """
+    Stops collecting and restores every patched method. Collected data is kept.
+    """
+    global enabled
+    while _patched:
+        owner, attribute, original = _patched.pop()
+        setattr(owner, attribute, original)
+    enabled = False
+
+
+def reset():
+    """
+    Clears every counter, timer and span.
+    """
+    counters.clear()
+    timers.clear()
+    spans.clear()
+
+
+def snapshot():
+    """
+    Returns the collected counters and timers as a JSON ready dictionary.
+    """
+    return {
+        "counters": dict(counters),
+        "timers": {
+            name: {"total_seconds": total, "calls": calls, "mean_seconds": total / calls if calls else 0.0}
+            for name, (total, calls) in timers.items()
+        },
+    }
+
+
+def export_json(path):
+    """
+    Writes the counters and timers to a JSON file.
+    """
+    with open(path, mode='w', encoding='utf-8') as json_file:
+        json.dump(snapshot(), json_file, indent=2)
+
+
+def export_chrome_trace(path):
+    """
+    Writes the recorded spans as complete events, and the counters as counter events,
+    in the Chrome trace event format.
+    """
+    process_id = os.getpid()
+    events = [
+        {"name": name, "ph": "X", "ts": start * 1e6, "dur": duration * 1e6, "pid": process_id, "tid": 0}
+        for name, start, duration in spans
+    ]
+    end = (time.perf_counter() - _origin) * 1e6
+    events.extend(
+        {"name": name, "ph": "C", "ts": end, "pid": process_id, "args": {name: value}}
+        for name, value in counters.items()
+    )
+    with open(path, mode='w', encoding='utf-8') as trace_file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+
+
+def run_main(stats_path=None, trace_path=None, profile_path=None, trace_memory=False, interactive=False):
+    """
+    Runs main.py with instrumentation enabled, optionally under cProfile and tracemalloc.
+
+    :param stats_path: Write counters and timers as JSON here.
+    :param trace_path: Write a Chrome trace here.
+    :param profile_path: Write cProfile stats here, readable with pstats or snakeviz.
+    :param trace_memory: Report the peak traced memory and the top allocation sites.
+    :param interactive: Open the user interface after the simulation.
+    """
+    import main
+
+    reset()
+    enable()
+    profiler = cProfile.Profile() if profile_path else None
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        if profiler:
+            profiler.enable()
+        with timer("main"):
+            main.main(interactive=interactive)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+        disable()
+
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        #Leaves out the profiler's and the import system's own allocations
+        memory_snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, cProfile.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+        top_stats = memory_snapshot.statistics("lineno")[:10]
+        tracemalloc.stop()
+        print(f"Peak traced memory: {peak / (1024 * 1024):.2f} MB")
+        for stat in top_stats:
+            print(f"  {stat}")
+
+    for name, value in sorted(counters.items()):
+        print(f"{name:<28}{value:>12}")
+    for name, (total, calls) in sorted(timers.items()):
+        print(f"{name:<28}{total:>12.6f} s  {calls} calls")
+
+    if stats_path:
+        export_json(stats_path)
+    if trace_path:
+        export_chrome_trace(trace_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run main.py with instrumentation enabled.")
+    parser.add_argument("--stats", help="Write counters and timers as JSON to this file.")
+    parser.add_argument("--trace", help="Write a Chrome trace to this file.")
+    parser.add_argument("--profile", help="Write cProfile stats to this file.")
+    parser.add_argument("--tracemalloc", action="store_true", help="Report peak memory and top allocations.")
+    parser.add_argument("--interactive", action="store_true", help="Open the user interface after the run.")
+    args = parser.parse_args()
+    #The simulator modules import this file as "instrumentation", run through that module
+    # rather than __main__ so they all share one enabled flag and one set of counters
+    import instrumentation
+    instrumentation.run_main(args.stats, args.trace, args.profile, args.tracemalloc, args.interactive)
@@ -1,13 +1,18 @@
 from datetime import datetime
 
+from statusQuery import StatusIndex
 
-def user_interface(package_table, trucks):
+
+def user_interface(package_table, trucks, status_index=None):
     """
     Interface to view WGUPS program, displays summerized and detailed package
     information at a specific time. Also displays truck milage information.
 
     :param package_table: Hash table of packages
     :param trucks: List of trucks
+    :param status_index: Answers the menu queries, a StatusIndex of package_table and trucks
+        by default. An open simulationSnapshot.Snapshot answers them from the saved day,
+        package_table and trucks are not needed then.
     """
     def prompt_time():
         """
@@ -20,17 +25,18 @@ def user_interface(package_table, trucks):
             except ValueError:
                 print("Invalid time, please try again, use HH:MM AM/PM")
 
+    #Precomputed package -> truck and time indexes, answers every menu query
+    if status_index is None:
+        status_index = StatusIndex(package_table, trucks)
+
     def get_truck_assignment(package_id):
         """
-        Retrieves the truck assignment for a given package id
+        Retrieves the truck assignment for a given package id from the status index
 
         :param package_id: package id
         :return: String , "Truck.."
         """
-        for truck in trucks:
-            if package_id in truck.package_ids:
-                return f"Truck {truck.truck_id}"
-        return None
+        return status_index.truck_assignment(package_id)
 
     #def print_cute_truck_image():
         truck = r"""
@@ -44,14 +50,8 @@ def user_interface(package_table, trucks):
         """
        #print(truck)"
 
-    #Builds the list of package ids by reading from the hashtable
-    package_ids = sorted(
-        package_id
-        for bucket in getattr(package_table, "buckets_list", [])
-        for package_id, _ in bucket
-    )
-    if not package_ids:
-        package_ids = list(range(1, 41))
+    #Sorted list of package ids from the hashtable
+    package_ids = status_index.package_ids
 
     #Main menu
     while True:
@@ -69,31 +69,26 @@ def user_interface(package_table, trucks):
             check_time = prompt_time()
             print()
             print(f"Package Status Summary as of {check_time.strftime('%I:%M %p')}:")
-            for package_id in package_ids:
-                package = package_table.lookup(package_id)
-                if not package:
-                    continue
+            for package_id, status in zip(package_ids, status_index.statuses_at(check_time)):
                 truck_assignment = get_truck_assignment(package_id)
-                status = package.get_status_at(check_time)
-                if status == "At Hub":
+                if status in ("At Hub", "Unmatched address"):
                     location = "(At Hub)"
                 elif status.startswith("Delivered"):
                     location = "(Delivered)"
                 else:
                     location = f"({truck_assignment})" if truck_assignment else "(En Route)"
                 print(f"Package {package_id:<2}: {status:<25}{location}")
+            counts = status_index.counts_at(check_time)
+            print(", ".join(f"{status}: {count}" for status, count in counts.items()))
 
         #Shows detailed package information
         elif choice == "2":
             check_time = prompt_time()
             print()
             print(f"Detailed Package Information as of {check_time.strftime('%I:%M %p')}:")
-            for package_id in package_ids:
-                package = package_table.lookup(package_id)
-                if not package:
-                    continue
-                truck_assignment = get_truck_assignment(package_id) or "N/A"
-                status = package.get_status_at(check_time)
+            statuses = status_index.statuses_at(check_time)
+            for package, status in zip(status_index.packages, statuses):
+                truck_assignment = get_truck_assignment(package.package_id) or "N/A"
                 departed_display = (
                     package.depart_time.strftime('%I:%M %p')
                     if package.depart_time and check_time >= package.depart_time
@@ -119,7 +114,7 @@ def user_interface(package_table, trucks):
 
         #Shows total mileage for all trucks
         elif choice == "3":
-            total_miles = sum(truck.mileage for truck in trucks)
+            total_miles = status_index.total_mileage
             print()
             print(f"Total Mileage For All Trucks: {total_miles:.2f} miles")
 
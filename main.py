@@ -1,63 +1,131 @@
 #STUDENT ID: 011918336
 
-from csvDistanceFileReader import load_distance_data, make_square_matrix
+import argparse
+import os
+
+from csvDistanceFileReader import load_distance_matrix
 from csvPackageFileReader import load_packages
-from deliveryLogic import deliver_packages
+from eventSimulation import FleetSimulation
 from truckClass import Truck
 from datetime import datetime
 from interface import user_interface
+from simulationSnapshot import load_snapshot, save_snapshot, source_hashes
 """
 Main file to run entire delivery simulation from start to finish, also launches the 
 user interface to display package and truck information.
 
 Here we load distance and package data from our CS files, build the full distance matrix and package hashtable.
 We manually assign package IDs to the three trucks, trucks objects get created at a given start time.
-First truck 1 and truck 2 are simulated, truck 3 runs after truck 1 or truck 2 finishes its deliveries.
-Truck 3 now gets simulated.  
+The fleet is simulated by one event queue with two drivers. Truck 1 and truck 2 leave at 8am,
+truck 3 is held at the hub until its delayed packages and the package 9 address correction arrive,
+then leaves with the first free driver.
+
+With a snapshot path the finished day is saved to a binary snapshot, and later runs open
+the snapshot instead of simulating again, as long as both CSVs are unchanged.
 """
-#Loads the distanc data and makes distance matrix square
-distance_matrix, addresses, address_map = load_distance_data('wgupsDistanceFile.csv')
-distance_matrix = make_square_matrix(distance_matrix)
-
-#Loads all package into a hashtable by package id
-package_table = load_packages('wgupsPackageFile.csv')
-
-#Assign packages to trucks, based on the project's given constraints
-truck1_packages = [1, 4, 7, 13, 14, 15, 16, 19, 20, 29, 30, 31, 34, 37, 39, 40]
-truck2_packages = [2, 3, 5, 8, 10, 11, 12, 17, 18, 21, 23 ,24, 27, 33, 36, 38]
-truck3_packages = [6, 9, 22, 26, 25, 28, 32, 35]
-
-#Sets a universal time for when trucks leave the hub, project constraint
-start_time = datetime.strptime("08:00", "%H:%M")
-
-#Creates Truck objects with their assigned package and start time
-truck1 = Truck(1, truck1_packages, start_time)
-truck2 = Truck(2, truck2_packages, start_time)
-truck3 = Truck(3, truck3_packages, start_time)
-
-#Delivers packages for truck 1 & 2, both start at 8am and run full route
-deliver_packages(truck1, distance_matrix, package_table, address_map, addresses)
-deliver_packages(truck2, distance_matrix, package_table, address_map, addresses)
-
-#determine first available driver to simulate driving truck 3
-deliver_available_time = min(truck1.current_time, truck2.current_time)
-
-#Corrects for package 9 dilemma
-#Truck 3 will be held until a driver is free
-# and the address correction time has been reached
-address_correction_time = datetime.combine(
-    deliver_available_time.date(),
-    datetime.strptime("10:20", "%H:%M").time()
+
+DISTANCE_FILE = 'wgupsDistanceFile.csv'
+PACKAGE_FILE = 'wgupsPackageFile.csv'
+
+#Simulation settings, stored in snapshots so a saved day is only reused for the same run
+START_TIME = "08:00"
+DRIVER_COUNT = 2
+ADDRESS_CORRECTION_TIME = "10:20"
+
+#Package ids loaded on trucks 1, 2 and 3, based on the project's given constraints
+TRUCK_PACKAGES = (
+    (1, 4, 7, 13, 14, 15, 16, 19, 20, 29, 30, 31, 34, 37, 39, 40),
+    (2, 3, 5, 8, 10, 11, 12, 17, 18, 21, 23, 24, 27, 33, 36, 38),
+    (6, 9, 22, 26, 25, 28, 32, 35),
 )
 
-#Set the third trucks departure time so its not earlier than
-# the available driver time or 10:20am
-if deliver_available_time < address_correction_time:
-    deliver_available_time = address_correction_time
-truck3.current_time = deliver_available_time
 
-#Simulates truck 3 delivering packages
-deliver_packages(truck3, distance_matrix, package_table, address_map, addresses)
+def _snapshot_sources():
+    """
+    Returns the source_hashes of the CSV files and simulation settings for snapshots.
+    """
+    parameters = {
+        "truck_packages": TRUCK_PACKAGES,
+        "start_time": START_TIME,
+        "drivers": DRIVER_COUNT,
+        "address_correction_time": ADDRESS_CORRECTION_TIME,
+    }
+    return source_hashes(DISTANCE_FILE, PACKAGE_FILE, parameters=parameters)
+
+
+def main(interactive=True, snapshot_path=None):
+    #Opens the saved day when its snapshot was made from the current CSV files and settings,
+    # an unreadable or outdated snapshot is simulated again and overwritten
+    if snapshot_path and os.path.exists(snapshot_path):
+        try:
+            snapshot = load_snapshot(snapshot_path)
+        except ValueError as error:
+            print(f"Simulating again: {error}")
+            snapshot = None
+        if snapshot is not None:
+            if snapshot.matches(_snapshot_sources()):
+                if interactive:
+                    user_interface(None, None, status_index=snapshot)
+                snapshot.close()
+                return
+            snapshot.close()
+
+    #Loads the square distance matrix, reusing the memory mapped cache after the first run
+    #Full float64 precision keeps delivery timestamps identical to the nested list matrix
+    distance_matrix, addresses, address_map = load_distance_matrix(DISTANCE_FILE, dtype="float64")
+
+    #Loads all package into a hashtable by package id
+    package_table = load_packages(PACKAGE_FILE)
+
+    #Resolves every package address to its distance matrix index once, reporting the
+    # addresses that match no location, those packages stay at the hub as "Unmatched address"
+    address_map.resolve_packages(package for _, package in package_table.items())
+    for line in address_map.unmatched_report():
+        print(line)
+
+    #Assign packages to trucks, based on the project's given constraints
+    truck1_packages, truck2_packages, truck3_packages = (list(package_ids) for package_ids in TRUCK_PACKAGES)
+
+    #Sets a universal time for when trucks leave the hub, project constraint
+    start_time = datetime.strptime(START_TIME, "%H:%M")
+
+    #Corrects for package 9 dilemma
+    #The corrected address comes in at 10:20am, the truck carrying it
+    # is held at the hub until then
+    address_correction_time = datetime.combine(
+        start_time.date(),
+        datetime.strptime(ADDRESS_CORRECTION_TIME, "%H:%M").time()
+    )
+
+    #Creates Truck objects with their assigned package and start time
+    truck1 = Truck(1, truck1_packages, start_time)
+    truck2 = Truck(2, truck2_packages, start_time)
+    truck3 = Truck(3, truck3_packages, start_time)
+
+    #Simulates all trucks with two drivers, truck 3 waits for a free driver
+    #The integer clock gives the same times to the microsecond without datetime math per leg
+    simulation = FleetSimulation(distance_matrix, package_table, address_map, driver_count=DRIVER_COUNT, integer_clock=True)
+    for truck in (truck1, truck2, truck3):
+        simulation.add_truck(truck)
+    wrong_address_ids = [
+        package_id for package_id, package in package_table.items() if package.constraints.address_correction
+    ]
+    simulation.add_address_correction(address_correction_time, wrong_address_ids)
+    trucks = simulation.run()
+
+    if snapshot_path:
+        save_snapshot(
+            snapshot_path, package_table, trucks, simulation.day or datetime(1900, 1, 1),
+            _snapshot_sources(),
+        )
+
+    #Displays user interface, skipped for headless runs such as profiling
+    if interactive:
+        user_interface(package_table, trucks)
+
 
-#Displays user interface
-user_interface(package_table, [truck1, truck2, truck3])
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the WGUPS delivery simulation.")
+    parser.add_argument("--snapshot", help="Save the finished day to this file, or open it if it is already saved.")
+    args = parser.parse_args()
+    main(snapshot_path=args.snapshot)
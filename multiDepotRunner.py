@@ -0,0 +1,377 @@
+"""
+Streaming multi depot, multi day simulation.
+
+Reads a sequence of daily manifests and simulates every depot for every day. Each package
+goes to the depot nearest its address, packages that must be delivered together follow
+the first of them. Days run in order because undelivered packages carry over: packages
+that do not fit on a depot's trucks that day, or that its fleet could not be assigned,
+are delivered first on the next day. Packages that need a truck the depot does not have
+are recorded as undeliverable with the problem instead of carried. Within a day the depots are simulated concurrently
+in worker processes that share the distance matrix.
+
+Only the current day's manifest and the carried over packages are in memory. Each depot
+writes its day's package records to disk as soon as it is done, and the summary table
+gets one row per depot and day as days complete, so history of any length runs in one
+command.
+
+    python multiDepotRunner.py depots.json --output-dir history --workers 8
+
+A depot file lists the distance file, the manifests in day order, the first date and
+the depots, each with its hub address and any settings it changes from the defaults:
+
+    {
+      "distance_file": "wgupsDistanceFile.csv",
+      "manifests": ["wgupsPackageFile.csv", "wgupsPackageFile.csv"],
+      "start_date": "2024-03-04",
+      "defaults": {"trucks": 3, "drivers": 2, "start_time": "08:00"},
+      "depots": [
+        {"name": "south", "hub": "4001 South 700 East"},
+        {"name": "murray", "hub": "5025 State St", "trucks": 2}
+      ]
+    }
+
+Packages whose address matches no location are not delivered, they are recorded under
+"unmatched" for their day.
+
+Depot settings are the scenarioRunner settings, packages are always assigned to trucks
+automatically. Package ids are only unique within a manifest, so every package id is
+stored as day number * DAY_ID_STRIDE + its manifest id, the records list both parts.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from csvDistanceFileReader import load_distance_matrix
+from csvPackageFileReader import iter_package_batches
+from packageAssignment import group_packages
+from resultsExport import FORMATS, write_records
+from scenarioRunner import DEFAULT_SETTINGS, simulate
+from truckClass import TRUCK_CAPACITY
+
+#Package ids of day N are N * DAY_ID_STRIDE + the id in that day's manifest
+DAY_ID_STRIDE = 10 ** 7
+#Columns of the per depot, per day package records
+DEPOT_PACKAGE_COLUMNS = (
+    ("manifest_day", "q"), ("manifest_id", "q"), ("address", "str"), ("deadline_minutes", "q"),
+    ("carried_days", "q"), ("truck_id", "q"), ("depart_time", "str"), ("delivery_time", "str"),
+    ("on_time", "b"), ("problem", "str"),
+)
+#Depot name of the records and summary rows of packages whose address matches no location
+UNMATCHED = "unmatched"
+#Columns of the summary table, in order
+SUMMARY_COLUMNS = (
+    "date", "depot", "packages", "carried_in", "delivered", "on_time", "carried_over",
+    "undeliverable", "total_mileage", "finish_time", "runtime_seconds", "error",
+)
+
+#Distance data loaded once per process by _load_shared
+_shared = {}
+
+
+def load_depots(depot_file_path):
+    """
+    Reads a depot file.
+    :return: The file's settings dictionary and the list of depots, each merged over the
+        defaults.
+    """
+    with open(depot_file_path, mode='r', encoding='utf-8') as depot_file:
+        settings = json.load(depot_file)
+    defaults = dict(DEFAULT_SETTINGS)
+    defaults.update(settings.get("defaults", {}))
+    depots = []
+    for depot in settings["depots"]:
+        merged = dict(defaults)
+        merged.update(depot)
+        merged["assignment"] = "auto"
+        depots.append(merged)
+    return settings, depots
+
+
+def _load_shared(distance_file):
+    """
+    Loads the distance matrix and address map into _shared, unless this process already
+    has them, such as a worker forked from the parent.
+    """
+    if _shared.get("distance_file") == distance_file:
+        return
+    distance_matrix, _, address_map = load_distance_matrix(distance_file, dtype="float64")
+    _shared.update(distance_file=distance_file, distance_matrix=distance_matrix, address_map=address_map)
+
+
+def _day_packages(manifest_path, day_number):
+    """
+    Reads one day's manifest, giving each package its day qualified id.
+    """
+    offset = day_number * DAY_ID_STRIDE
+    packages = []
+    for batch in iter_package_batches(manifest_path):
+        for package in batch:
+            package.package_id += offset
+            if package.constraints.ship_with:
+                package.constraints = package.constraints._replace(
+                    ship_with=tuple(package_id + offset for package_id in package.constraints.ship_with)
+                )
+            packages.append(package)
+    return packages
+
+
+def partition_packages(packages, hub_indexes, distance_matrix, address_map):
+    """
+    Splits packages between depots, each group of packages delivered together going to
+    the depot nearest the address of its first package.
+
+    :param hub_indexes: Address index of each depot's hub, in depot order.
+    :return: One list of packages per depot, and the packages whose address matched no
+        location, which no depot can deliver.
+    """
+    nearest_depot = {}
+    buckets = [[] for _ in hub_indexes]
+    unmatched = []
+    table = {package.package_id: package for package in packages}
+    for group in group_packages(table):
+        location = address_map.index_of(table[group[0]])
+        if location is None:
+            unmatched.extend(table[package_id] for package_id in group)
+            continue
+        depot = nearest_depot.get(location)
+        if depot is None:
+            row = distance_matrix[location]
+            depot = min(range(len(hub_indexes)), key=lambda position: (row[hub_indexes[position]], position))
+            nearest_depot[location] = depot
+        buckets[depot].extend(table[package_id] for package_id in group)
+    return buckets, unmatched
+
+
+def _select_for_day(packages, truck_count):
+    """
+    Picks the packages that fit on the depot's trucks today: the oldest manifest first,
+    then the earliest deadline. Packages delivered together are picked or left together,
+    and "Can only be on truck N" groups only while truck N has room. Groups needing a truck
+    the depot does not have can never be delivered from it and are set apart.
+    :return: The groups to deliver today as lists of packages, in pick order, the packages
+        to carry over and (package, problem) pairs for the undeliverable ones.
+    """
+    capacity = truck_count * TRUCK_CAPACITY
+    #Room left on each truck, auto assigned trucks are numbered from 1
+    truck_room = {truck_id: TRUCK_CAPACITY for truck_id in range(1, truck_count + 1)}
+    table = {package.package_id: package for package in packages}
+    groups = group_packages(table)
+    groups.sort(key=lambda group: min(
+        (package_id // DAY_ID_STRIDE, table[package_id].deadline_minutes, package_id) for package_id in group
+    ))
+    today = []
+    picked = 0
+    carried = []
+    undeliverable = []
+    for group in groups:
+        members = [table[package_id] for package_id in group]
+        required = sorted({package.constraints.required_truck for package in members} - {None})
+        missing = [truck_id for truck_id in required if truck_id not in truck_room]
+        if missing:
+            problem = f"requires truck {missing[0]}, which is not in the fleet"
+            undeliverable.extend((package, problem) for package in members)
+            continue
+        room = [truck_id for truck_id in required if truck_room[truck_id] >= len(group)]
+        if picked + len(group) > capacity or (required and not room):
+            carried.extend(members)
+            continue
+        if room:
+            truck_room[room[0]] -= len(group)
+        today.append(members)
+        picked += len(group)
+    return today, carried, undeliverable
+
+
+def _record(package, day_number, date, truck_id=-1, problem=""):
+    """
+    Returns the DEPOT_PACKAGE_COLUMNS record of a package and whether it met its deadline.
+    """
+    manifest_day, manifest_id = divmod(package.package_id, DAY_ID_STRIDE)
+    #Deadlines are on the manifest's own day, carried packages are late by now
+    deadline = date - timedelta(days=day_number - manifest_day, minutes=-package.deadline_minutes)
+    met = package.delivery_time is not None and package.delivery_time <= deadline
+    return (
+        manifest_day, manifest_id, package.address, package.deadline_minutes, day_number - manifest_day,
+        truck_id, _format_time(package.depart_time), _format_time(package.delivery_time), int(met), problem,
+    ), met
+
+
+def _format_time(moment):
+    """
+    Formats a datetime for the records, empty for None.
+    """
+    return moment.isoformat(sep=" ") if moment is not None else ""
+
+
+def simulate_depot_day(depot, hub_index, day_number, date, packages, output_path, file_format="csv"):
+    """
+    Simulates one depot for one day and writes its package records to output_path.
+
+    :param depot: Depot settings dictionary.
+    :param hub_index: Address index of the depot's hub.
+    :param day_number: Number of the day, 0 for the first manifest.
+    :param date: Midnight of the day.
+    :param packages: Carried over and new packages for the depot, carried over first.
+    :return: The summary row and the list of packages carried over to the next day.
+    """
+    start = time.perf_counter()
+    summary = dict.fromkeys(SUMMARY_COLUMNS, "")
+    summary.update(
+        date=date.date().isoformat(), depot=depot["name"], packages=len(packages),
+        carried_in=sum(1 for package in packages if package.package_id // DAY_ID_STRIDE < day_number),
+    )
+    groups, carried, undeliverable = _select_for_day(packages, depot["trucks"])
+    simulation = None
+    today = []
+    #Groups that still can not be assigned wait for tomorrow, last picked first, so one
+    # group never holds back the rest of the day. A depot with no packages stays at the hub
+    while groups:
+        today = [package for group in groups for package in group]
+        try:
+            simulation = simulate(depot, _shared["distance_matrix"], _shared["address_map"], today, hub_index, date)
+            break
+        except ValueError as error:
+            summary["error"] = str(error)
+            carried.extend(groups.pop())
+            today = []
+
+    truck_of = {}
+    if simulation is not None:
+        for truck in simulation.trucks:
+            for package_id in truck.package_ids:
+                truck_of.setdefault(package_id, truck.truck_id)
+    on_time = 0
+    records = []
+    for package in today:
+        record, met = _record(package, day_number, date, truck_of.get(package.package_id, -1))
+        on_time += met
+        records.append(record)
+    records.extend(_record(package, day_number, date, problem=problem)[0] for package, problem in undeliverable)
+    write_records(iter(records), output_path, DEPOT_PACKAGE_COLUMNS, file_format)
+
+    delivered = [package for package in today if package.delivery_time is not None]
+    carried.extend(package for package in today if package.delivery_time is None)
+    #Carried packages go back to the hub untouched for tomorrow
+    for package in carried:
+        package.status = "At Hub"
+        package.depart_time = None
+        package.delivery_time = None
+    trucks = simulation.trucks if simulation is not None else []
+    summary.update(
+        delivered=len(delivered),
+        on_time=on_time,
+        carried_over=len(carried),
+        undeliverable=len(undeliverable),
+        total_mileage=round(sum(truck.mileage for truck in trucks), 1),
+        finish_time=max(truck.current_time for truck in trucks).strftime("%H:%M:%S") if trucks else "",
+        runtime_seconds=round(time.perf_counter() - start, 4),
+    )
+    return summary, carried
+
+
+def run_days(depots, manifests, start_date, distance_file, output_dir, max_workers=None, file_format="csv"):
+    """
+    Simulates every depot for every manifest, writing the records under output_dir and
+    the summary to output_dir/summary.csv as days complete.
+
+    :param depots: Depot settings dictionaries, see load_depots.
+    :param manifests: Package CSV paths, one per day in day order.
+    :param start_date: Date of the first manifest.
+    :param max_workers: Number of worker processes, 0 runs every depot in this process.
+    :return: Number of packages still carried over after the last day.
+    """
+    _load_shared(distance_file)
+    address_map = _shared["address_map"]
+    hub_indexes = []
+    for depot in depots:
+        hub_index = address_map.get(depot["hub"])
+        if hub_index is None:
+            raise ValueError(f"Depot {depot['name']!r} hub {depot['hub']!r} matches no location")
+        hub_indexes.append(hub_index)
+        os.makedirs(os.path.join(output_dir, depot["name"]), exist_ok=True)
+
+    executor = None
+    if max_workers != 0:
+        #Forked workers inherit _shared, spawned workers load it once in the initializer
+        start_method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+        executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=_load_shared,
+            initargs=(distance_file,),
+        )
+    carried = [[] for _ in depots]
+    suffix = FORMATS[file_format]
+    try:
+        with open(os.path.join(output_dir, "summary.csv"), mode='w', newline='', encoding='utf-8') as summary_file:
+            writer = csv.DictWriter(summary_file, fieldnames=SUMMARY_COLUMNS)
+            writer.writeheader()
+            for day_number, manifest in enumerate(manifests):
+                date = datetime.combine(start_date + timedelta(days=day_number), datetime.min.time())
+                buckets, unmatched = partition_packages(
+                    _day_packages(manifest, day_number), hub_indexes, _shared["distance_matrix"], address_map
+                )
+                if unmatched:
+                    os.makedirs(os.path.join(output_dir, UNMATCHED), exist_ok=True)
+                    write_records(
+                        (_record(package, day_number, date, problem="address matches no location")[0]
+                         for package in unmatched),
+                        os.path.join(output_dir, UNMATCHED, date.date().isoformat() + suffix),
+                        DEPOT_PACKAGE_COLUMNS, file_format,
+                    )
+                    summary = dict.fromkeys(SUMMARY_COLUMNS, "")
+                    summary.update(
+                        date=date.date().isoformat(), depot=UNMATCHED, packages=len(unmatched),
+                        undeliverable=len(unmatched),
+                    )
+                    writer.writerow(summary)
+                    print(f"{date.date()}: {len(unmatched)} packages match no location", file=sys.stderr)
+                del unmatched
+                tasks = [
+                    (depot, hub_index, day_number, date, carried[position] + buckets[position],
+                     os.path.join(output_dir, depot["name"], date.date().isoformat() + suffix), file_format)
+                    for position, (depot, hub_index) in enumerate(zip(depots, hub_indexes))
+                ]
+                del buckets
+                if executor is None:
+                    results = [simulate_depot_day(*task) for task in tasks]
+                else:
+                    results = list(executor.map(simulate_depot_day, *zip(*tasks)))
+                del tasks
+                for position, (summary, depot_carried) in enumerate(results):
+                    writer.writerow(summary)
+                    carried[position] = depot_carried
+                summary_file.flush()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return sum(len(depot_carried) for depot_carried in carried)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate many depots over a sequence of daily manifests.")
+    parser.add_argument("depot_file", help="JSON depot file.")
+    parser.add_argument("--output-dir", default="history", help="Folder for the records and summary.csv.")
+    parser.add_argument("--workers", type=int, help="Number of worker processes, 0 runs in this process.")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv", help="Format of the package records.")
+    args = parser.parse_args(argv)
+
+    settings, depots = load_depots(args.depot_file)
+    start_date = datetime.strptime(settings.get("start_date", "1900-01-01"), "%Y-%m-%d").date()
+    remaining = run_days(
+        depots, settings["manifests"], start_date, settings.get("distance_file", "wgupsDistanceFile.csv"),
+        args.output_dir, args.workers, args.format,
+    )
+    print(f"Simulated {len(settings['manifests'])} days for {len(depots)} depots, "
+          f"{remaining} packages carried past the last day, see {os.path.join(args.output_dir, 'summary.csv')}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
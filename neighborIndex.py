@@ -0,0 +1,200 @@
+import heapq
+import os
+from array import array
+
+from csvDistanceFileReader import distance_cache_paths
+from distanceProvider import dense_array
+
+#NumPy is optional, without it the index is built row by row with heapq
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#Closest locations kept per location, not counting the location itself
+DEFAULT_NEIGHBOR_COUNT = 16
+#Rows partitioned at once while building, bounds the temporary index arrays
+_BUILD_BLOCK_ROWS = 512
+
+
+class NeighborSearch:
+    """
+    One "nearest unvisited" search over a NeighborIndex, such as one truck's route.
+
+    candidates is the caller's container of locations still to visit, a set or a dict,
+    which the caller removes visited locations from. Each location keeps a cursor into its
+    neighbor list. Entries that are no longer candidates are skipped by moving the cursor
+    past them for good, so every entry is looked at once per search (lazy deletion).
+    When the list runs out, or the distance ties run past its end, one full scan over the
+    candidates gives the answer.
+    """
+    def __init__(self, index, candidates, tie_key=None):
+        """
+        :param index: The NeighborIndex to search.
+        :param candidates: Container of the locations that can still be chosen.
+        :param tie_key: Callable location -> sort key for locations at the same distance,
+            the lowest location index wins by default.
+        """
+        self.index = index
+        self.candidates = candidates
+        self.tie_key = tie_key
+        self.cursors = {}
+        #Number of queries the neighbor list could not answer
+        self.full_scans = 0
+
+    def reset(self):
+        """
+        Forgets the skipped entries, call it after adding locations back to candidates.
+        """
+        self.cursors.clear()
+
+    def nearest(self, location):
+        """
+        Returns the nearest candidate to location, or None when there are no candidates.
+        """
+        candidates = self.candidates
+        if not candidates:
+            return None
+        neighbors = self.index.row(location)
+        distance_row = self.index.distance_matrix[location]
+        tie_key = self.tie_key
+
+        #With fewer candidates than list entries a scan of the candidates is the cheaper walk
+        width = len(neighbors) if len(candidates) > len(neighbors) else 0
+        cursor = self.cursors.get(location, 0)
+        while cursor < width and neighbors[cursor] not in candidates:
+            cursor += 1
+        self.cursors[location] = cursor
+
+        if cursor < width:
+            best = neighbors[cursor]
+            best_distance = distance_row[best]
+            position = cursor + 1
+            #Equal distances are sorted by index, so other ties only matter with a tie_key
+            while position < width and distance_row[neighbors[position]] == best_distance:
+                if tie_key is not None and neighbors[position] in candidates \
+                        and tie_key(neighbors[position]) < tie_key(best):
+                    best = neighbors[position]
+                position += 1
+            #Ties running past the end of the list may hide a better location
+            if position < width or self.index.complete:
+                return best
+
+        if width:
+            self.full_scans += 1
+        if tie_key is None:
+            return min(candidates, key=lambda index: (distance_row[index], index))
+        return min(candidates, key=lambda index: (distance_row[index], tie_key(index)))
+
+
+class NeighborIndex:
+    """
+    The closest locations to every location, sorted by distance then index.
+
+    neighbors is an int32 array with one row per location, the location itself first
+    (distance 0) followed by its neighbor_count nearest locations. Queries read distances
+    from the distance matrix, the index itself only holds location numbers.
+    """
+    def __init__(self, neighbors, distance_matrix):
+        """
+        :param neighbors: 2D int32 NumPy array, or a list of array('i') rows without NumPy.
+        :param distance_matrix: The square distance matrix the index was built from.
+        """
+        self.neighbors = neighbors
+        self.distance_matrix = distance_matrix
+        self.size = len(neighbors)
+        self.width = len(neighbors[0]) if self.size else 0
+        #True when every row lists every location, the lists never run out
+        self.complete = self.width >= self.size
+        #Rows converted to Python lists, built the first time a location is queried
+        self._rows = {}
+
+    def row(self, location):
+        """
+        Returns the sorted neighbor list of location as a Python list.
+        """
+        neighbors = self._rows.get(location)
+        if neighbors is None:
+            neighbors = [int(index) for index in self.neighbors[location]]
+            self._rows[location] = neighbors
+        return neighbors
+
+    def search(self, candidates, tie_key=None):
+        """
+        Starts a NeighborSearch over candidates, see NeighborSearch.
+        """
+        return NeighborSearch(self, candidates, tie_key)
+
+
+def build_neighbor_index(distance_matrix, neighbor_count=DEFAULT_NEIGHBOR_COUNT):
+    """
+    Builds a NeighborIndex from the square distance matrix.
+
+    With NumPy each block of rows is partitioned around the neighbor_count + 1 smallest
+    distances and only those are sorted, by distance then index, so building costs about
+    one pass over the matrix.
+    """
+    size = len(distance_matrix)
+    width = min(neighbor_count + 1, size)
+    if np is None:
+        neighbors = [
+            array('i', heapq.nsmallest(width, range(size), key=lambda index, row=row: (row[index], index)))
+            for row in distance_matrix
+        ]
+        return NeighborIndex(neighbors, distance_matrix)
+
+    matrix = dense_array(distance_matrix)
+    neighbors = np.empty((size, width), dtype=np.int32)
+    for start in range(0, size, _BUILD_BLOCK_ROWS):
+        if matrix is not None:
+            block = matrix[start:start + _BUILD_BLOCK_ROWS]
+        else:
+            #On demand providers are read row by row, only one block is in memory at a time
+            block = np.array([distance_matrix[row] for row in range(start, min(start + _BUILD_BLOCK_ROWS, size))])
+        if width < size:
+            selected = np.argpartition(block, width - 1, axis=1)[:, :width]
+        else:
+            selected = np.broadcast_to(np.arange(size), block.shape)
+        selected_distances = np.take_along_axis(block, selected, axis=1)
+        order = np.lexsort((selected, selected_distances), axis=1)
+        neighbors[start:start + len(block)] = np.take_along_axis(selected, order, axis=1)
+    return NeighborIndex(neighbors, distance_matrix)
+
+
+def neighbor_cache_path(csv_file_path, neighbor_count=DEFAULT_NEIGHBOR_COUNT, cache_dir=None, dtype="float32"):
+    """
+    Returns the .npy path of the neighbor index cache, next to the matrix cache and keyed
+    the same way, so an edited CSV never reuses an old index.
+    """
+    matrix_path, _ = distance_cache_paths(csv_file_path, cache_dir, dtype)
+    return matrix_path[:-len(".npy")] + f".knn{neighbor_count}.npy"
+
+
+def load_neighbor_index(csv_file_path, distance_matrix, neighbor_count=DEFAULT_NEIGHBOR_COUNT,
+                        cache_dir=None, use_cache=True):
+    """
+    Loads the neighbor index for a distance CSV, memory mapping the cached index when there
+    is one and building and caching it otherwise. Without NumPy the index is always built.
+
+    :param csv_file_path: Filepath to the triangular distance CSV.
+    :param distance_matrix: The square matrix from load_distance_matrix for that CSV.
+    :param neighbor_count: Closest locations kept per location.
+    :param cache_dir: Folder for the cache files, defaults to .distance_cache next to the CSV.
+    :param use_cache: Set to False to always build the index and skip writing a cache.
+    """
+    if np is None or not use_cache:
+        return build_neighbor_index(distance_matrix, neighbor_count)
+
+    matrix = dense_array(distance_matrix)
+    dtype = matrix.dtype if matrix is not None else getattr(distance_matrix, "dtype", "float64")
+    index_path = neighbor_cache_path(csv_file_path, neighbor_count, cache_dir, dtype)
+    if os.path.exists(index_path):
+        return NeighborIndex(np.load(index_path, mmap_mode='r'), distance_matrix)
+
+    index = build_neighbor_index(distance_matrix, neighbor_count)
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    #Writes to a temp file first so a crashed run never leaves half a cache behind
+    with open(index_path + ".tmp", mode='wb') as index_file:
+        np.save(index_file, index.neighbors)
+    os.replace(index_path + ".tmp", index_path)
+    return index
@@ -0,0 +1,178 @@
+from distanceProvider import dense_array
+from packageClass import EOD_MINUTES
+
+#NumPy is optional, without it seeds and costs are computed with Python loops
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def group_packages(package_table):
+    """
+    Groups packages that must be delivered together, using union find over the
+    "Must be delivered with" constraints. Returns a list of package id lists.
+    """
+    parent = {package_id: package_id for package_id in package_table}
+
+    def find(package_id):
+        while parent[package_id] != package_id:
+            parent[package_id] = parent[parent[package_id]]
+            package_id = parent[package_id]
+        return package_id
+
+    for package_id, package in package_table.items():
+        for other_id in package.constraints.ship_with:
+            if other_id in parent:
+                parent[find(other_id)] = find(package_id)
+
+    groups = {}
+    for package_id in sorted(parent):
+        groups.setdefault(find(package_id), []).append(package_id)
+    return list(groups.values())
+
+
+def _seed_locations(distance_matrix, locations, seed_count, hub_index):
+    """
+    Picks seed_count well spread locations with farthest point seeding: each new seed is
+    the location farthest from the hub and every seed picked so far.
+    """
+    if not locations:
+        return []
+    matrix = dense_array(distance_matrix)
+    if matrix is not None:
+        candidates = np.array(locations)
+        nearest_seed = matrix[hub_index, candidates].astype(float)
+        seeds = []
+        for _ in range(seed_count):
+            pick = int(nearest_seed.argmax())
+            seeds.append(int(candidates[pick]))
+            np.minimum(nearest_seed, matrix[seeds[-1], candidates], out=nearest_seed)
+        return seeds
+    nearest_seed = {location: distance_matrix[hub_index][location] for location in locations}
+    seeds = []
+    for _ in range(seed_count):
+        pick = max(locations, key=nearest_seed.__getitem__)
+        seeds.append(pick)
+        for location in locations:
+            nearest_seed[location] = min(nearest_seed[location], distance_matrix[pick][location])
+    return seeds
+
+
+def assign_packages(package_table, trucks, distance_matrix, address_map, driver_count=None, hub_index=0):
+    """
+    Assigns every package in the table to a truck, filling each truck's package_ids.
+
+    :param package_table: Hashtable of packages keyed by package id number.
+    :param trucks: Trucks to load, in dispatch order. Truck ids are the numbers used by
+        "Can only be on truck N" notes, each truck's capacity and speed are respected.
+    :param distance_matrix: Matrix of the distances between the address indices.
+    :param address_map: Dictionary that maps address strings to indices in the distance matrix.
+    :param driver_count: Number of drivers. The first driver_count trucks leave first, the
+        rest leave later once a driver is free. Defaults to one driver per truck.
+
+    Packages are grouped so "Must be delivered with" packages share a truck. Each truck gets
+    a seed location, picked by vectorized farthest point seeding so the seeds spread across
+    the city, and a group's cost on a truck is the drive time from the truck's seed to each
+    distinct address in the group, summed, so a group spread across the city costs more on
+    a truck than one stop. Groups are placed most constrained first, then cheapest first, onto
+    the cheapest truck that has room and that they are allowed on:
+    - "Can only be on truck N" groups go on truck N.
+    - Delayed and wrong address groups go on a later truck when there is one, as those
+      trucks leave after the packages reach the depot.
+    - Groups with a deadline before end of day go on a first wave truck when there is room.
+    :raises ValueError: If a package requires a truck that is not in the fleet, or no truck
+        has room for a group.
+    :return: The list of trucks with their package_ids filled in.
+    """
+    if driver_count is None:
+        driver_count = len(trucks)
+    first_wave = set(range(min(driver_count, len(trucks))))
+    later_wave = set(range(len(trucks))) - first_wave
+    truck_positions = {truck.truck_id: position for position, truck in enumerate(trucks)}
+
+    groups = group_packages(package_table)
+    if not groups:
+        for truck in trucks:
+            truck.package_ids = []
+        return trucks
+    group_locations = []
+    group_allowed = []
+    group_rank = []
+    for group in groups:
+        packages = [package_table.lookup(package_id) for package_id in group]
+        #A group is costed at every distinct location it goes to, a group matching no
+        # location stays at the hub and is costed there
+        locations = {address_map.index_of(package) for package in packages} - {None}
+        group_locations.append(sorted(locations) or [hub_index])
+
+        required = {package.constraints.required_truck for package in packages} - {None}
+        for package in packages:
+            truck_id = package.constraints.required_truck
+            if truck_id is not None and truck_id not in truck_positions:
+                raise ValueError(f"Package {package.package_id} requires truck {truck_id}, which is not in the fleet")
+        delayed = any(
+            package.constraints.delayed_until is not None or package.constraints.address_correction
+            for package in packages
+        )
+        has_deadline = any(package.deadline_minutes < EOD_MINUTES for package in packages)
+        if required:
+            allowed = {truck_positions[truck_id] for truck_id in required if truck_id in truck_positions}
+            rank = 0
+        elif delayed and later_wave:
+            allowed, rank = later_wave, 1
+        elif has_deadline and later_wave:
+            allowed, rank = first_wave, 2
+        else:
+            allowed, rank = None, 3
+        group_allowed.append(allowed)
+        group_rank.append(rank)
+
+    #Drive time from every truck's seed to every group, summed over the group's locations,
+    # groups x trucks
+    all_locations = sorted({location for locations in group_locations for location in locations})
+    seeds = _seed_locations(distance_matrix, all_locations, len(trucks), hub_index)
+    speeds = [truck.speed for truck in trucks]
+    matrix = dense_array(distance_matrix)
+    if matrix is not None:
+        flat_locations = [location for locations in group_locations for location in locations]
+        group_starts = np.cumsum([0] + [len(locations) for locations in group_locations[:-1]])
+        location_costs = matrix[np.ix_(flat_locations, seeds)].astype(float)
+        costs = np.add.reduceat(location_costs, group_starts, axis=0) / np.array(speeds, dtype=float)
+        truck_orders = np.argsort(costs, axis=1, kind="stable").tolist()
+        best_costs = costs.min(axis=1).tolist()
+    else:
+        costs = [
+            [
+                sum(distance_matrix[location][seed] for location in locations) / speed
+                for seed, speed in zip(seeds, speeds)
+            ]
+            for locations in group_locations
+        ]
+        truck_orders = [sorted(range(len(trucks)), key=row.__getitem__) for row in costs]
+        best_costs = [min(row) for row in costs]
+
+    room = [truck.capacity for truck in trucks]
+    loads = [[] for _ in trucks]
+    for group_index in sorted(range(len(groups)), key=lambda index: (group_rank[index], best_costs[index])):
+        group = groups[group_index]
+        allowed = group_allowed[group_index]
+        choice = None
+        for truck_index in truck_orders[group_index]:
+            if room[truck_index] >= len(group) and (allowed is None or truck_index in allowed):
+                choice = truck_index
+                break
+        #Soft preferences give way when the preferred trucks are full
+        if choice is None and group_rank[group_index] > 0:
+            for truck_index in truck_orders[group_index]:
+                if room[truck_index] >= len(group):
+                    choice = truck_index
+                    break
+        if choice is None:
+            raise ValueError(f"No truck has room for packages {group}")
+        room[choice] -= len(group)
+        loads[choice].extend(group)
+
+    for truck, load in zip(trucks, loads):
+        truck.package_ids = sorted(load)
+    return trucks
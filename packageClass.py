@@ -1,8 +1,91 @@
+import re
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+#Deadline stored for "EOD" packages, minutes since midnight at the end of the day
+EOD_MINUTES = 24 * 60
+
+#Status names in status code order, the code is the index into this tuple. A package whose
+# address matches no location is left out of routing and never leaves the hub.
+STATUS_NAMES = ("At Hub", "En Route", "Delivered", "Unmatched address")
+STATUS_AT_HUB, STATUS_EN_ROUTE, STATUS_DELIVERED, STATUS_UNMATCHED = range(len(STATUS_NAMES))
+
+
+@lru_cache(maxsize=1024)
+def parse_deadline_minutes(delivery_deadline):
+    """
+    Converts a delivery deadline string such as "10:30 AM" into minutes since midnight.
+    "EOD" and empty deadlines become EOD_MINUTES. Deadlines repeat across a manifest,
+    so results are cached by deadline string.
+    """
+    deadline = delivery_deadline.strip().upper()
+    if not deadline or deadline == "EOD":
+        return EOD_MINUTES
+    deadline_time = datetime.strptime(deadline, "%I:%M %p")
+    return deadline_time.hour * 60 + deadline_time.minute
+
+
+#Delivery constraints parsed out of a package note.
+#required_truck: truck id the package must ride on, or None.
+#delayed_until: minutes since midnight the package reaches the depot, or None.
+#ship_with: tuple of package ids that must be delivered together with this one.
+#address_correction: True when the listed address is wrong and gets corrected later.
+PackageConstraints = namedtuple(
+    "PackageConstraints", ["required_truck", "delayed_until", "ship_with", "address_correction"]
+)
+NO_CONSTRAINTS = PackageConstraints(None, None, (), False)
+
+_REQUIRED_TRUCK_PATTERN = re.compile(r"only be on truck (\d+)", re.IGNORECASE)
+_DELAYED_PATTERN = re.compile(r"until (\d{1,2}):(\d{2}) ?([ap]m)", re.IGNORECASE)
+_SHIP_WITH_PATTERN = re.compile(r"delivered with ([\d,\s]+)", re.IGNORECASE)
+_WRONG_ADDRESS_PATTERN = re.compile(r"wrong address", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def parse_note(note):
+    """
+    Parses a package note once into PackageConstraints.
+    Notes repeat across a manifest, so results are cached by note string and the
+    same immutable constraints object is shared by every package with that note.
+    """
+    if not note:
+        return NO_CONSTRAINTS
+
+    required_truck = None
+    truck_match = _REQUIRED_TRUCK_PATTERN.search(note)
+    if truck_match:
+        required_truck = int(truck_match.group(1))
+
+    delayed_until = None
+    delayed_match = _DELAYED_PATTERN.search(note)
+    if delayed_match:
+        hour, minute, meridiem = delayed_match.groups()
+        delayed_until = (int(hour) % 12 + (12 if meridiem.lower() == "pm" else 0)) * 60 + int(minute)
+
+    ship_with = ()
+    ship_with_match = _SHIP_WITH_PATTERN.search(note)
+    if ship_with_match:
+        ship_with = tuple(int(value) for value in re.findall(r"\d+", ship_with_match.group(1)))
+
+    address_correction = bool(_WRONG_ADDRESS_PATTERN.search(note))
+    return PackageConstraints(required_truck, delayed_until, ship_with, address_correction)
+
+
 class Package:
     """
     This class represents a single package with all of its information and status.
     This class stores package data and tracks the package's status over time based on its timestamps.
+    Attributes are declared in __slots__ so a package has no per object __dict__.
     """
+    __slots__ = (
+        "package_id", "address", "city", "state", "zip_code", "delivery_deadline",
+        "weight", "note", "status", "depart_time", "delivery_time",
+        "deadline_minutes", "constraints", "location_index",
+    )
+
     def __init__(self, package_id, address, city, state, zip_code, delivery_deadline, weight, note):
         self.package_id = package_id
         self.address = address
@@ -13,6 +96,12 @@ class Package:
         self.weight = weight
         self.note = note
 
+        #Deadline and note parsed once, so the simulation never matches strings
+        self.deadline_minutes = parse_deadline_minutes(delivery_deadline)
+        self.constraints = parse_note(note)
+        #Distance matrix index of the address, set once by AddressMap.index_of
+        self.location_index = None
+
         self.status = "At Hub"
         self.depart_time = None
         self.delivery_time = None
@@ -20,7 +109,8 @@ class Package:
     def update_status(self, new_status, time=None):
         """
         Updates the status of the package and records the timestamp.
-        :param new_status (str): New status of the package("At Hub", "En Route", or "Delivered").
+        :param new_status (str): New status of the package("At Hub", "En Route", "Delivered" or
+            "Unmatched address").
         :param time: The time associated with the status change.
         :return:
         """
@@ -39,7 +129,7 @@ class Package:
 
         If the package has a delivery time and check_time is at or after that, it's labeled as "Delivered".
         Else if the package has a departing time and check_time is at or after that, it's labeled as "En Route".
-        Else it's labeled as "At Hub".
+        Else it's labeled as "At Hub", or "Unmatched address" when its address matched no location.
         """
         #If delivered, report the exact time of delivery
         if self.delivery_time and check_time >= self.delivery_time:
@@ -47,6 +137,9 @@ class Package:
         #if it has left the hub and not delivered yet, show en route
         if self.depart_time and check_time >= self.depart_time:
             return "En Route"
+        #a package with an unmatched address stays at the hub all day
+        if self.status == STATUS_NAMES[STATUS_UNMATCHED]:
+            return self.status
         #otherwise it means it still at hub
         return "At Hub"
 
@@ -69,3 +162,169 @@ class Package:
 
     def __repr__(self):
         return self.__str__()
+
+
+class PackageStore:
+    """
+    Columnar store for large package manifests.
+    Instead of one Package object per package, every field is a column in a typed array,
+    so a row costs a few dozen bytes. Address tuples (address, city, state, zip code) and
+    notes repeat across a manifest, so they are interned once and rows keep an index to them.
+    Deadlines are minutes since midnight, status is a code from STATUS_NAMES and the depart
+    and delivery times are seconds since midnight of the store's day, -1 when not set.
+    """
+    def __init__(self, day=datetime(1900, 1, 1)):
+        """
+        Initializes an empty store.
+        :param day: Midnight of the simulated day, the depart and delivery times are relative to it.
+        """
+        self.day = day
+
+        self.package_ids = array('l')
+        self.address_indices = array('i')
+        self.deadlines = array('h')
+        self.weights = array('f')
+        self.note_indices = array('i')
+        self.status_codes = array('b')
+        self.depart_seconds = array('d')
+        self.delivery_seconds = array('d')
+
+        #Interned (address, city, state, zip code) tuples and notes with their reverse maps
+        self.address_list = []
+        self.note_list = []
+        self._address_lookup = {}
+        self._note_lookup = {}
+
+        #Rows are found with a binary search while ids arrive in ascending order,
+        # otherwise an id -> row dictionary is built the first time it is needed
+        self._ids_ascending = True
+        self._row_lookup = None
+
+    def __len__(self):
+        """
+        Returns the number of packages in the store.
+        """
+        return len(self.package_ids)
+
+    def _intern(self, value, values_list, lookup):
+        """
+        Returns the index of value in values_list, adding it the first time it is seen.
+        """
+        index = lookup.get(value)
+        if index is None:
+            index = len(values_list)
+            values_list.append(value)
+            lookup[value] = index
+        return index
+
+    def append(self, package_id, address, city, state, zip_code, delivery_deadline, weight, note):
+        """
+        Adds a package as a new row, taking the same fields as Package, and returns its row number.
+        """
+        if self.package_ids and package_id <= self.package_ids[-1]:
+            self._ids_ascending = False
+        row = len(self.package_ids)
+        self.package_ids.append(package_id)
+        self.address_indices.append(
+            self._intern((address, city, state, zip_code), self.address_list, self._address_lookup)
+        )
+        self.deadlines.append(parse_deadline_minutes(delivery_deadline))
+        self.weights.append(float(weight) if weight else 0.0)
+        self.note_indices.append(self._intern(note, self.note_list, self._note_lookup))
+        self.status_codes.append(STATUS_AT_HUB)
+        self.depart_seconds.append(-1.0)
+        self.delivery_seconds.append(-1.0)
+        if self._row_lookup is not None:
+            self._row_lookup[package_id] = row
+        return row
+
+    def row_of(self, package_id):
+        """
+        Returns the row number of the package id, or None if it is not in the store.
+        """
+        if self._ids_ascending:
+            row = bisect_left(self.package_ids, package_id)
+            if row < len(self.package_ids) and self.package_ids[row] == package_id:
+                return row
+            return None
+        if self._row_lookup is None:
+            self._row_lookup = {package_id: row for row, package_id in enumerate(self.package_ids)}
+        return self._row_lookup.get(package_id)
+
+    def _to_seconds(self, time):
+        """
+        Converts a datetime into seconds since the store's day.
+        """
+        return (time - self.day).total_seconds()
+
+    def _to_datetime(self, seconds):
+        """
+        Converts seconds since the store's day into a datetime, None when not set.
+        """
+        if seconds < 0:
+            return None
+        return self.day + timedelta(seconds=seconds)
+
+    def update_status(self, row, new_status, time=None):
+        """
+        Updates the status of the package in the given row, mirroring Package.update_status.
+        :param row: Row number of the package.
+        :param new_status (str): New status of the package("At Hub", "En Route", "Delivered" or
+            "Unmatched address").
+        :param time: The datetime associated with the status change.
+        """
+        if new_status == "En Route" and time:
+            self.depart_seconds[row] = self._to_seconds(time)
+        if new_status == "Delivered" and time:
+            self.delivery_seconds[row] = self._to_seconds(time)
+        self.status_codes[row] = STATUS_NAMES.index(new_status)
+
+    def snapshot_row(self, package_id):
+        """
+        Returns a Package object copied from the row of the package id, or None if it is
+        not in the store. Changes to the copy are not written back to the store, so the
+        store has no lookup method and cannot stand in for a HashTable, status changes go
+        through update_status.
+        """
+        row = self.row_of(package_id)
+        if row is None:
+            return None
+        return self.to_package(row)
+
+    def to_package(self, row):
+        """
+        Builds a Package object holding the data from the given row.
+        """
+        address, city, state, zip_code = self.address_list[self.address_indices[row]]
+        deadline = self.deadlines[row]
+        if deadline == EOD_MINUTES:
+            delivery_deadline = "EOD"
+        else:
+            delivery_deadline = (self.day + timedelta(minutes=deadline)).strftime("%I:%M %p").lstrip("0")
+
+        package = Package(
+            package_id=self.package_ids[row],
+            address=address,
+            city=city,
+            state=state,
+            zip_code=zip_code,
+            delivery_deadline=delivery_deadline,
+            weight=f"{self.weights[row]:g}",
+            note=self.note_list[self.note_indices[row]],
+        )
+        package.status = STATUS_NAMES[self.status_codes[row]]
+        package.depart_time = self._to_datetime(self.depart_seconds[row])
+        package.delivery_time = self._to_datetime(self.delivery_seconds[row])
+        return package
+
+    def constraints_of(self, row):
+        """
+        Returns the PackageConstraints parsed from the note of the given row.
+        """
+        return parse_note(self.note_list[self.note_indices[row]])
+
+    def __iter__(self):
+        """
+        Iterates over every package id in the store in row order.
+        """
+        return iter(self.package_ids)
@@ -0,0 +1,359 @@
+"""
+Non-interactive results export and status queries.
+
+Runs the simulation without the user interface and streams one record per package and one
+per driven leg to CSV, JSON Lines or a columnar folder. Records are written in buffered
+chunks, so a day of any size is exported without holding the records in memory.
+--status-at answers "status of every package at HH:MM" from an existing export without
+simulating again.
+
+    python resultsExport.py --output-dir results --format csv
+    python resultsExport.py --output-dir results --status-at 10:25 --packages
+
+Times are seconds since midnight of the simulated day, -1 when not set, the same as
+PackageStore. A columnar export is a folder per table with a schema.json and one file per
+column: numbers as raw machine arrays readable with array.fromfile or numpy.fromfile,
+text as one JSON string per line. A query only reads the columns it needs.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from array import array
+from datetime import datetime, timedelta
+from itertools import islice
+
+from csvDistanceFileReader import load_distance_matrix
+from csvPackageFileReader import iter_package_batches
+from packageClass import STATUS_AT_HUB, STATUS_DELIVERED, STATUS_EN_ROUTE, STATUS_NAMES, STATUS_UNMATCHED
+from scenarioRunner import DEFAULT_SETTINGS, SIMULATION_DAY, simulate
+from truckClass import CLOCK_TICKS_PER_SECOND
+
+#Export formats and the file or folder name suffix of each
+FORMATS = {"csv": ".csv", "jsonl": ".jsonl", "columnar": ".columns"}
+#Records per buffered write
+BUFFER_ROWS = 8192
+#(name, array typecode) of every column, "str" for text
+PACKAGE_COLUMNS = (
+    ("package_id", "q"), ("address", "str"), ("city", "str"), ("zip_code", "str"),
+    ("deadline_minutes", "q"), ("weight", "str"), ("truck_id", "q"), ("status", "str"),
+    ("depart_seconds", "d"), ("delivery_seconds", "d"), ("on_time", "b"),
+)
+LEG_COLUMNS = (
+    ("truck_id", "q"), ("leg", "q"), ("from_index", "q"), ("to_index", "q"),
+    ("depart_seconds", "d"), ("arrive_seconds", "d"), ("miles", "d"), ("mileage", "d"),
+    ("packages_delivered", "q"),
+)
+
+
+def _seconds(time):
+    """
+    Converts a datetime into seconds since midnight of the simulated day, -1 for None.
+    """
+    return -1.0 if time is None else (time - SIMULATION_DAY).total_seconds()
+
+
+def package_records(simulation, packages):
+    """
+    Yields one PACKAGE_COLUMNS tuple per package, in the order given.
+    """
+    for package in packages:
+        state = simulation.package_trucks.get(package.package_id)
+        delivery_seconds = _seconds(package.delivery_time)
+        yield (
+            package.package_id, package.address, package.city, package.zip_code,
+            package.deadline_minutes, package.weight, state.truck.truck_id if state else -1,
+            package.status, _seconds(package.depart_time), delivery_seconds,
+            int(0 <= delivery_seconds <= package.deadline_minutes * 60),
+        )
+
+
+def leg_records(simulation):
+    """
+    Yields one LEG_COLUMNS tuple per leg driven, truck by truck. The simulation has to run
+    on the integer clock, leg times are clock ticks.
+    """
+    for state in simulation.truck_states:
+        previous_mileage = 0.0
+        for number, leg in enumerate(state.legs, start=1):
+            yield (
+                state.truck.truck_id, number, leg.from_index, leg.to_index,
+                leg.depart / CLOCK_TICKS_PER_SECOND, leg.arrive / CLOCK_TICKS_PER_SECOND,
+                leg.mileage - previous_mileage, leg.mileage, len(leg.package_ids),
+            )
+            previous_mileage = leg.mileage
+
+
+class _CsvWriter:
+    """
+    Writes rows to a CSV file with a header row.
+    """
+    def __init__(self, path, columns):
+        self.file = open(path, mode='w', newline='', encoding='utf-8', buffering=1 << 20)
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([name for name, _ in columns])
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class _JsonLinesWriter:
+    """
+    Writes rows to a JSON Lines file, one object per row.
+    """
+    def __init__(self, path, columns):
+        self.file = open(path, mode='w', encoding='utf-8', buffering=1 << 20)
+        self.names = [name for name, _ in columns]
+
+    def write_rows(self, rows):
+        names = self.names
+        self.file.write("".join(json.dumps(dict(zip(names, row))) + "\n" for row in rows))
+
+    def close(self):
+        self.file.close()
+
+
+class _ColumnarWriter:
+    """
+    Writes rows to a folder with one file per column and a schema.json.
+    """
+    def __init__(self, path, columns):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.columns = columns
+        self.rows = 0
+        self.files = [
+            open(os.path.join(path, name + (".txt" if typecode == "str" else ".bin")),
+                 mode='w' if typecode == "str" else 'wb',
+                 **({"encoding": "utf-8"} if typecode == "str" else {}))
+            for name, typecode in columns
+        ]
+
+    def write_rows(self, rows):
+        for (_, typecode), column_file, values in zip(self.columns, self.files, zip(*rows)):
+            if typecode == "str":
+                column_file.write("".join(json.dumps(value) + "\n" for value in values))
+            else:
+                array(typecode, values).tofile(column_file)
+        self.rows += len(rows)
+
+    def close(self):
+        for column_file in self.files:
+            column_file.close()
+        schema = {
+            "rows": self.rows,
+            "byteorder": sys.byteorder,
+            "columns": [{"name": name, "type": typecode} for name, typecode in self.columns],
+        }
+        with open(os.path.join(self.path, "schema.json"), mode='w', encoding='utf-8') as schema_file:
+            json.dump(schema, schema_file, indent=2)
+
+
+_WRITERS = {"csv": _CsvWriter, "jsonl": _JsonLinesWriter, "columnar": _ColumnarWriter}
+
+
+def write_records(records, path, columns, file_format, buffer_rows=BUFFER_ROWS):
+    """
+    Streams records to path in file_format, buffer_rows records per write.
+    :return: Number of records written.
+    """
+    writer = _WRITERS[file_format](path, columns)
+    count = 0
+    try:
+        while True:
+            rows = list(islice(records, buffer_rows))
+            if not rows:
+                break
+            writer.write_rows(rows)
+            count += len(rows)
+    finally:
+        writer.close()
+    return count
+
+
+def export_results(simulation, packages, output_dir, file_format="csv", buffer_rows=BUFFER_ROWS):
+    """
+    Exports the package and leg records of a finished simulation.
+    :return: Dictionary of table name -> (path, number of records).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    suffix = FORMATS[file_format]
+    tables = (
+        ("packages", package_records(simulation, packages), PACKAGE_COLUMNS),
+        ("legs", leg_records(simulation), LEG_COLUMNS),
+    )
+    written = {}
+    for name, records, columns in tables:
+        path = os.path.join(output_dir, name + suffix)
+        written[name] = (path, write_records(records, path, columns, file_format, buffer_rows))
+    return written
+
+
+def exported_format(output_dir, table):
+    """
+    Returns the format an exported table was written in.
+    :raises FileNotFoundError: If the table was not exported to output_dir.
+    :raises ValueError: If the table was exported in more than one format, since an older
+        export left next to a newer one would be read as easily as the newer one.
+    """
+    base = os.path.join(output_dir, table)
+    found = [file_format for file_format, suffix in sorted(FORMATS.items()) if os.path.exists(base + suffix)]
+    if not found:
+        raise FileNotFoundError(f"No exported {table} table in {output_dir}")
+    if len(found) > 1:
+        raise ValueError(
+            f"The {table} table in {output_dir} was exported as {', '.join(found)}, choose one with --format"
+        )
+    return found[0]
+
+
+def read_columns(output_dir, table, names, file_format=None):
+    """
+    Reads the named columns of an exported table.
+    :param file_format: Format to read, by default the only format the table was exported in.
+    :return: Dictionary of column name -> list of values.
+    """
+    types = dict(PACKAGE_COLUMNS if table == "packages" else LEG_COLUMNS)
+    if file_format is None:
+        file_format = exported_format(output_dir, table)
+    path = os.path.join(output_dir, table + FORMATS[file_format])
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No {file_format} export of the {table} table in {output_dir}")
+
+    if file_format == "columnar":
+        with open(os.path.join(path, "schema.json"), mode='r', encoding='utf-8') as schema_file:
+            schema = json.load(schema_file)
+        columns = {}
+        for name in names:
+            if types[name] == "str":
+                with open(os.path.join(path, name + ".txt"), mode='r', encoding='utf-8') as column_file:
+                    columns[name] = [json.loads(line) for line in column_file]
+            else:
+                values = array(types[name])
+                with open(os.path.join(path, name + ".bin"), mode='rb') as column_file:
+                    values.fromfile(column_file, schema["rows"])
+                if schema["byteorder"] != sys.byteorder:
+                    values.byteswap()
+                columns[name] = values.tolist()
+        return columns
+
+    def convert(name, value):
+        if types[name] == "str":
+            return value
+        return float(value) if types[name] == "d" else int(value)
+
+    columns = {name: [] for name in names}
+    if file_format == "csv":
+        with open(path, mode='r', newline='', encoding='utf-8') as csv_file:
+            for row in csv.DictReader(csv_file):
+                for name in names:
+                    columns[name].append(convert(name, row[name]))
+        return columns
+    with open(path, mode='r', encoding='utf-8') as jsonl_file:
+        for line in jsonl_file:
+            record = json.loads(line)
+            for name in names:
+                columns[name].append(record[name])
+    return columns
+
+
+def statuses_at(output_dir, check_seconds, file_format=None):
+    """
+    Returns (package id, status code, delivery seconds) for every exported package at
+    check_seconds, with the same rules as Package.get_status_at.
+    :param file_format: Format of the export to read, see read_columns.
+    """
+    columns = read_columns(
+        output_dir, "packages", ("package_id", "status", "depart_seconds", "delivery_seconds"), file_format
+    )
+    statuses = []
+    for package_id, status, depart, delivery in zip(
+        columns["package_id"], columns["status"], columns["depart_seconds"], columns["delivery_seconds"]
+    ):
+        if status == STATUS_NAMES[STATUS_UNMATCHED]:
+            code = STATUS_UNMATCHED
+        elif 0 <= delivery <= check_seconds:
+            code = STATUS_DELIVERED
+        elif 0 <= depart <= check_seconds:
+            code = STATUS_EN_ROUTE
+        else:
+            code = STATUS_AT_HUB
+        statuses.append((package_id, code, delivery))
+    return statuses
+
+
+def _format_seconds(seconds):
+    """
+    Formats seconds since midnight like the user interface, "08:35 AM".
+    """
+    return (SIMULATION_DAY + timedelta(seconds=seconds)).strftime('%I:%M %p')
+
+
+def _clock_seconds(text):
+    """
+    Parses an HH:MM argument into seconds since midnight, for argparse.
+    """
+    try:
+        check_time = datetime.strptime(text, "%H:%M")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{text!r} is not a time of day as HH:MM") from None
+    return check_time.hour * 3600 + check_time.minute * 60
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export simulation results or query an export.")
+    parser.add_argument("--output-dir", default="results", help="Folder the export is written to or read from.")
+    parser.add_argument(
+        "--format", choices=sorted(FORMATS),
+        help="Export file format, csv by default. With --status-at the format to read, "
+             "needed when the folder holds several.",
+    )
+    parser.add_argument("--status-at", type=_clock_seconds, metavar="HH:MM", help="Report package statuses at this time from the export.")
+    parser.add_argument("--packages", action="store_true", help="With --status-at, list every package's status.")
+    parser.add_argument("--distance-file", default="wgupsDistanceFile.csv")
+    parser.add_argument("--package-file", default="wgupsPackageFile.csv")
+    parser.add_argument("--assignment", choices=("manual", "auto"), default=DEFAULT_SETTINGS["assignment"])
+    parser.add_argument("--trucks", type=int, default=DEFAULT_SETTINGS["trucks"], help="Trucks for auto assignment.")
+    parser.add_argument("--drivers", type=int, default=DEFAULT_SETTINGS["drivers"])
+    parser.add_argument("--speed", type=float, default=DEFAULT_SETTINGS["speed"])
+    args = parser.parse_args(argv)
+
+    if args.status_at is not None:
+        try:
+            statuses = statuses_at(args.output_dir, args.status_at, args.format)
+        except (FileNotFoundError, ValueError) as error:
+            print(error, file=sys.stderr)
+            return 1
+        counts = [0] * len(STATUS_NAMES)
+        for package_id, code, delivery in statuses:
+            counts[code] += 1
+            if args.packages:
+                status = STATUS_NAMES[code]
+                if code == STATUS_DELIVERED:
+                    status = f"Delivered at {_format_seconds(delivery)}"
+                print(f"{package_id},{status}")
+        print(", ".join(
+            f"{name}: {count}" for code, (name, count) in enumerate(zip(STATUS_NAMES, counts))
+            if code != STATUS_UNMATCHED or count
+        ))
+        return 0
+
+    distance_matrix, _, address_map = load_distance_matrix(args.distance_file, dtype="float64")
+    packages = [package for batch in iter_package_batches(args.package_file) for package in batch]
+    address_map.resolve_packages(packages)
+    for line in address_map.unmatched_report():
+        print(line, file=sys.stderr)
+    scenario = dict(DEFAULT_SETTINGS, assignment=args.assignment, trucks=args.trucks,
+                    drivers=args.drivers, speed=args.speed)
+    simulation = simulate(scenario, distance_matrix, address_map, packages)
+    for name, (path, count) in export_results(simulation, packages, args.output_dir, args.format or "csv").items():
+        print(f"Wrote {count} {name} records to {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+import time
+
+from distanceProvider import dense_array
+
+#NumPy is optional, without it the local matrix is read from the full matrix row by row
+# and neighbor lists are built with sorted() instead of argpartition
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#Smallest saving in miles that counts as an improvement, stops float noise from looping
+IMPROVEMENT_EPSILON = 1e-9
+#Longest run of stops an Or-opt move relocates
+MAX_SEGMENT_LENGTH = 3
+
+
+def greedy_route(distance_matrix, stops, hub_index=0):
+    """
+    Builds a nearest neighbor route over just the given stops.
+
+    :param distance_matrix: The 2D distance matrix.
+    :param stops: Address indices the truck has to visit.
+    :return: Route list that starts and ends at the hub, ties go to the lowest index.
+    """
+    remaining = sorted(set(stops) - {hub_index})
+    route = [hub_index]
+    while remaining:
+        current_row = distance_matrix[route[-1]]
+        nearest = min(remaining, key=lambda index: current_row[index])
+        remaining.remove(nearest)
+        route.append(nearest)
+    route.append(hub_index)
+    return route
+
+
+def route_distance(route, distance_matrix):
+    """
+    Returns the total miles driven along the route.
+    """
+    return sum(float(distance_matrix[route[i]][route[i + 1]]) for i in range(len(route) - 1))
+
+
+def _local_matrix(locations, distance_matrix):
+    """
+    Returns the distances between just the given locations as nested lists of floats,
+    so the search reads plain Python floats instead of indexing the full matrix.
+    """
+    matrix = dense_array(distance_matrix)
+    if matrix is not None:
+        return matrix[np.ix_(locations, locations)].astype(float).tolist()
+    return [[float(distance_matrix[a][b]) for b in locations] for a in locations]
+
+
+def _neighbor_lists(local_matrix, neighbor_count):
+    """
+    Returns, for every local index, its neighbor_count closest other local indices, closest
+    first and ties to the lowest index.
+    """
+    size = len(local_matrix)
+    count = min(neighbor_count, size - 1)
+    if np is not None and count > 0:
+        matrix = np.array(local_matrix, dtype=float)
+        np.fill_diagonal(matrix, np.inf)
+        #Distance of each row's count-th closest neighbor, only the rows' closest few are sorted
+        cutoffs = np.partition(matrix, count - 1, axis=1)[:, count - 1]
+        neighbors = []
+        for row, cutoff in zip(matrix, cutoffs):
+            closer = np.flatnonzero(row < cutoff)
+            tied = np.flatnonzero(row == cutoff)[:count - len(closer)]
+            chosen = np.concatenate((closer, tied))
+            neighbors.append(chosen[np.lexsort((chosen, row[chosen]))].tolist())
+        return neighbors
+    neighbors = []
+    for a, row in enumerate(local_matrix):
+        candidates = sorted((b for b in range(size) if b != a), key=row.__getitem__)
+        neighbors.append(candidates[:neighbor_count])
+    return neighbors
+
+
+def improve_route(route, distance_matrix, time_budget=1.0, neighbor_count=8):
+    """
+    Improves a route with 2-opt and Or-opt local search until no move helps or the
+    time budget runs out.
+
+    :param route: Route list that starts and ends at the hub, such as a greedy route.
+        Each location must appear once between the two hub ends.
+    :param distance_matrix: The symmetric 2D distance matrix.
+    :param time_budget: Wall clock seconds the search may run.
+    :param neighbor_count: Number of closest locations tried as partners for each location.
+
+    Every move is scored by its delta, the few edges it removes and adds, so checking a move
+    never walks the route. Candidate moves only pair a location with the locations on its
+    neighbor list, which keeps each pass close to linear in the route length.
+    - 2-opt removes the edges (a, b) and (c, d) and reconnects them as (a, c) and (b, d),
+      reversing the stops between them.
+    - Or-opt moves a run of 1 to MAX_SEGMENT_LENGTH stops, in either direction, between
+      two other neighboring stops.
+    :return: The improved route list and its total distance.
+    """
+    if len(route) < 4:
+        return list(route), route_distance(route, distance_matrix)
+
+    #The budget covers building the local matrix and neighbor lists too
+    deadline = time.perf_counter() + time_budget
+
+    #Works on local indices 0..k-1 over the route's own locations
+    locations = sorted(set(route))
+    local_index = {location: index for index, location in enumerate(locations)}
+    local_matrix = _local_matrix(locations, distance_matrix)
+    neighbors = _neighbor_lists(local_matrix, neighbor_count)
+    route = [local_index[location] for location in route]
+
+    def dist(a, b):
+        return local_matrix[a][b]
+
+    def positions():
+        return {location: position for position, location in enumerate(route) if 0 < position < len(route) - 1}
+
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        position_of = positions()
+
+        #2-opt moves
+        for i in range(len(route) - 2):
+            if time.perf_counter() >= deadline:
+                break
+            a, b = route[i], route[i + 1]
+            removed_ab = dist(a, b)
+            for c in neighbors[a]:
+                gain_ac = removed_ab - dist(a, c)
+                #Neighbors are sorted, no closer partner is left to make (a, c) shorter than (a, b)
+                if gain_ac <= IMPROVEMENT_EPSILON:
+                    break
+                j = position_of.get(c)
+                if j is None or j <= i + 1:
+                    continue
+                d = route[j + 1]
+                delta = dist(a, c) + dist(b, d) - removed_ab - dist(c, d)
+                if delta < -IMPROVEMENT_EPSILON:
+                    route[i + 1:j + 1] = reversed(route[i + 1:j + 1])
+                    for position in range(i + 1, j + 1):
+                        position_of[route[position]] = position
+                    improved = True
+                    a, b = route[i], route[i + 1]
+                    removed_ab = dist(a, b)
+
+        #Or-opt moves
+        for segment_length in range(1, MAX_SEGMENT_LENGTH + 1):
+            i = 1
+            while i + segment_length < len(route):
+                if time.perf_counter() >= deadline:
+                    break
+                start, end = route[i], route[i + segment_length - 1]
+                previous, following = route[i - 1], route[i + segment_length]
+                removal_gain = dist(previous, start) + dist(end, following) - dist(previous, following)
+                segment = route[i:i + segment_length]
+
+                best = None
+                for anchor in neighbors[start] + neighbors[end]:
+                    j = position_of.get(anchor, 0 if anchor == route[0] else None)
+                    if j is None or i - 1 <= j < i + segment_length:
+                        continue
+                    after = route[j + 1]
+                    #Inserted as anchor -> segment -> after, or reversed
+                    forward = dist(anchor, start) + dist(end, after) - dist(anchor, after)
+                    backward = dist(anchor, end) + dist(start, after) - dist(anchor, after)
+                    insert_cost, reverse = (forward, False) if forward <= backward else (backward, True)
+                    delta = insert_cost - removal_gain
+                    if delta < -IMPROVEMENT_EPSILON and (best is None or delta < best[0]):
+                        best = (delta, j, reverse)
+
+                if best is None:
+                    i += 1
+                    continue
+                _, j, reverse = best
+                moved = segment[::-1] if reverse else segment
+                del route[i:i + segment_length]
+                insert_at = j + 1 if j < i else j + 1 - segment_length
+                route[insert_at:insert_at] = moved
+                #Only the stops between the old and new place of the segment moved
+                for position in range(min(i, insert_at), max(i, insert_at) + segment_length):
+                    position_of[route[position]] = position
+                improved = True
+                i += 1
+
+    route = [locations[index] for index in route]
+    return route, route_distance(route, distance_matrix)
+
+
+def plan_truck_route(truck, distance_matrix, package_table, address_map, time_budget=1.0, hub_index=0):
+    """
+    Plans the stop order for a truck: a greedy route over its stops improved by improve_route.
+    The result can be passed to deliver_packages as planned_route.
+
+    :param truck: Truck object with its package ids.
+    :param time_budget: Wall clock seconds the local search may run.
+    :return: Route list of address indices that starts and ends at the hub.
+    """
+    stops = set()
+    for package_id in truck.package_ids:
+        package = package_table.lookup(package_id)
+        #Packages whose address matches no location stay at the hub
+        index = address_map.index_of(package) if package else None
+        if index is not None:
+            stops.add(index)
+    route = greedy_route(distance_matrix, stops, hub_index)
+    return improve_route(route, distance_matrix, time_budget)[0]
@@ -0,0 +1,277 @@
+"""
+Headless batch runner for what-if scenarios.
+
+Reads a JSON scenario file, simulates every scenario in parallel worker processes and
+writes a summary table of mileage, on-time rate and finish time per scenario. The distance
+matrix and parsed packages are loaded once in the parent process. Workers forked from it
+share them copy-on-write, and each scenario works on its own copies of the packages.
+
+    python scenarioRunner.py scenarios.json --output summary.csv
+
+A scenario file holds the data files, defaults for every scenario and the scenarios, where
+each scenario only lists what it changes from the defaults:
+
+    {
+      "distance_file": "wgupsDistanceFile.csv",
+      "package_file": "wgupsPackageFile.csv",
+      "defaults": {"drivers": 2, "speed": 18, "start_time": "08:00"},
+      "scenarios": [
+        {"name": "baseline"},
+        {"name": "three drivers", "drivers": 3},
+        {"name": "four trucks", "assignment": "auto", "trucks": 4}
+      ]
+    }
+
+Scenario settings:
+- drivers: Number of drivers shared by the trucks.
+- speed: Truck speed in miles per hour.
+- start_time, start_times: "HH:MM" every truck may leave, or one time per truck.
+- assignment: "manual" loads truck_packages, main.TRUCK_PACKAGES by default, and "auto"
+  assigns the packages to "trucks" trucks with packageAssignment.assign_packages.
+- address_correction_time: "HH:MM" the "Wrong address" corrections come in.
+- deadline_aware: true routes with deadlineRouting.DeadlineSelector instead of plain
+  nearest stop.
+"""
+import argparse
+import copy
+import csv
+import json
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from csvDistanceFileReader import load_distance_matrix
+from csvPackageFileReader import iter_package_batches
+from deadlineRouting import late_reachable_packages
+from eventSimulation import FleetSimulation
+from hashTable import HashTable
+from main import TRUCK_PACKAGES
+from packageAssignment import assign_packages
+from truckClass import TRUCK_SPEED, Truck
+
+#Settings used where neither the scenario nor the file's defaults give one
+DEFAULT_SETTINGS = {
+    "drivers": 2,
+    "speed": TRUCK_SPEED,
+    "start_time": "08:00",
+    "assignment": "manual",
+    "trucks": len(TRUCK_PACKAGES),
+    "address_correction_time": "10:20",
+    "deadline_aware": False,
+}
+#Columns of the summary table, in order
+SUMMARY_COLUMNS = (
+    "name", "trucks", "drivers", "speed", "assignment", "total_mileage", "packages",
+    "delivered", "on_time", "on_time_rate", "late_reachable", "finish_time", "runtime_seconds", "error",
+)
+#The simulated day, all scenario times are on it
+SIMULATION_DAY = datetime(1900, 1, 1)
+
+#Distance data and parsed packages, loaded once per process by _load_shared
+_shared = {}
+
+
+def load_scenarios(scenario_file_path):
+    """
+    Reads a scenario file.
+    :return: The file's settings dictionary and the list of scenarios, each merged over
+        the defaults and named "scenario N" if it has no name.
+    """
+    with open(scenario_file_path, mode='r', encoding='utf-8') as scenario_file:
+        settings = json.load(scenario_file)
+    defaults = dict(DEFAULT_SETTINGS)
+    defaults.update(settings.get("defaults", {}))
+    scenarios = []
+    for number, scenario in enumerate(settings.get("scenarios", []), start=1):
+        merged = dict(defaults)
+        merged.update(scenario)
+        merged.setdefault("name", f"scenario {number}")
+        scenarios.append(merged)
+    return settings, scenarios
+
+
+def _load_shared(distance_file, package_file):
+    """
+    Loads the distance matrix and packages into _shared, unless this process already has
+    them, such as a worker forked from the parent.
+    """
+    key = (distance_file, package_file)
+    if _shared.get("key") == key:
+        return
+    distance_matrix, addresses, address_map = load_distance_matrix(distance_file, dtype="float64")
+    packages = [package for batch in iter_package_batches(package_file) for package in batch]
+    address_map.resolve_packages(packages)
+    _shared.update(
+        key=key, distance_matrix=distance_matrix, addresses=addresses,
+        address_map=address_map, packages=packages,
+    )
+
+
+def _clock_time(text, day=SIMULATION_DAY):
+    """
+    Converts "HH:MM" into a datetime on day, the simulated day by default.
+    """
+    return datetime.combine(day.date(), datetime.strptime(text, "%H:%M").time())
+
+
+def _build_trucks(scenario, package_table, distance_matrix, address_map, hub_index=0, day=SIMULATION_DAY):
+    """
+    Creates the scenario's trucks and loads their packages.
+    """
+    if scenario["assignment"] == "manual":
+        truck_packages = scenario.get("truck_packages", TRUCK_PACKAGES)
+        truck_count = len(truck_packages)
+    elif scenario["assignment"] == "auto":
+        truck_packages = None
+        truck_count = scenario["trucks"]
+    else:
+        raise ValueError(f"Unknown assignment strategy {scenario['assignment']!r}")
+
+    start_times = scenario.get("start_times") or [scenario["start_time"]] * truck_count
+    if len(start_times) != truck_count:
+        raise ValueError(f"{len(start_times)} start times given for {truck_count} trucks")
+    trucks = [
+        Truck(number + 1, list(truck_packages[number]) if truck_packages else [],
+              _clock_time(start_times[number], day), speed=scenario["speed"])
+        for number in range(truck_count)
+    ]
+    if truck_packages is None:
+        assign_packages(package_table, trucks, distance_matrix, address_map, scenario["drivers"], hub_index)
+    return trucks
+
+
+def simulate(scenario, distance_matrix, address_map, packages, hub_index=0, day=SIMULATION_DAY):
+    """
+    Builds the scenario's fleet and simulates it, the packages are updated in place.
+
+    :param scenario: Scenario dictionary with every DEFAULT_SETTINGS key.
+    :param packages: List of Package objects to deliver.
+    :param hub_index: Address index of the depot the trucks leave from.
+    :param day: Midnight of the day simulated, the scenario's times are on it.
+    :return: The FleetSimulation after its run, with the trucks and their recorded legs.
+    """
+    package_table = HashTable()
+    package_table.bulk_insert((package.package_id, package) for package in packages)
+
+    trucks = _build_trucks(scenario, package_table, distance_matrix, address_map, hub_index, day)
+    simulation = FleetSimulation(
+        distance_matrix, package_table, address_map, driver_count=scenario["drivers"], hub_index=hub_index,
+        integer_clock=True, deadline_aware=scenario["deadline_aware"],
+    )
+    for truck in trucks:
+        simulation.add_truck(truck)
+    wrong_address_ids = [package.package_id for package in packages if package.constraints.address_correction]
+    if wrong_address_ids:
+        simulation.add_address_correction(_clock_time(scenario["address_correction_time"], day), wrong_address_ids)
+    simulation.run()
+    return simulation
+
+
+def run_scenario(scenario):
+    """
+    Simulates one scenario on copies of the shared packages.
+    :return: Dictionary with one value for each of SUMMARY_COLUMNS.
+    """
+    start = time.perf_counter()
+    summary = dict.fromkeys(SUMMARY_COLUMNS, "")
+    summary.update(
+        name=scenario["name"], drivers=scenario["drivers"], speed=scenario["speed"],
+        assignment=scenario["assignment"],
+    )
+    try:
+        packages = [copy.copy(package) for package in _shared["packages"]]
+        simulation = simulate(scenario, _shared["distance_matrix"], _shared["address_map"], packages)
+        trucks = simulation.trucks
+
+        delivered = [package for package in packages if package.delivery_time is not None]
+        on_time = sum(
+            1 for package in delivered
+            if package.delivery_time <= SIMULATION_DAY + timedelta(minutes=package.deadline_minutes)
+        )
+        summary.update(
+            trucks=len(trucks),
+            total_mileage=round(sum(truck.mileage for truck in trucks), 1),
+            packages=len(packages),
+            delivered=len(delivered),
+            on_time=on_time,
+            on_time_rate=round(on_time / len(packages), 4) if packages else 1.0,
+            late_reachable=len(late_reachable_packages(simulation)),
+            finish_time=max(truck.current_time for truck in trucks).strftime("%H:%M:%S"),
+        )
+    except ValueError as error:
+        summary["error"] = str(error)
+    summary["runtime_seconds"] = round(time.perf_counter() - start, 4)
+    return summary
+
+
+def run_scenarios(scenarios, distance_file, package_file, max_workers=None):
+    """
+    Runs every scenario and returns their summaries in scenario order.
+
+    :param max_workers: Number of worker processes, 0 runs every scenario in this process.
+    """
+    _load_shared(distance_file, package_file)
+    if max_workers == 0:
+        return [run_scenario(scenario) for scenario in scenarios]
+    #Forked workers inherit _shared, spawned workers load it once in the initializer
+    start_method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context(start_method),
+        initializer=_load_shared,
+        initargs=(distance_file, package_file),
+    ) as executor:
+        return list(executor.map(run_scenario, scenarios))
+
+
+def write_summary(summaries, csv_file_path):
+    """
+    Writes the summary table to a CSV file.
+    """
+    with open(csv_file_path, mode='w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=SUMMARY_COLUMNS)
+        writer.writeheader()
+        writer.writerows(summaries)
+
+
+def print_summary(summaries):
+    """
+    Prints the summary table, one scenario per line. Late* counts the packages delivered
+    late that their truck could have reached in time, see late_reachable_packages.
+    """
+    print(f"{'Scenario':<24}{'Trucks':>7}{'Drivers':>8}{'Speed':>7}{'Miles':>9}{'On time':>9}{'Late*':>7}{'Finish':>10}")
+    for summary in summaries:
+        if summary["error"]:
+            print(f"{summary['name']:<24}  error: {summary['error']}")
+            continue
+        print(
+            f"{summary['name']:<24}{summary['trucks']:>7}{summary['drivers']:>8}{summary['speed']:>7}"
+            f"{summary['total_mileage']:>9.1f}{summary['on_time_rate']:>9.1%}{summary['late_reachable']:>7}"
+            f"{summary['finish_time']:>10}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run what-if fleet scenarios without the user interface.")
+    parser.add_argument("scenario_file", help="JSON scenario file.")
+    parser.add_argument("--output", help="Write the summary table to this CSV file.")
+    parser.add_argument("--workers", type=int, help="Number of worker processes, 0 runs in this process.")
+    args = parser.parse_args(argv)
+
+    settings, scenarios = load_scenarios(args.scenario_file)
+    summaries = run_scenarios(
+        scenarios,
+        settings.get("distance_file", "wgupsDistanceFile.csv"),
+        settings.get("package_file", "wgupsPackageFile.csv"),
+        args.workers,
+    )
+    print_summary(summaries)
+    if args.output:
+        write_summary(summaries, args.output)
+    return 1 if any(summary["error"] for summary in summaries) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,444 @@
+"""
+Versioned binary snapshots of a finished simulation.
+
+A snapshot holds the package table with its depart and delivery times, the truck mileage
+and finish times and each truck's LegLog, so a day can be opened for status queries without
+parsing the CSVs or simulating again. Opening a snapshot memory maps the file and reads its
+header, the columns are views into the mapped file, so it takes the same time for any
+manifest size. The snapshot answers the user interface's queries like a StatusIndex:
+single packages and status counts at a time come straight from the mapped columns with
+binary searches, and Package objects are only built for the packages shown in detail.
+
+File layout, all numbers in the byte order named in the header:
+    magic b"WGUPSNAP", uint32 format version, uint32 header length,
+    JSON header: day, byte order, source file hashes, row counts and the
+        (offset, array typecode, length) of every section,
+    sections, each starting on an 8 byte boundary.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+from csvDistanceFileReader import _file_hash
+from hashTable import HashTable
+from packageClass import STATUS_AT_HUB, STATUS_DELIVERED, STATUS_EN_ROUTE, STATUS_NAMES, STATUS_UNMATCHED, Package
+from truckClass import LegLog, Truck, to_clock
+
+SNAPSHOT_MAGIC = b"WGUPSNAP"
+#Bumped whenever the layout changes, older versions are refused rather than misread
+SNAPSHOT_VERSION = 3
+_PREFIX = struct.Struct("<8sII")
+#Stored for a package that never departs or is never delivered
+_NEVER = 2 ** 62
+#Package text fields, each stored as a column of indexes into one pool of unique strings
+_TEXT_FIELDS = ("address", "city", "state", "zip_code", "delivery_deadline", "weight", "note")
+
+
+def _to_micros(time, day):
+    """
+    Converts a datetime into integer microseconds since day, _NEVER for None.
+    """
+    if time is None:
+        return _NEVER
+    delta = time - day
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def _from_micros(micros, day):
+    """
+    Converts microseconds since day into a datetime, None for _NEVER.
+    """
+    if micros == _NEVER:
+        return None
+    return day + timedelta(microseconds=micros)
+
+
+def source_hashes(*paths, parameters=None):
+    """
+    Returns a dictionary of file name -> sha256 of its contents, stored in a snapshot so
+    it can be checked against the input files later.
+    :param parameters: Optional JSON compatible simulation settings, kept under "parameters"
+        so a snapshot only matches a run with the same settings.
+    """
+    sources = {os.path.basename(path): _file_hash(path) for path in paths}
+    if parameters is not None:
+        sources["parameters"] = json.loads(json.dumps(parameters))
+    return sources
+
+
+def save_snapshot(path, package_table, trucks, day=datetime(1900, 1, 1), sources=None):
+    """
+    Writes a finished simulation to a snapshot file.
+
+    :param path: Snapshot file to write, replaced in one step once it is complete.
+    :param package_table: Hash table of simulated packages.
+    :param trucks: List of simulated trucks, their leg logs are saved with them.
+    :param day: Midnight of the simulated day, times are stored relative to it.
+    :param sources: Optional source_hashes of the input files, see Snapshot.matches.
+    """
+    package_ids = sorted(package_table)
+    packages = [package_table.lookup(package_id) for package_id in package_ids]
+
+    #package id -> truck id, first truck listing the package wins like StatusIndex
+    truck_of = {}
+    for truck in trucks:
+        for package_id in truck.package_ids:
+            truck_of.setdefault(package_id, truck.truck_id)
+
+    pool = []
+    pool_lookup = {}
+
+    def intern(text):
+        index = pool_lookup.get(text)
+        if index is None:
+            index = pool_lookup[text] = len(pool)
+            pool.append(text)
+        return index
+
+    depart_micros = array('q', (_to_micros(package.depart_time, day) for package in packages))
+    delivery_micros = array('q', (_to_micros(package.delivery_time, day) for package in packages))
+    sections = {
+        "package_ids": array('q', package_ids),
+        "status_codes": array('b', (STATUS_NAMES.index(package.status) for package in packages)),
+        "truck_ids": array('q', (truck_of.get(package_id, -1) for package_id in package_ids)),
+        "depart_micros": depart_micros,
+        "delivery_micros": delivery_micros,
+        "sorted_depart_micros": array('q', sorted(micros for micros in depart_micros if micros != _NEVER)),
+        "sorted_delivery_micros": array('q', sorted(micros for micros in delivery_micros if micros != _NEVER)),
+    }
+    for field in _TEXT_FIELDS:
+        sections[field] = array('i', (intern(str(getattr(package, field) or "")) for package in packages))
+
+    encoded = [text.encode('utf-8') for text in pool]
+    text_offsets = array('q', [0])
+    for text in encoded:
+        text_offsets.append(text_offsets[-1] + len(text))
+    sections["text_offsets"] = text_offsets
+    sections["text"] = array('B', b"".join(encoded))
+
+    #Every truck's legs one after another, leg_offsets marks where each truck's start
+    leg_offsets = array('q', [0])
+    legs = {field: array(getattr(LegLog(), field).typecode) for field in LegLog.FIELDS}
+    for truck in trucks:
+        leg_log = truck.leg_log
+        shift = to_clock(leg_log.day, day) if leg_log.day is not None else 0
+        for field in LegLog.FIELDS:
+            values = getattr(leg_log, field)
+            if shift and field in ("departs", "arrives"):
+                values = (clock + shift for clock in values)
+            legs[field].extend(values)
+        leg_offsets.append(len(legs["departs"]))
+    sections.update(
+        truck_ids_by_truck=array('q', (truck.truck_id for truck in trucks)),
+        truck_mileage=array('d', (truck.mileage for truck in trucks)),
+        truck_finish_micros=array('q', (_to_micros(truck.current_time, day) for truck in trucks)),
+        leg_offsets=leg_offsets,
+    )
+    sections.update(("leg_" + field, values) for field, values in legs.items())
+
+    #Sections start after the header, whose length depends on their offsets, so the
+    # header is rebuilt with a larger data start until it fits in front of the data
+    layout = {}
+    offset = 0
+    for name, values in sections.items():
+        layout[name] = [offset, values.typecode, len(values)]
+        offset += -(-len(values) * values.itemsize // 8) * 8
+    header = {
+        "day": day.isoformat(),
+        "byteorder": sys.byteorder,
+        "sources": sources or {},
+        "packages": len(package_ids),
+        "unmatched": sum(package.status == STATUS_NAMES[STATUS_UNMATCHED] for package in packages),
+        "trucks": len(trucks),
+    }
+    data_start = 0
+    while True:
+        header["sections"] = {
+            name: [data_start + start, typecode, length] for name, (start, typecode, length) in layout.items()
+        }
+        header_bytes = json.dumps(header).encode('utf-8')
+        if _PREFIX.size + len(header_bytes) <= data_start:
+            break
+        data_start = -(-(_PREFIX.size + len(header_bytes) + 64) // 8) * 8
+    header_bytes = header_bytes.ljust(data_start - _PREFIX.size)
+
+    with open(path + ".tmp", mode='wb') as snapshot_file:
+        snapshot_file.write(_PREFIX.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header_bytes)))
+        snapshot_file.write(header_bytes)
+        for values in sections.values():
+            values.tofile(snapshot_file)
+            snapshot_file.write(b"\0" * (-len(values) * values.itemsize % 8))
+    os.replace(path + ".tmp", path)
+
+
+class Snapshot:
+    """
+    A snapshot file opened for queries. Columns are memoryviews into the mapped file,
+    except on a machine of the other byte order, where they are read into swapped arrays.
+    """
+    def __init__(self, path):
+        """
+        :param path: Snapshot file written by save_snapshot.
+        :raises ValueError: If the file is not a snapshot, is truncated or has another format
+            version.
+        """
+        self.path = path
+        with open(path, mode='rb') as snapshot_file:
+            self._map = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < _PREFIX.size:
+            self.close()
+            raise ValueError(f"{path} is not a simulation snapshot")
+        magic, version, header_length = _PREFIX.unpack_from(self._map)
+        if magic != SNAPSHOT_MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a simulation snapshot")
+        if version != SNAPSHOT_VERSION:
+            self.close()
+            raise ValueError(f"{path} is snapshot version {version}, expected {SNAPSHOT_VERSION}")
+        try:
+            header = json.loads(self._map[_PREFIX.size:_PREFIX.size + header_length])
+        except ValueError:
+            self.close()
+            raise ValueError(f"{path} has an unreadable snapshot header") from None
+        if any(offset + length * array(typecode).itemsize > len(self._map)
+               for offset, typecode, length in header["sections"].values()):
+            self.close()
+            raise ValueError(f"{path} is truncated")
+
+        self.day = datetime.fromisoformat(header["day"])
+        self.sources = header["sources"]
+        self.package_count = header["packages"]
+        self.unmatched_count = header["unmatched"]
+        self.truck_count = header["trucks"]
+        self._view = memoryview(self._map)
+        self._columns = {}
+        for name, (offset, typecode, length) in header["sections"].items():
+            size = length * array(typecode).itemsize
+            if header["byteorder"] == sys.byteorder:
+                column = self._view[offset:offset + size].cast(typecode)
+            else:
+                column = array(typecode, self._view[offset:offset + size].tobytes())
+                column.byteswap()
+            self._columns[name] = column
+        self._text_cache = {}
+        #Package ids in row order, and the miles driven by the whole fleet
+        self.package_ids = self._columns["package_ids"]
+        self.total_mileage = sum(self._columns["truck_mileage"])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Releases the columns and unmaps the file.
+        """
+        for column in getattr(self, "_columns", {}).values():
+            if isinstance(column, memoryview):
+                column.release()
+        self._columns = {}
+        if getattr(self, "_view", None) is not None:
+            self._view.release()
+            self._view = None
+        self._map.close()
+
+    def __len__(self):
+        """
+        Returns the number of packages in the snapshot.
+        """
+        return self.package_count
+
+    def matches(self, sources):
+        """
+        Returns True when the snapshot was saved from the input files and settings with
+        these source_hashes.
+        """
+        return self.sources == sources
+
+    def _text(self, index):
+        """
+        Returns string index from the string pool.
+        """
+        text = self._text_cache.get(index)
+        if text is None:
+            offsets = self._columns["text_offsets"]
+            text = bytes(self._columns["text"][offsets[index]:offsets[index + 1]]).decode('utf-8')
+            self._text_cache[index] = text
+        return text
+
+    def row_of(self, package_id):
+        """
+        Returns the row number of the package id, or None if it is not in the snapshot.
+        """
+        package_ids = self._columns["package_ids"]
+        row = bisect_left(package_ids, package_id)
+        if row < len(package_ids) and package_ids[row] == package_id:
+            return row
+        return None
+
+    def to_package(self, row):
+        """
+        Builds a Package object holding the data from the given row.
+        """
+        columns = self._columns
+        fields = {field: self._text(columns[field][row]) for field in _TEXT_FIELDS}
+        package = Package(package_id=columns["package_ids"][row], **fields)
+        package.status = STATUS_NAMES[columns["status_codes"][row]]
+        package.depart_time = _from_micros(columns["depart_micros"][row], self.day)
+        package.delivery_time = _from_micros(columns["delivery_micros"][row], self.day)
+        return package
+
+    def lookup(self, package_id):
+        """
+        Looks up a package by its ID number and returns it as a Package object, or None.
+        """
+        row = self.row_of(package_id)
+        return None if row is None else self.to_package(row)
+
+    def truck_of(self, package_id):
+        """
+        Returns the id of the truck carrying the package, or None.
+        """
+        row = self.row_of(package_id)
+        if row is None or self._columns["truck_ids"][row] < 0:
+            return None
+        return self._columns["truck_ids"][row]
+
+    def truck_assignment(self, package_id):
+        """
+        Returns "Truck N" for the truck carrying the package, or None, like StatusIndex.
+        """
+        truck_id = self.truck_of(package_id)
+        return f"Truck {truck_id}" if truck_id is not None else None
+
+    @property
+    def packages(self):
+        """
+        Package objects for every row in package_ids order, each built as it is reached.
+        """
+        return map(self.to_package, range(self.package_count))
+
+    def statuses_at(self, check_time):
+        """
+        Returns the status of every package at check_time, in package_ids order, with the
+        same text as Package.get_status_at, read from the mapped columns without building
+        any Package.
+        """
+        check_micros = _to_micros(check_time, self.day)
+        columns = self._columns
+        #"Delivered at HH:MM AM" text by delivery minute
+        labels = {}
+        statuses = []
+        for code, depart, delivery in zip(
+            columns["status_codes"], columns["depart_micros"], columns["delivery_micros"]
+        ):
+            if code == STATUS_UNMATCHED:
+                statuses.append(STATUS_NAMES[STATUS_UNMATCHED])
+            elif delivery <= check_micros:
+                minute = delivery // 60000000
+                label = labels.get(minute)
+                if label is None:
+                    label = labels[minute] = f"Delivered at {_from_micros(delivery, self.day).strftime('%I:%M %p')}"
+                statuses.append(label)
+            elif depart <= check_micros:
+                statuses.append(STATUS_NAMES[STATUS_EN_ROUTE])
+            else:
+                statuses.append(STATUS_NAMES[STATUS_AT_HUB])
+        return tuple(statuses)
+
+    def status_at(self, package_id, check_time):
+        """
+        Returns the status of the package at check_time with the same text as
+        Package.get_status_at, or None if the package is not in the snapshot.
+        """
+        row = self.row_of(package_id)
+        if row is None:
+            return None
+        if self._columns["status_codes"][row] == STATUS_UNMATCHED:
+            return STATUS_NAMES[STATUS_UNMATCHED]
+        check_micros = _to_micros(check_time, self.day)
+        delivery = self._columns["delivery_micros"][row]
+        if delivery <= check_micros:
+            return f"Delivered at {_from_micros(delivery, self.day).strftime('%I:%M %p')}"
+        if self._columns["depart_micros"][row] <= check_micros:
+            return STATUS_NAMES[STATUS_EN_ROUTE]
+        return STATUS_NAMES[STATUS_AT_HUB]
+
+    def counts_at(self, check_time):
+        """
+        Returns a dictionary of status name -> number of packages in that status at check_time,
+        unmatched addresses only when there are any.
+        """
+        check_micros = _to_micros(check_time, self.day)
+        delivered = bisect_right(self._columns["sorted_delivery_micros"], check_micros)
+        departed = bisect_right(self._columns["sorted_depart_micros"], check_micros)
+        counts = {
+            STATUS_NAMES[STATUS_AT_HUB]: self.package_count - departed - self.unmatched_count,
+            STATUS_NAMES[STATUS_EN_ROUTE]: departed - delivered,
+            STATUS_NAMES[STATUS_DELIVERED]: delivered,
+        }
+        if self.unmatched_count:
+            counts[STATUS_NAMES[STATUS_UNMATCHED]] = self.unmatched_count
+        return counts
+
+    def leg_log(self, position):
+        """
+        Returns the LegLog of the truck at position in the snapshot's truck list, times
+        are ticks since the snapshot's day.
+        """
+        offsets = self._columns["leg_offsets"]
+        start, end = offsets[position], offsets[position + 1]
+        leg_log = LegLog(self.day)
+        for field in LegLog.FIELDS:
+            getattr(leg_log, field).frombytes(self._columns["leg_" + field][start:end].tobytes())
+        return leg_log
+
+    def route(self, position):
+        """
+        Returns the list of location indexes visited by the truck at position in the
+        snapshot's truck list.
+        """
+        offsets = self._columns["leg_offsets"]
+        return self._columns["leg_to_indexes"][offsets[position]:offsets[position + 1]].tolist()
+
+    def package_table(self):
+        """
+        Builds a hash table of Package objects from every row. The user interface does not
+        need it, it queries the snapshot itself.
+        """
+        package_table = HashTable()
+        package_table.bulk_insert(
+            (package.package_id, package) for package in map(self.to_package, range(self.package_count))
+        )
+        return package_table
+
+    def trucks(self):
+        """
+        Rebuilds the trucks with their package ids, mileage, finish times and leg logs.
+        """
+        package_ids = {}
+        for package_id, truck_id in zip(self._columns["package_ids"], self._columns["truck_ids"]):
+            package_ids.setdefault(truck_id, []).append(package_id)
+        trucks = []
+        for position, (truck_id, mileage, finish) in enumerate(zip(
+            self._columns["truck_ids_by_truck"], self._columns["truck_mileage"], self._columns["truck_finish_micros"]
+        )):
+            truck = Truck(truck_id, package_ids.get(truck_id, []), _from_micros(finish, self.day))
+            truck.mileage = mileage
+            truck.leg_log = self.leg_log(position)
+            trucks.append(truck)
+        return trucks
+
+
+def load_snapshot(path):
+    """
+    Opens a snapshot file, see Snapshot.
+    """
+    return Snapshot(path)
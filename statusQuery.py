@@ -0,0 +1,170 @@
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from functools import lru_cache
+
+from packageClass import STATUS_AT_HUB, STATUS_DELIVERED, STATUS_EN_ROUTE, STATUS_NAMES, STATUS_UNMATCHED
+
+#NumPy is optional, without it statuses are compared one package at a time
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#Times are kept as integer microseconds since this epoch so comparisons are exact
+_EPOCH = datetime(1900, 1, 1)
+#Stands in for a package that never departs or is never delivered
+_NEVER = 2 ** 62
+
+
+def _to_micros(time):
+    """
+    Converts a datetime into integer microseconds since the epoch, _NEVER for None.
+    """
+    if time is None:
+        return _NEVER
+    delta = time - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+class StatusIndex:
+    """
+    Time indexed view of a finished simulation for answering status queries.
+
+    Built once from the package table and trucks, it keeps a package id -> truck id
+    dictionary and the depart and delivery times of every package as integer arrays, in
+    package id order and sorted. "Status of all packages at T" is a vectorized comparison
+    against the arrays and "counts by status at T" is two binary searches over the sorted
+    arrays. Answers for recently asked times come from an LRU cache.
+    """
+    def __init__(self, package_table, trucks, cache_size=128):
+        """
+        :param package_table: Hash table of simulated packages.
+        :param trucks: List of simulated trucks.
+        :param cache_size: Number of query times kept in each LRU cache.
+        """
+        self.package_ids = sorted(package_table)
+        self.packages = [package_table.lookup(package_id) for package_id in self.package_ids]
+
+        #Miles driven by the whole fleet
+        self.total_mileage = sum(truck.mileage for truck in trucks)
+
+        #package id -> truck id, first truck listing the package wins like the old scan
+        self.truck_ids = {}
+        for truck in trucks:
+            for package_id in truck.package_ids:
+                self.truck_ids.setdefault(package_id, truck.truck_id)
+
+        depart_micros = [_to_micros(package.depart_time) for package in self.packages]
+        delivery_micros = [_to_micros(package.delivery_time) for package in self.packages]
+        self.sorted_depart_micros = sorted(micros for micros in depart_micros if micros != _NEVER)
+        self.sorted_delivery_micros = sorted(micros for micros in delivery_micros if micros != _NEVER)
+        if np is not None:
+            depart_micros = np.array(depart_micros, dtype=np.int64)
+            delivery_micros = np.array(delivery_micros, dtype=np.int64)
+        self.depart_micros = depart_micros
+        self.delivery_micros = delivery_micros
+
+        #Positions of packages whose address matched no location, they never leave the hub
+        self.unmatched_positions = [
+            position for position, package in enumerate(self.packages)
+            if package.status == STATUS_NAMES[STATUS_UNMATCHED]
+        ]
+
+        #Status text for each package once it is delivered
+        self.delivered_labels = [
+            f"Delivered at {package.delivery_time.strftime('%I:%M %p')}" if package.delivery_time else None
+            for package in self.packages
+        ]
+
+        self.status_codes_at = lru_cache(maxsize=cache_size)(self._status_codes_at)
+        self.statuses_at = lru_cache(maxsize=cache_size)(self._statuses_at)
+        self._cached_counts_at = lru_cache(maxsize=cache_size)(self._counts_at)
+
+    def truck_assignment(self, package_id):
+        """
+        Returns "Truck N" for the truck carrying the package, or None.
+        """
+        truck_id = self.truck_ids.get(package_id)
+        return f"Truck {truck_id}" if truck_id is not None else None
+
+    def position_of(self, package_id):
+        """
+        Returns the position of the package in package_ids, or None for an unknown id.
+        """
+        position = bisect_left(self.package_ids, package_id)
+        if position < len(self.package_ids) and self.package_ids[position] == package_id:
+            return position
+        return None
+
+    def status_of(self, package_id, check_time):
+        """
+        Returns the status of one package at check_time, with the same text as
+        Package.get_status_at, or None for an unknown package id. Two comparisons against
+        the time arrays, the other packages are not looked at.
+        """
+        position = self.position_of(package_id)
+        if position is None:
+            return None
+        if self.packages[position].status == STATUS_NAMES[STATUS_UNMATCHED]:
+            return STATUS_NAMES[STATUS_UNMATCHED]
+        check_micros = _to_micros(check_time)
+        if self.delivery_micros[position] <= check_micros:
+            return self.delivered_labels[position]
+        if self.depart_micros[position] <= check_micros:
+            return STATUS_NAMES[STATUS_EN_ROUTE]
+        return STATUS_NAMES[STATUS_AT_HUB]
+
+    def _status_codes_at(self, check_time):
+        """
+        Returns the status code of every package at check_time, in package_ids order.
+        """
+        check_micros = _to_micros(check_time)
+        if np is not None:
+            codes = np.full(len(self.packages), STATUS_AT_HUB, dtype=np.int8)
+            codes[self.depart_micros <= check_micros] = STATUS_EN_ROUTE
+            codes[self.delivery_micros <= check_micros] = STATUS_DELIVERED
+            codes[self.unmatched_positions] = STATUS_UNMATCHED
+            return tuple(codes.tolist())
+        codes = [
+            STATUS_DELIVERED if delivery <= check_micros
+            else STATUS_EN_ROUTE if depart <= check_micros
+            else STATUS_AT_HUB
+            for depart, delivery in zip(self.depart_micros, self.delivery_micros)
+        ]
+        for position in self.unmatched_positions:
+            codes[position] = STATUS_UNMATCHED
+        return tuple(codes)
+
+    def _statuses_at(self, check_time):
+        """
+        Returns the status of every package at check_time, in package_ids order, with the
+        same text as Package.get_status_at.
+        """
+        return tuple(
+            self.delivered_labels[position] if code == STATUS_DELIVERED else STATUS_NAMES[code]
+            for position, code in enumerate(self.status_codes_at(check_time))
+        )
+
+    def _counts_at(self, check_time):
+        """
+        Returns (status name, number of packages in that status) pairs at check_time,
+        unmatched addresses only when there are any.
+        """
+        check_micros = _to_micros(check_time)
+        delivered = bisect_right(self.sorted_delivery_micros, check_micros)
+        departed = bisect_right(self.sorted_depart_micros, check_micros)
+        unmatched = len(self.unmatched_positions)
+        counts = (
+            (STATUS_NAMES[STATUS_AT_HUB], len(self.packages) - departed - unmatched),
+            (STATUS_NAMES[STATUS_EN_ROUTE], departed - delivered),
+            (STATUS_NAMES[STATUS_DELIVERED], delivered),
+        )
+        return counts + ((STATUS_NAMES[STATUS_UNMATCHED], unmatched),) if unmatched else counts
+
+    def counts_at(self, check_time):
+        """
+        Returns a dictionary of status name -> number of packages in that status at check_time.
+        The cache holds the counts as a tuple and every call gets its own dictionary, so a
+        caller changing it does not change later answers.
+        """
+        return dict(self._cached_counts_at(check_time))
@@ -0,0 +1,77 @@
+import csv
+import math
+import random
+
+#Notes written to synthetic packages, in the wording of the WGUPS package file
+SYNTHETIC_NOTES = (
+    "Can only be on truck 2",
+    "Delayed on flight---will not arrive to depot until 9:05 am",
+    "Wrong address listed",
+)
+SYNTHETIC_DEADLINES = ("9:00 AM", "10:30 AM", "EOD", "EOD", "EOD")
+
+
+def generate_city(stop_count, seed=0, city_size=30.0):
+    """
+    Generates a random city of stop_count locations, the first one is the hub.
+
+    :param stop_count: Number of locations including the hub.
+    :param seed: Seed for the random generator, the same seed always gives the same city.
+    :param city_size: Width and height of the square city in miles.
+    :return: List of full address strings and a list of (x, y) coordinates in miles.
+    """
+    rng = random.Random(seed)
+    addresses = []
+    points = []
+    for index in range(stop_count):
+        street = f"{index + 1} {rng.choice(('N', 'S', 'E', 'W'))} {rng.randint(1, 99) * 100} Synthetic St"
+        addresses.append(f"{street}, Salt Lake City, UT, {84100 + rng.randint(0, 99)}")
+        points.append((rng.uniform(0, city_size), rng.uniform(0, city_size)))
+    return addresses, points
+
+
+def write_distance_csv(csv_file_path, addresses, points):
+    """
+    Writes a triangular distance CSV in the same format as wgupsDistanceFile.csv:
+    row i is the full address followed by the distances to locations 0 through i,
+    rounded to a tenth of a mile, ending with 0.0 on the diagonal.
+    """
+    with open(csv_file_path, mode='w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file)
+        for i, (x, y) in enumerate(points):
+            row = [addresses[i]]
+            for j in range(i):
+                other_x, other_y = points[j]
+                row.append(f"{math.hypot(x - other_x, y - other_y):.1f}")
+            row.append("0.0")
+            writer.writerow(row)
+
+
+def write_package_csv(csv_file_path, addresses, package_count, seed=0, note_rate=0.05):
+    """
+    Writes a package manifest in the same format as wgupsPackageFile.csv, every package
+    going to one of the non hub addresses.
+
+    :param note_rate: Share of packages that get one of SYNTHETIC_NOTES.
+    """
+    rng = random.Random(seed)
+    with open(csv_file_path, mode='w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["PackageID", "Address", "City", "State", "Zip", "DeliveryDeadline", "WeightKg", "Note"])
+        for package_id in range(1, package_count + 1):
+            street, city, state, zip_code = [part.strip() for part in rng.choice(addresses[1:]).split(",")]
+            row = [package_id, street, city, state, zip_code, rng.choice(SYNTHETIC_DEADLINES), rng.randint(1, 90)]
+            if rng.random() < note_rate:
+                row.append(rng.choice(SYNTHETIC_NOTES))
+            writer.writerow(row)
+
+
+def write_city(distance_file_path, package_file_path, stop_count, package_count, seed=0):
+    """
+    Generates a city and writes both its distance CSV and package manifest.
+    :return: The list of full address strings.
+    """
+    addresses, points = generate_city(stop_count, seed)
+    write_distance_csv(distance_file_path, addresses, points)
+    write_package_csv(package_file_path, addresses, package_count, seed)
+    return addresses
@@ -0,0 +1,63 @@
+import copy
+import unittest
+
+from hashTable import HashTable
+from incrementalSimulation import IncrementalSimulation
+from scenarioRunner import DEFAULT_SETTINGS, SIMULATION_DAY, _build_trucks, _clock_time, _load_shared, _shared
+from statusQuery import StatusIndex
+
+
+def wgups_day(integer_clock):
+    """
+    Runs the WGUPS day with its three trucks and two drivers as an IncrementalSimulation.
+    :return: The simulation and its package table.
+    """
+    _load_shared("wgupsDistanceFile.csv", "wgupsPackageFile.csv")
+    packages = [copy.copy(package) for package in _shared["packages"]]
+    package_table = HashTable()
+    package_table.bulk_insert((package.package_id, package) for package in packages)
+    trucks = _build_trucks(DEFAULT_SETTINGS, package_table, _shared["distance_matrix"], _shared["address_map"])
+    simulation = IncrementalSimulation(
+        _shared["distance_matrix"], package_table, _shared["address_map"], DEFAULT_SETTINGS["drivers"],
+        integer_clock=integer_clock,
+    )
+    for truck in trucks:
+        simulation.add_truck(truck)
+    wrong_address_ids = [package.package_id for package in packages if package.constraints.address_correction]
+    simulation.add_address_correction(_clock_time(DEFAULT_SETTINGS["address_correction_time"]), wrong_address_ids)
+    simulation.run()
+    return simulation, package_table
+
+
+class TwoBreakdownsTest(unittest.TestCase):
+    """
+    Two breakdowns with two drivers leave both drivers with broken trucks, so the rescue
+    trucks never leave and none of their packages may read as delivered.
+    """
+    def check(self, integer_clock):
+        simulation, package_table = wgups_day(integer_clock)
+        simulation.break_down(2, SIMULATION_DAY.replace(hour=8, minute=11))
+        simulation.break_down(1, SIMULATION_DAY.replace(hour=8, minute=15))
+
+        package = package_table.lookup(1)
+        self.assertEqual(package.status, "En Route")
+        self.assertIsNone(package.delivery_time)
+
+        delivered_on_legs = {
+            package_id for state in simulation.truck_states for leg in state.legs for package_id in leg.package_ids
+        }
+        for package_id, package in package_table.items():
+            delivered = package.delivery_time is not None
+            self.assertEqual(delivered, package_id in delivered_on_legs, f"package {package_id}")
+        counts = StatusIndex(package_table, simulation.trucks).counts_at(SIMULATION_DAY.replace(hour=17))
+        self.assertEqual(counts["Delivered"], len(delivered_on_legs))
+
+    def test_datetime_clock(self):
+        self.check(integer_clock=False)
+
+    def test_integer_clock(self):
+        self.check(integer_clock=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,438 @@
+"""
+Live tracking server over a finished simulation.
+
+Simulates the day once, builds time indexes over the result and answers HTTP/JSON queries
+from any number of dispatchers at once on a single asyncio event loop:
+
+    GET  /packages/<id>?at=10:25         status of one package at a time
+    GET  /packages?at=10:25&ids=1,2,3    status of many packages, every package without ids
+    POST /packages                       {"at": "10:25", "package_ids": [1, 2]} or
+                                         {"queries": [{"package_id": 1, "at": "09:05"}, ...]}
+    GET  /trucks/<id>?at=10:25           truck position and mileage at a time
+    GET  /trucks?at=10:25                every truck
+    GET  /counts?at=10:25                number of packages in each status
+
+Times are "HH:MM", "HH:MM:SS" or "HH:MM AM" on the simulated day. Package statuses come
+from statusQuery.StatusIndex and truck positions from a binary search over each truck's
+LegLog, interpolated along the leg being driven, so no query walks the packages.
+Answers to repeated GET requests are kept in an LRU cache as encoded responses.
+
+    python trackingServer.py --port 8080
+    python trackingServer.py --port 8080 --load-test 20000 --connections 50
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import sys
+import time
+from datetime import datetime
+from functools import lru_cache
+from urllib.parse import parse_qs, urlsplit
+
+from csvDistanceFileReader import load_distance_matrix
+from csvPackageFileReader import iter_package_batches
+from scenarioRunner import DEFAULT_SETTINGS, simulate
+from statusQuery import StatusIndex
+from truckClass import to_clock
+
+#Encoded GET responses kept, by request target
+RESPONSE_CACHE_SIZE = 4096
+#Largest request body accepted, in bytes
+MAX_BODY_BYTES = 1 << 20
+#Formats accepted for the "at" time
+TIME_FORMATS = ("%H:%M", "%H:%M:%S", "%I:%M %p", "%I:%M:%S %p")
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+            500: "Internal Server Error"}
+
+
+class QueryError(Exception):
+    """
+    A request that can not be answered, carries the HTTP status code to reply with.
+    """
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class TrackingIndex:
+    """
+    Time indexes over a finished integer clock simulation, answering the server's queries
+    as JSON ready dictionaries.
+    """
+    def __init__(self, simulation, addresses):
+        """
+        :param simulation: FleetSimulation after its run, on the integer clock.
+        :param addresses: List of addresses in distance matrix order, for truck locations.
+        """
+        self.day = simulation.day
+        self.addresses = addresses
+        self.status_index = StatusIndex(simulation.package_table, simulation.trucks)
+        self.hub_index = simulation.hub_index
+        self.leg_logs = {truck.truck_id: truck.leg_log for truck in simulation.trucks}
+
+    def parse_time(self, text):
+        """
+        Converts an "at" parameter into a datetime on the simulated day.
+        """
+        if not isinstance(text, str):
+            raise QueryError(400, f"Unreadable time {text!r}, expected HH:MM")
+        for time_format in TIME_FORMATS:
+            try:
+                parsed = datetime.strptime(text.strip().upper(), time_format)
+            except ValueError:
+                continue
+            return datetime.combine(self.day.date(), parsed.time())
+        raise QueryError(400, f"Unreadable time {text!r}, expected HH:MM")
+
+    def package(self, package_id, check_time):
+        """
+        Returns the status of one package at check_time.
+        """
+        status = self.status_index.status_of(package_id, check_time)
+        if status is None:
+            raise QueryError(404, f"No package {package_id}")
+        package = self.status_index.packages[self.status_index.position_of(package_id)]
+        return {
+            "package_id": package_id,
+            "address": package.address,
+            "deadline": package.delivery_deadline,
+            "truck_id": self.status_index.truck_ids.get(package_id),
+            "status": status,
+        }
+
+    def packages(self, package_ids, check_time):
+        """
+        Returns the status of the given packages at check_time, every package for None.
+        """
+        if package_ids is None:
+            index = self.status_index
+            return [
+                {"package_id": package_id, "truck_id": index.truck_ids.get(package_id), "status": status}
+                for package_id, status in zip(index.package_ids, index.statuses_at(check_time))
+            ]
+        return [self.package(package_id, check_time) for package_id in package_ids]
+
+    def truck(self, truck_id, check_time):
+        """
+        Returns the position and mileage of one truck at check_time.
+        """
+        leg_log = self.leg_logs.get(truck_id)
+        if leg_log is None:
+            raise QueryError(404, f"No truck {truck_id}")
+        position = leg_log.position_at(to_clock(check_time, self.day), self.hub_index)
+        position["mileage"] = round(position["mileage"], 2)
+        if "progress" in position:
+            position["progress"] = round(position["progress"], 4)
+        if "location_index" in position:
+            position["address"] = self.addresses[position["location_index"]]
+        return dict(truck_id=truck_id, **position)
+
+    def trucks(self, check_time):
+        """
+        Returns the position and mileage of every truck at check_time.
+        """
+        return [self.truck(truck_id, check_time) for truck_id in sorted(self.leg_logs)]
+
+    def counts(self, check_time):
+        """
+        Returns the number of packages in each status at check_time.
+        """
+        return self.status_index.counts_at(check_time)
+
+
+def _id_list(text):
+    """
+    Parses a comma separated list of ids.
+    """
+    try:
+        return [int(value) for value in text.split(",") if value.strip()]
+    except ValueError:
+        raise QueryError(400, f"Unreadable id list {text!r}") from None
+
+
+def _json_id(value):
+    """
+    Returns an id read from a JSON body, refusing anything but an integer, so true or 1.7
+    never stand for package 1.
+    """
+    if type(value) is not int:
+        raise QueryError(400, f"Package ids must be integers, got {json.dumps(value)}")
+    return value
+
+
+def _json_id_list(value):
+    """
+    Returns a list of ids read from a JSON body, refusing anything but a list, see _json_id.
+    """
+    if not isinstance(value, list):
+        raise QueryError(400, f"package_ids must be a list of integers, got {json.dumps(value)}")
+    return [_json_id(package_id) for package_id in value]
+
+
+def _single_id(text):
+    """
+    Parses the id at the end of a resource path.
+    """
+    try:
+        return int(text)
+    except ValueError:
+        raise QueryError(400, f"Unreadable id {text!r}") from None
+
+
+class TrackingServer:
+    """
+    asyncio HTTP/1.1 server over a TrackingIndex. Connections are kept alive, so a client
+    sends many requests over one connection, and each request is answered synchronously
+    from the index: there is nothing to wait on but the sockets.
+    """
+    def __init__(self, index, cache_size=RESPONSE_CACHE_SIZE):
+        self.index = index
+        self.requests = 0
+        self._cached_get = lru_cache(maxsize=cache_size)(self._get)
+
+    def _at(self, query):
+        """
+        Returns the "at" time of a query string dictionary.
+        """
+        values = query.get("at")
+        if not values:
+            raise QueryError(400, "Missing at=HH:MM")
+        return self.index.parse_time(values[0])
+
+    def _get(self, target):
+        """
+        Answers a GET request target.
+        :return: HTTP status code and the encoded JSON body.
+        """
+        try:
+            parts = urlsplit(target)
+            query = parse_qs(parts.query)
+            path = parts.path.strip("/").split("/")
+            if path[0] == "packages" and len(path) == 2:
+                result = self.index.package(_single_id(path[1]), self._at(query))
+            elif path == ["packages"]:
+                package_ids = _id_list(query["ids"][0]) if "ids" in query else None
+                result = self.index.packages(package_ids, self._at(query))
+            elif path[0] == "trucks" and len(path) == 2:
+                result = self.index.truck(_single_id(path[1]), self._at(query))
+            elif path == ["trucks"]:
+                result = self.index.trucks(self._at(query))
+            elif path == ["counts"]:
+                result = self.index.counts(self._at(query))
+            else:
+                raise QueryError(404, f"No such resource {parts.path!r}")
+        except QueryError as error:
+            return error.status, json.dumps({"error": str(error)}).encode()
+        return 200, json.dumps(result).encode()
+
+    def _post(self, target, body):
+        """
+        Answers a bulk POST /packages request.
+        :return: HTTP status code and the encoded JSON body.
+        """
+        try:
+            if urlsplit(target).path.rstrip("/") != "/packages":
+                raise QueryError(404, "Bulk queries are posted to /packages")
+            try:
+                request = json.loads(body)
+            except ValueError:
+                raise QueryError(400, "Body is not JSON") from None
+            if not isinstance(request, dict):
+                raise QueryError(400, "Body must be a JSON object")
+            if "queries" in request:
+                result = [
+                    self.index.package(_json_id(query["package_id"]), self.index.parse_time(query["at"]))
+                    for query in request["queries"]
+                ]
+            else:
+                package_ids = request.get("package_ids")
+                if package_ids is not None:
+                    package_ids = _json_id_list(package_ids)
+                result = self.index.packages(package_ids, self.index.parse_time(request.get("at", "")))
+        except QueryError as error:
+            return error.status, json.dumps({"error": str(error)}).encode()
+        except (KeyError, TypeError, ValueError) as error:
+            return 400, json.dumps({"error": f"Malformed query: {error}"}).encode()
+        return 200, json.dumps(result).encode()
+
+    def respond(self, method, target, body=b""):
+        """
+        Answers one request.
+        :return: HTTP status code and the encoded JSON body.
+        """
+        self.requests += 1
+        if method == "GET":
+            return self._cached_get(target)
+        if method == "POST":
+            return self._post(target, body)
+        return 405, json.dumps({"error": f"Method {method} not allowed"}).encode()
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serves the requests of one connection until the client closes it.
+        """
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                method, target, version = lines[0].split(" ", 2)
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_BYTES:
+                    status, payload = 413, json.dumps({"error": "Request body too large"}).encode()
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    #A bug answering one request is reported to its client, the connection lives on
+                    try:
+                        status, payload = self.respond(method, target, body)
+                    except Exception as error:
+                        status, payload = 500, json.dumps({"error": f"Internal error: {error!r}"}).encode()
+                    connection = headers.get("connection", "").lower()
+                    keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+                writer.write(
+                    f"HTTP/1.1 {status} {_REASONS[status]}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}"
+                    f"\r\n\r\n".encode("latin-1") + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8080, ready=None):
+        """
+        Serves until cancelled.
+        :param ready: Optional callable run once the socket is listening.
+        """
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        if ready is not None:
+            ready()
+        async with server:
+            await server.serve_forever()
+
+
+def load_tracking_index(distance_file, package_file, scenario=None):
+    """
+    Simulates the day and builds its TrackingIndex.
+    :param scenario: scenarioRunner settings, DEFAULT_SETTINGS by default.
+    """
+    distance_matrix, addresses, address_map = load_distance_matrix(distance_file, dtype="float64")
+    packages = [package for batch in iter_package_batches(package_file) for package in batch]
+    address_map.resolve_packages(packages)
+    for line in address_map.unmatched_report():
+        print(line, file=sys.stderr)
+    simulation = simulate(scenario or DEFAULT_SETTINGS, distance_matrix, address_map, packages)
+    return TrackingIndex(simulation, addresses)
+
+
+async def _client(host, port, targets, request_count):
+    """
+    Sends request_count GET requests over one keep alive connection, round robin over
+    targets, waiting for each response before the next.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    requests = [f"GET {target} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode() for target in targets]
+    for number in range(request_count):
+        writer.write(requests[number % len(requests)])
+        head = await reader.readuntil(b"\r\n\r\n")
+        length = int(head.split(b"Content-Length: ", 1)[1].split(b"\r\n", 1)[0])
+        await reader.readexactly(length)
+    writer.close()
+
+
+async def load_test(host, port, targets, request_count, connections):
+    """
+    Sends request_count requests spread over connections concurrent clients.
+    :return: Requests answered per second.
+    """
+    start = time.perf_counter()
+    per_client = max(1, request_count // connections)
+    await asyncio.gather(*(_client(host, port, targets[client:] + targets[:client], per_client)
+                           for client in range(connections)))
+    return per_client * connections / (time.perf_counter() - start)
+
+
+def _load_test_targets(index, count=200):
+    """
+    Returns a mix of package, truck, bulk and count requests at times across the day.
+    """
+    package_ids = index.status_index.package_ids
+    truck_ids = sorted(index.leg_logs)
+    targets = []
+    for number in range(count):
+        clock = f"{8 + number % 5:02d}:{number * 7 % 60:02d}:{number * 13 % 60:02d}"
+        kind = number % 10
+        if kind < 6:
+            targets.append(f"/packages/{package_ids[number % len(package_ids)]}?at={clock}")
+        elif kind < 9:
+            targets.append(f"/trucks/{truck_ids[number % len(truck_ids)]}?at={clock}")
+        else:
+            targets.append(f"/counts?at={clock}")
+    return targets
+
+
+def _serve_process(distance_file, package_file, host, port, ready):
+    """
+    Runs a server in a child process for --load-test.
+    """
+    index = load_tracking_index(distance_file, package_file)
+    asyncio.run(TrackingServer(index).serve(host, port, ready.set))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve live tracking queries over a simulated day.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--distance-file", default="wgupsDistanceFile.csv")
+    parser.add_argument("--package-file", default="wgupsPackageFile.csv")
+    parser.add_argument("--load-test", type=int, metavar="REQUESTS",
+                        help="Start the server in a child process and time this many requests against it.")
+    parser.add_argument("--connections", type=int, default=50, help="Concurrent clients of the load test.")
+    args = parser.parse_args(argv)
+
+    index = load_tracking_index(args.distance_file, args.package_file)
+    if not args.load_test:
+        print(f"Serving {len(index.status_index.package_ids)} packages and {len(index.leg_logs)} trucks "
+              f"on http://{args.host}:{args.port}")
+        try:
+            asyncio.run(TrackingServer(index).serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    #The server gets its own process, and so its own core, like it would in production
+    start_method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+    context = multiprocessing.get_context(start_method)
+    ready = context.Event()
+    server = context.Process(
+        target=_serve_process, args=(args.distance_file, args.package_file, args.host, args.port, ready), daemon=True
+    )
+    server.start()
+    try:
+        if not ready.wait(30):
+            print("Server did not start", file=sys.stderr)
+            return 1
+        targets = _load_test_targets(index)
+        rate = asyncio.run(load_test(args.host, args.port, targets, args.load_test, args.connections))
+        print(f"{rate:,.0f} requests per second over {args.connections} connections")
+    finally:
+        server.terminate()
+        server.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,23 +1,210 @@
-from datetime import timedelta
+import math
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+#Most packages a truck can carry, project constraint
+TRUCK_CAPACITY = 16
+#Average truck speed in miles per hour, project constraint
+TRUCK_SPEED = 18
+#The integer clock counts microseconds, the resolution of datetime, so it matches it exactly
+CLOCK_TICKS_PER_SECOND = 1000000
+CLOCK_TICKS_PER_HOUR = 3600 * CLOCK_TICKS_PER_SECOND
+
+
+def shift_day(time):
+    """
+    Returns midnight of the day of time, the zero point of the integer clock.
+    """
+    return datetime.combine(time.date(), datetime.min.time())
+
+
+def to_clock(time, day):
+    """
+    Converts a datetime into integer clock ticks since midnight of day.
+    """
+    delta = time - day
+    return (delta.days * 86400 + delta.seconds) * CLOCK_TICKS_PER_SECOND + delta.microseconds
+
+
+def from_clock(clock, day):
+    """
+    Converts integer clock ticks since midnight of day back into a datetime.
+    """
+    return day + timedelta(microseconds=clock)
+
+
+def travel_clock(distance, speed):
+    """
+    Returns the ticks needed to drive distance miles at speed mph.
+
+    Rounds the same way as timedelta(hours=distance / speed): the whole hours are exact and
+    the fraction is rounded half to even to a microsecond, so a truck on the integer clock
+    arrives at exactly the same microsecond as one on datetimes.
+    """
+    fraction, whole = math.modf(distance / speed)
+    return int(whole) * CLOCK_TICKS_PER_HOUR + round(fraction * CLOCK_TICKS_PER_HOUR)
+
+
+class LegLog:
+    """
+    Every leg a truck drove, as parallel typed arrays: from index, to index, depart and
+    arrive time as integer clock ticks since midnight of day, and the cumulative mileage at
+    the end of the leg. A leg is a few array appends when it is driven, and "where was the
+    truck and how many miles had it driven at T" is a binary search over the depart times.
+    """
+    def __init__(self, day=None):
+        """
+        :param day: Midnight the times count from, set from the first leg when None.
+        """
+        self.day = day
+        self.from_indexes = array('i')
+        self.to_indexes = array('i')
+        self.departs = array('q')
+        self.arrives = array('q')
+        self.mileages = array('d')
+
+    #Names of the parallel arrays
+    FIELDS = ("from_indexes", "to_indexes", "departs", "arrives", "mileages")
+
+    def __len__(self):
+        return len(self.departs)
+
+    def record(self, from_index, to_index, depart, arrive, mileage):
+        """
+        Appends a leg, depart and arrive are clock ticks and mileage is the truck's total
+        mileage at arrival.
+        """
+        self.from_indexes.append(from_index)
+        self.to_indexes.append(to_index)
+        self.departs.append(depart)
+        self.arrives.append(arrive)
+        self.mileages.append(mileage)
+
+    def truncate(self, count):
+        """
+        Keeps only the first count legs, for a truck whose route is driven again.
+        """
+        for field in self.FIELDS:
+            del getattr(self, field)[count:]
+
+    def shift(self, delta):
+        """
+        Moves every leg delta ticks later, for a route that leaves at another time.
+        """
+        self.departs = array('q', (depart + delta for depart in self.departs))
+        self.arrives = array('q', (arrive + delta for arrive in self.arrives))
+
+    def legs(self):
+        """
+        Yields (from_index, to_index, depart, arrive, mileage) for every leg, in driving order.
+        """
+        return zip(self.from_indexes, self.to_indexes, self.departs, self.arrives, self.mileages)
+
+    def leg_at(self, clock):
+        """
+        Returns the number of the last leg started at or before clock, -1 before the first.
+        """
+        return bisect_right(self.departs, clock) - 1
+
+    def mileage_at(self, clock):
+        """
+        Returns the miles driven by clock, interpolated along the leg being driven.
+        """
+        leg = self.leg_at(clock)
+        if leg < 0:
+            return 0.0
+        if clock >= self.arrives[leg]:
+            return self.mileages[leg]
+        start_mileage = self.mileages[leg - 1] if leg > 0 else 0.0
+        progress = (clock - self.departs[leg]) / (self.arrives[leg] - self.departs[leg])
+        return start_mileage + progress * (self.mileages[leg] - start_mileage)
+
+    def position_at(self, clock, start_location=0):
+        """
+        Returns where the truck was at clock as a dictionary with its state:
+        - "at hub" before its first leg and "finished" after its last, with location_index.
+        - "stopped" between legs, at location_index.
+        - "driving" on the leg from from_index to to_index, progress is the share driven.
+        Every state has the mileage at clock.
+        :param start_location: Location of a truck that has not driven yet, the hub.
+        """
+        leg = self.leg_at(clock)
+        if leg < 0:
+            location = self.from_indexes[0] if self.from_indexes else start_location
+            return {"state": "at hub", "location_index": location, "mileage": 0.0}
+        if clock >= self.arrives[leg]:
+            return {
+                "state": "finished" if leg == len(self.departs) - 1 else "stopped",
+                "location_index": self.to_indexes[leg],
+                "mileage": self.mileages[leg],
+            }
+        return {
+            "state": "driving",
+            "from_index": self.from_indexes[leg],
+            "to_index": self.to_indexes[leg],
+            "progress": (clock - self.departs[leg]) / (self.arrives[leg] - self.departs[leg]),
+            "mileage": self.mileage_at(clock),
+        }
+
+
 class Truck:
     """
     Represents a delivery truck in the system(Truck object).
     Each truck will track its ID, a list of package id's it needs to deliver, the mileage travelled,
-    its current location, the current simulated time.
+    its current location, the current simulated time and a LegLog of every leg it drove.
+
+    With integer_clock the time is kept in self.clock as integer ticks since midnight of
+    self.day instead of as a datetime, so driving a leg is one integer addition.
+    current_time still reads and sets the time as a datetime, converting at the edge.
     """
-    def __init__(self, truck_id, package_ids, start_time):
+    def __init__(self, truck_id, package_ids, start_time, integer_clock=False, speed=TRUCK_SPEED):
         """
         Initializes a new Truck object with an ID, packages, and start time
         :param truck_id: identifies the truck
         :param package_ids: list of package ids associated with the truck
         :param start_time: Timestamp when the truck leaves the hub
+        :param integer_clock: Keep the time as integer clock ticks instead of a datetime.
+        :param speed: Average speed in miles per hour.
         """
         self.truck_id = truck_id
         self.package_ids = package_ids
-        self.speed = 18
+        self.speed = speed
+        self.capacity = TRUCK_CAPACITY
         self.mileage = 0.0
+        self.day = None
+        self.clock = None
         self.current_time = start_time
         self.current_location = 0 #represents hub
+        self.leg_log = LegLog()
+        if integer_clock:
+            self.use_integer_clock()
+
+    @property
+    def current_time(self):
+        """
+        The truck's current simulated time as a datetime.
+        """
+        if self.clock is None:
+            return self._current_time
+        return from_clock(self.clock, self.day)
+
+    @current_time.setter
+    def current_time(self, time):
+        if self.clock is None:
+            self._current_time = time
+        else:
+            self.clock = to_clock(time, self.day)
+
+    def use_integer_clock(self, day=None):
+        """
+        Switches the truck to the integer clock.
+        :param day: Midnight the clock counts from, the day of the current time by default.
+        """
+        if self.clock is None:
+            self.day = day if day is not None else shift_day(self._current_time)
+            self.clock = to_clock(self._current_time, self.day)
+            self.leg_log.day = self.day
 
     def drive_simulation(self, next_location, distance):
         """
@@ -29,18 +216,40 @@ class Truck:
         We then add that travel time to the trucks current time, next we add the distance to the trucks total mileage.
         The current location gets updated to the new location and we return the updated current time.
 
-        Returns: the updated current time after going through the truck simulation.
+        Returns: the updated current time after going through the truck simulation,
+        as clock ticks when the truck is on the integer clock.
         """
+        if self.clock is not None:
+            depart = self.clock
+            self.clock += travel_clock(distance, self.speed)
+            self.mileage += distance
+            self.leg_log.record(self.current_location, next_location, depart, self.clock, self.mileage)
+            self.current_location = next_location
+            return self.clock
+
+        leg_log = self.leg_log
+        if leg_log.day is None:
+            leg_log.day = shift_day(self._current_time)
+        depart = to_clock(self._current_time, leg_log.day)
+
         #calculates the travel time as a timedelta based on distance and speed
         travel_time = timedelta(hours=distance / self.speed)
         #advances the truck's internal clock by the travel time
-        self.current_time += travel_time
+        self._current_time += travel_time
         #accumulates the distance travelled
         self.mileage += distance
-        #moves the truck to the new location
+        #logs the leg, then moves the truck to the new location
+        leg_log.record(self.current_location, next_location, depart, to_clock(self._current_time, leg_log.day),
+                       self.mileage)
         self.current_location = next_location
         #returns the updated time, needed for callers to see when the truck arrives
-        return self.current_time
+        return self._current_time
+
+    def position_at(self, time):
+        """
+        Returns where the truck was at time and its mileage, see LegLog.position_at.
+        """
+        return self.leg_log.position_at(to_clock(time, self.leg_log.day or shift_day(time)))
 
     #for debugging, checks truck status....current status: working.
     #def __str__(self):